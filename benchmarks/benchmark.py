@@ -0,0 +1,911 @@
+"""
+benchmark.py
+
+Benchmark and regression suite of the pipeline.
+
+Every case runs the full pipeline (with profiling, see scripts/Profiler.py) in a fresh
+process, so timings include no warm caches and peak memory belongs to that case only.
+Cases are the structures in examples/pdb_examples plus synthetic assemblies built by
+tiling one example on a cubic lattice (written as mmCIF, since they exceed the PDB
+format limits), to check how every stage scales with the atom count.
+
+For every case the suite records the wall time of each stage and sub-stage, atoms/s,
+peak RSS and the top-ranked pockets. Against a stored baseline (benchmarks/baseline_<engine>.json)
+it flags:
+- performance regressions: a stage or the total slower than the baseline by more than
+  the time tolerance (relative, plus a small absolute slack for sub-second stages), or
+  peak RSS above the memory tolerance;
+- startup regressions: main.py --help, a cold run on a 1k-atom structure and a fully cached
+  rerun, each timed as a new process, above their budget (STARTUP_CHECKS) or the baseline;
+- ranking drift: a different number of pockets, or a top-ranked pocket whose center moved
+  more than DRIFT_DISTANCE from the baseline pocket of the same rank, or whose score changed.
+
+Independently of the baseline, every run is checked for sanity: every case must find at
+least one pocket and no example structure more than MAX_POCKETS (more means its sites are
+split into fragments), the known binding sites (KNOWN_SITES) must be lined by one of the
+KNOWN_SITE_TOP best-ranked pockets, and so must a pocket centered within LIGAND_DISTANCE of
+the bound ligands (KNOWN_LIGANDS), and every scoring term must put the pockets of the example
+structures in at least two of its bins (a constant term cannot rank). A run that fails these
+checks is never saved as a baseline, so a broken pipeline cannot become the reference.
+
+With --threads N the synthetic cases run a second time with N threads per structure
+(Pipeline threads, see scripts/Parallel.py); the report gives the speedup of every case over
+the serial run and checks that both runs found exactly the same pockets.
+
+With --triage [MARGINS] the example structures run in full mode and with the residue-level
+triage pass (scripts/Triage.py) at each margin; the report gives the speedup of every margin
+and its recall, the fraction of full-mode pockets (all, and the top-ranked ones) with a triaged
+pocket centered within TRIAGE_MATCH_DISTANCE. It describes the trade-off and flags nothing.
+
+With --tiling [SIZE] the example structures run again with tiled detection (scripts/Tiling.py)
+in tiles of SIZE Å, small enough to cut each of them into several tiles; every ranked pocket
+must match the untiled one: the same rank, point count, volume and lining residues, and every
+other property within TILING_TOLERANCE (tiles only change the floating-point summation order).
+
+With --accessibility [THRESHOLD] the example structures run again without an accessibility
+threshold and with both accessibility methods at THRESHOLD. The run without a threshold must
+skip the accessibility stage, and at the threshold each method must keep a different surface
+than the other and than the run without one; a failure is a sanity problem.
+
+With --trajectory N a synthetic N-frame ensemble of a 5k-atom structure runs through
+scripts/Trajectory.py, once reusing surfaces between similar frames and once recomputing
+every frame; frames/s below the baseline by more than the time tolerance is a regression.
+
+Timings depend on the machine; regenerate the baseline with --save-baseline after a
+deliberate change or on new hardware. The reference outputs in examples/example_results
+come from the original script-per-stage pipeline and are not compared.
+
+Usage:
+    python benchmarks/benchmark.py [--quick] [--synthetic 8,27] [--repeat N] [--engine {dbscan,grid}]
+                                   [--baseline FILE] [--save-baseline] [--output FILE] [--no-startup]
+                                   [--threads N] [--tiling [SIZE]] [--accessibility [THRESHOLD]]
+                                   [--trajectory FRAMES] [--triage [MARGINS]]
+
+Exits with status 1 when a sanity check fails or a regression or ranking drift is found.
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_DIR = os.path.join(ROOT_DIR, 'scripts')
+EXAMPLES_DIR = os.path.join(ROOT_DIR, 'examples', 'pdb_examples')
+# Baseline report of each pocket engine
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_{engine}.json')
+
+sys.path.insert(0, SCRIPT_DIR)
+
+# Structure tiled into the synthetic assemblies, and the gap (Å) between copies
+SYNTHETIC_SOURCE = '1hsg.pdb'
+SYNTHETIC_GAP = 10.0
+
+# Structures of the --quick subset
+QUICK_CASES = ('1hsg', '3ptb', '1bna')
+
+# Default tolerances: relative slowdown, absolute slack in seconds, relative peak RSS growth
+TIME_TOLERANCE = 0.5
+TIME_SLACK = 0.05
+MEMORY_TOLERANCE = 0.25
+
+# Command-line startup checks, run as fresh processes: name -> (main.py arguments, budget in seconds).
+# '{cache}' and '{output}' are replaced with temporary folders; the cached run reuses every stage.
+STARTUP_STRUCTURE = '1lz1.pdb'
+STARTUP_CHECKS = {
+    'help': (['--help'], 0.3),
+    'run_1k': ([STARTUP_STRUCTURE, '{output}', '--no-cache'], 2.0),
+    'run_1k_cached': ([STARTUP_STRUCTURE, '{output}', '--cache-dir', '{cache}'], 0.5),
+}
+
+# Trajectory check (--trajectory N): an ensemble of N frames of this structure, each atom
+# displaced at random by TRAJECTORY_AMPLITUDE Å (per axis) with a slow rigid drift on top
+TRAJECTORY_SOURCE = '1a3n.pdb'
+TRAJECTORY_AMPLITUDE = 0.15
+
+# Tiling check (--tiling): tile edge (Å) that cuts every example into several tiles, and the
+# largest relative difference of a numeric pocket property between tiled and untiled runs
+TILING_SIZE = 20.0
+TILING_TOLERANCE = 1e-6
+
+# Accessibility check (--accessibility): threshold of the methods compared; between the lower
+# quartile and the median of the neighbor accessibility on the examples
+ACCESSIBILITY_THRESHOLD = 0.05
+
+# Triage check (--triage): the largest distance (Å) between a full-mode pocket center and a
+# triaged pocket center that still counts as found, and the triage margins (Å) compared
+TRIAGE_MATCH_DISTANCE = 4.0
+TRIAGE_MARGINS = '8,10,12'
+
+# Known binding sites of the examples: case -> residues that must all line one of the
+# KNOWN_SITE_TOP best-ranked pockets (1hsg: the HIV protease catalytic Asp25 of both chains
+# under the MK1 inhibitor; 3ptb: Asp189 at the bottom of the trypsin S1 pocket)
+KNOWN_SITES = {'1hsg': ('A:25', 'B:25'), '3ptb': ('A:189',)}
+KNOWN_SITE_TOP = 3
+
+# Centroids of the ligands bound to the known sites (1hsg: MK1; 3ptb: benzamidine in S1), and the
+# largest distance (Å) from one to a pocket center that still finds the site
+KNOWN_LIGANDS = {'1hsg': (13.07, 22.47, 5.56), '3ptb': (-1.76, 14.46, 16.92)}
+LIGAND_DISTANCE = 6.0
+
+# Most pockets an example structure may yield; well below the counts of fragmented runs
+# (up to 66 pockets on 1a3n) and above the largest example with either engine (about 25)
+MAX_POCKETS = 35
+
+# Number of top-ranked pockets compared, and the largest center shift (Å) that is not drift
+DRIFT_TOP = 3
+DRIFT_DISTANCE = 2.0
+
+
+def write_assembly_cif(source_file, copies, output_file, gap=SYNTHETIC_GAP):
+    """
+    Writes a synthetic assembly: copies of a structure on a cubic lattice, as mmCIF.
+
+    Args:
+    source_file (str): Structure to tile.
+    copies (int): Number of copies; rounded up to a full n x n x n lattice.
+    output_file (str): Path of the mmCIF file.
+    gap (float): Distance in Å between the bounding boxes of neighboring copies.
+
+    Returns:
+    n_atoms (int): Number of atoms written.
+    """
+    import numpy as np
+    import PDBparser
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        atoms, _ = PDBparser.parse_pdb(source_file, altloc='first', model='first')
+    text = {field: PDBparser.decode_column(atoms[field]) for field in ('name', 'resname', 'chain', 'element')}
+    coords = atoms['coord']
+    step = coords.max(axis=0) - coords.min(axis=0) + gap
+    side = int(np.ceil(round(copies ** (1 / 3), 6)))
+
+    lines = ["data_synthetic", "loop_"]
+    lines += [f"_atom_site.{item}" for item in (
+        'group_PDB', 'id', 'type_symbol', 'auth_atom_id', 'label_alt_id', 'auth_comp_id', 'auth_asym_id',
+        'auth_seq_id', 'pdbx_PDB_ins_code', 'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy', 'B_iso_or_equiv',
+        'pdbx_PDB_model_num')]
+    serial = 0
+    for copy, offset in enumerate(np.ndindex(side, side, side)):
+        shifted = coords + np.array(offset) * step
+        for i, (atom, (x, y, z)) in enumerate(zip(atoms, shifted)):
+            serial += 1
+            name = text['name'][i] if "'" not in text['name'][i] else f'"{text["name"][i]}"'
+            lines.append(f"{'HETATM' if atom['hetatm'] else 'ATOM'} {serial} {text['element'][i] or '?'} {name} . "
+                         f"{text['resname'][i]} {text['chain'][i] or 'A'}{copy} {atom['resseq']} ? "
+                         f"{x:.3f} {y:.3f} {z:.3f} {atom['occupancy']:.2f} {atom['bfactor']:.2f} 1")
+    lines.append("#")
+    with open(output_file, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return serial
+
+
+def write_ensemble_pdb(source_file, n_frames, output_file, amplitude=TRAJECTORY_AMPLITUDE, seed=0):
+    """
+    Writes a synthetic multi-model PDB ensemble: randomly displaced, slowly drifting copies of a structure.
+
+    Args:
+    source_file (str): Structure to copy.
+    n_frames (int): Number of MODEL blocks.
+    output_file (str): Path of the PDB file.
+    amplitude (float): Standard deviation in Å of the per-axis displacement of every atom.
+    seed (int): Random seed.
+
+    Returns:
+    n_atoms (int): Atoms per frame.
+    """
+    import numpy as np
+    import PDBparser
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        atoms, _ = PDBparser.parse_pdb(source_file, altloc='first', model='first')
+    text = {field: PDBparser.decode_column(atoms[field])
+            for field in ('name', 'altloc', 'resname', 'chain', 'icode', 'element')}
+    random = np.random.default_rng(seed)
+    center = atoms['coord'].mean(axis=0)
+
+    lines = []
+    for frame in range(n_frames):
+        angle = 0.02 * frame
+        rotation = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+        coords = (atoms['coord'] + random.normal(scale=amplitude, size=atoms['coord'].shape) - center) @ rotation.T
+        coords += center + 0.1 * frame
+        lines.append(f"MODEL     {frame + 1:>4}")
+        for i, (atom, (x, y, z)) in enumerate(zip(atoms, coords)):
+            serial = i + 1
+            name = text['name'][i] if len(text['name'][i]) == 4 else f" {text['name'][i]:<3}"
+            lines.append(f"{'HETATM' if atom['hetatm'] else 'ATOM  '}{serial % 100000:>5} {name}"
+                         f"{text['altloc'][i] or ' '}{text['resname'][i]:>3} {text['chain'][i][:1] or 'A'}"
+                         f"{atom['resseq']:>4}{text['icode'][i] or ' '}   "
+                         f"{x:8.3f}{y:8.3f}{z:8.3f}{atom['occupancy']:6.2f}{atom['bfactor']:6.2f}          "
+                         f"{text['element'][i]:>2}")
+        lines.append("ENDMDL")
+    lines.append("END")
+    with open(output_file, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return len(atoms)
+
+
+def collect_cases(quick=False, synthetic=(), work_dir=None):
+    """
+    Lists the benchmark cases.
+
+    Args:
+    quick (bool): Only the QUICK_CASES structures.
+    synthetic (tuple): Copy counts of the synthetic assemblies to build in work_dir.
+    work_dir (str): Folder for the synthetic structure files.
+
+    Returns:
+    cases (list): (name, structure file) tuples.
+    """
+    cases = []
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.pdb'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not quick or name in QUICK_CASES:
+            cases.append((name, path))
+
+    for copies in synthetic:
+        path = os.path.join(work_dir, f"synthetic_{copies}.cif")
+        write_assembly_cif(os.path.join(EXAMPLES_DIR, SYNTHETIC_SOURCE), copies, path)
+        cases.append((f"synthetic_{copies}", path))
+    return cases
+
+
+def measure_startup(work_dir, repeat=3):
+    """
+    Times main.py as a user runs it: a new interpreter per call, imports included.
+
+    Args:
+    work_dir (str): Folder for the outputs and the cache of the runs.
+    repeat (int): Calls per check; the fastest is kept.
+
+    Returns:
+    startup (dict): Check name -> {'seconds', 'budget_s'}.
+    """
+    main_script = os.path.join(ROOT_DIR, 'main.py')
+    folders = {'output': os.path.join(work_dir, 'startup'), 'cache': os.path.join(work_dir, 'startup_cache')}
+    # Fill the cache once, so every timed cached run hits it
+    subprocess.run([sys.executable, main_script, os.path.join(EXAMPLES_DIR, STARTUP_STRUCTURE), folders['output'],
+                    '--cache-dir', folders['cache']], check=True, stdout=subprocess.DEVNULL)
+
+    startup = {}
+    for name, (arguments, budget) in STARTUP_CHECKS.items():
+        command = [sys.executable, main_script]
+        command += [os.path.join(EXAMPLES_DIR, value) if value == STARTUP_STRUCTURE else value.format(**folders)
+                    for value in arguments]
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        startup[name] = {'seconds': round(min(times), 4), 'budget_s': budget}
+        print(f"startup {name:<16} {min(times):>9.3f} s (budget {budget:.1f} s)")
+    return startup
+
+
+def run_case(name, structure_file, options, repeat=1):
+    """
+    Runs the pipeline on one structure (in the calling process) and measures it. Stage times
+    exclude module imports, which import_s reports.
+
+    Args:
+    name (str): Case name.
+    structure_file (str): Structure file.
+    options (dict): Keyword arguments for Pipeline.
+    repeat (int): Number of runs; the fastest time of every stage is kept.
+
+    Returns:
+    result (dict): Case measurements: atoms, stage times, total time, atoms/s, peak RSS, top pockets,
+        a digest of every ranked pocket, the score bins its pockets fall in per scoring term and,
+        for KNOWN_SITES and KNOWN_LIGANDS, the rank of the site's pocket.
+    """
+    # The SciPy modules the stages import lazily are loaded here, so their import time is not
+    # charged to whichever stage runs first (with repeat=1 it would be, and only then)
+    start = time.perf_counter()
+    from Pipeline import Pipeline
+    import scipy.ndimage
+    import scipy.sparse.csgraph
+    import scipy.spatial
+    import_seconds = time.perf_counter() - start
+    import Artifacts
+    import Scoring
+
+    pipeline = Pipeline(profile=True, cache=None, plot=False, save_intermediates=False, **options)
+    stages, totals = {}, []
+    for _ in range(repeat):
+        result = pipeline.run(structure_file)
+        profile = result['profile']
+        totals.append(sum(stage['wall_s'] for stage in profile['stages'] if stage['parent'] is None))
+        for stage in profile['stages']:
+            key = stage['stage'] if stage['parent'] is None else f"{stage['parent']}.{stage['stage']}"
+            stages[key] = min(stages.get(key, float('inf')), stage['wall_s'])
+
+    total = min(totals)
+    bins = (Scoring.term_bins(Artifacts.records_to_columns(result['scored']),
+                              Scoring.load_config(options.get('scoring_config')))
+            if result['scored'] else {})
+    return {
+        'name': name,
+        'atoms': len(result['atoms']),
+        'import_s': round(import_seconds, 4),
+        'total_s': round(total, 4),
+        'atoms_per_s': round(len(result['atoms']) / total, 1) if total > 0 else None,
+        'peak_rss_mb': profile['peak_rss_mb'],
+        'stages': {key: round(value, 4) for key, value in stages.items()},
+        'counters': profile['counters'],
+        'n_pockets': len(result['scored']),
+        'pockets_digest': hashlib.sha256(json.dumps(result['scored'], sort_keys=True,
+                                                    default=str).encode()).hexdigest(),
+        'top_pockets': [{'center': [round(value, 3) for value in pocket['center']], 'score': pocket['score']}
+                        for pocket in result['scored'][:DRIFT_TOP]],
+        'site_rank': site_rank(result['scored'], KNOWN_SITES[name]) if name in KNOWN_SITES else None,
+        'ligand_rank': ligand_rank(result['scored'], KNOWN_LIGANDS[name]) if name in KNOWN_LIGANDS else None,
+        'term_bins': {term: sorted(set(values.tolist())) for term, values in bins.items()},
+    }
+
+
+def site_rank(scored, residues):
+    """Returns the rank (1-based) of the best pocket lined by all the given residues, or None."""
+    for rank, pocket in enumerate(scored, 1):
+        lining = set(pocket.get('lining_residues', '').split(','))
+        if lining.issuperset(residues):
+            return rank
+    return None
+
+
+def ligand_rank(scored, centroid, distance=LIGAND_DISTANCE):
+    """Returns the rank (1-based) of the best pocket centered within distance of a ligand centroid, or None."""
+    for rank, pocket in enumerate(scored, 1):
+        if math.dist(pocket['center'], centroid) <= distance:
+            return rank
+    return None
+
+
+def _run_case_quietly(args):
+    """Pool entry point: runs one case with the pipeline output discarded."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return run_case(*args)
+
+
+def run_suite(cases, options, repeat=1):
+    """
+    Runs every case in its own fresh process.
+
+    Args:
+    cases (list): (name, structure file) tuples.
+    options (dict): Keyword arguments for Pipeline.
+    repeat (int): Runs per case.
+
+    Returns:
+    report (dict): Environment, options, per-case results and throughput totals.
+    """
+    results = []
+    start = time.perf_counter()
+    # A spawned process per case: cold imports, and peak RSS that belongs to the case alone
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name, path in cases:
+            result = pool.apply(_run_case_quietly, ((name, path, options, repeat),))
+            results.append(result)
+            print(f"{name:<16} {result['atoms']:>8} atoms {result['total_s']:>9.3f} s "
+                  f"{result['atoms_per_s'] or 0:>11.0f} atoms/s {result['peak_rss_mb'] or 0:>8.1f} MB "
+                  f"{result['n_pockets']:>4} pockets")
+    elapsed = time.perf_counter() - start
+
+    total_atoms = sum(result['atoms'] for result in results)
+    total_seconds = sum(result['total_s'] for result in results)
+    return {
+        'environment': {'python': platform.python_version(), 'machine': platform.machine(),
+                        'processor': platform.processor(), 'cpus': os.cpu_count()},
+        'options': options,
+        'repeat': repeat,
+        'cases': {result['name']: result for result in results},
+        'throughput': {
+            'atoms_per_s': round(total_atoms / total_seconds, 1) if total_seconds else None,
+            'structures_per_min': round(60 * len(results) / total_seconds, 2) if total_seconds else None,
+            'suite_wall_s': round(elapsed, 3),
+        },
+    }
+
+
+def measure_threads(report, cases, options, threads, repeat=1):
+    """
+    Reruns the synthetic cases with several threads per structure and compares them to the serial run.
+
+    Args:
+    report (dict): Serial report from run_suite.
+    cases (list): (name, structure file) tuples; only the synthetic ones are rerun.
+    options (dict): Keyword arguments for Pipeline.
+    threads (int): Pipeline threads of the parallel run (0 = one per CPU).
+    repeat (int): Runs per case.
+
+    Returns:
+    scaling (dict): Threads, CPUs and, per case, serial and parallel time, speedup and whether
+        the ranked pockets are identical.
+    """
+    synthetic = [(name, path) for name, path in cases if name.startswith('synthetic_')]
+    parallel = run_suite(synthetic, dict(options, threads=threads), repeat)['cases']
+    scaling = {'threads': threads, 'cpus': os.cpu_count(), 'cases': {}}
+    for name, result in parallel.items():
+        serial = report['cases'][name]
+        speedup = serial['total_s'] / result['total_s'] if result['total_s'] else None
+        identical = serial['pockets_digest'] == result['pockets_digest']
+        scaling['cases'][name] = {'serial_s': serial['total_s'], 'parallel_s': result['total_s'],
+                                  'speedup': round(speedup, 2) if speedup else None, 'identical': identical}
+        print(f"threads {name:<16} {serial['total_s']:>9.3f} s -> {result['total_s']:>9.3f} s "
+              f"speedup {speedup or 0:>5.2f}x {'identical' if identical else 'DIFFERENT RESULTS'}")
+    return scaling
+
+
+def _run_pockets_quietly(args):
+    """Pool entry point: runs one structure and returns its ranked pockets."""
+    structure_file, options = args
+    from Pipeline import Pipeline
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return Pipeline(cache=None, plot=False, save_intermediates=False, **options).run(structure_file)['scored']
+
+
+def _run_surface_quietly(args):
+    """Pool entry point: runs one structure and returns a digest of its surface points and its profiled stages."""
+    structure_file, options = args
+    from Pipeline import Pipeline
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = Pipeline(cache=None, plot=False, save_intermediates=False, profile=True,
+                          **options).run(structure_file)
+    points = result['surface_points']
+    digest = hashlib.sha256(b'' if points is None else points.tobytes()).hexdigest()
+    return digest, [stage['stage'] for stage in result['profile']['stages']]
+
+
+def pocket_differences(reference, pockets, tolerance=TILING_TOLERANCE):
+    """
+    Lists the properties in which two rankings of pockets differ.
+
+    Args:
+    reference (list): Ranked pocket dicts.
+    pockets (list): Ranked pocket dicts compared with reference, rank by rank.
+    tolerance (float): Largest relative difference of a float property (and of every center coordinate).
+
+    Returns:
+    differences (list): (rank, property) of every mismatch; a different pocket count is rank None.
+    """
+    import numpy as np
+
+    if len(reference) != len(pockets):
+        return [(None, 'count')]
+    differences = []
+    for rank, (expected, pocket) in enumerate(zip(reference, pockets), 1):
+        for key, value in expected.items():
+            values = [value, pocket.get(key)]
+            if isinstance(value, float) or key == 'center':
+                expected_values, found = (np.atleast_1d(np.asarray(item, dtype=float)) for item in values)
+                same = np.allclose(found, expected_values, rtol=tolerance, atol=0.0)
+            else:
+                same = values[0] == values[1]
+            if not same:
+                differences.append((rank, key))
+    return differences
+
+
+def measure_tiling(cases, options, tile_size=TILING_SIZE):
+    """
+    Reruns the example structures with tiled detection and compares their pockets to the untiled run.
+
+    Args:
+    cases (list): (name, structure file) tuples; only the example structures are run.
+    options (dict): Keyword arguments for Pipeline.
+    tile_size (float): Tile edge length in Å.
+
+    Returns:
+    tiling (dict): Tile size, tolerance and, per case, the pocket count and the mismatching
+        properties as 'rank:property' strings.
+    """
+    examples = [(name, path) for name, path in cases if not name.startswith('synthetic_')]
+    tiling = {'tile_size': tile_size, 'tolerance': TILING_TOLERANCE, 'cases': {}}
+    context = multiprocessing.get_context('spawn')
+    for name, path in examples:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            untiled = pool.apply(_run_pockets_quietly, ((path, options),))
+            tiled = pool.apply(_run_pockets_quietly, ((path, dict(options, tile_size=tile_size)),))
+        differences = [f"{rank}:{key}" for rank, key in pocket_differences(untiled, tiled)]
+        tiling['cases'][name] = {'pockets': len(untiled), 'differences': differences}
+        print(f"tiling {name:<16} {len(untiled):>4} pockets, {len(tiled):>4} tiled "
+              f"{'identical' if not differences else 'DIFFERENT: ' + ', '.join(differences[:5])}")
+    return tiling
+
+
+def measure_accessibility(cases, options, threshold=ACCESSIBILITY_THRESHOLD):
+    """
+    Reruns the example structures without an accessibility threshold and with both methods at one.
+
+    Args:
+    cases (list): (name, structure file) tuples; only the example structures are run.
+    options (dict): Keyword arguments for Pipeline.
+    threshold (float): Accessibility threshold of the method runs.
+
+    Returns:
+    accessibility (dict): Threshold and, per case, whether the run without a threshold computed the
+        accessibility, and whether each method at the threshold kept the surface of the run without
+        one and whether both methods kept the same surface.
+    """
+    examples = [(name, path) for name, path in cases if not name.startswith('synthetic_')]
+    accessibility = {'threshold': threshold, 'cases': {}}
+    context = multiprocessing.get_context('spawn')
+    for name, path in examples:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            full, stages = pool.apply(_run_surface_quietly, ((path, dict(options, accessibility_threshold=0.0)),))
+            surfaces = {method: pool.apply(_run_surface_quietly, ((path, dict(
+                options, accessibility_method=method, accessibility_threshold=threshold)),))[0]
+                for method in ('neighbor', 'sasa')}
+        case = {'computed_without_threshold': 'accessibility' in stages,
+                'unchanged': [method for method, digest in surfaces.items() if digest == full],
+                'methods_identical': surfaces['neighbor'] == surfaces['sasa']}
+        accessibility['cases'][name] = case
+        stage = 'RAN' if case['computed_without_threshold'] else 'skipped'
+        print(f"accessibility {name:<9} stage without threshold: {stage}, "
+              f"unchanged at {threshold}: {', '.join(case['unchanged']) or 'none'}, "
+              f"methods {'IDENTICAL' if case['methods_identical'] else 'differ'}")
+    return accessibility
+
+
+def _run_trajectory_quietly(args):
+    """Pool entry point: runs the trajectory check in one mode, keeping the fastest of repeat runs."""
+    trajectory_file, options, reuse_rmsd, repeat = args
+    from Pipeline import Pipeline
+    import Trajectory
+
+    runs = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            result = Trajectory.run_trajectory(Pipeline(cache=None, plot=False, **options), trajectory_file,
+                                               reuse_rmsd=reuse_rmsd)
+            runs.append(result)
+    result = max(runs, key=lambda run: run['frames_per_second'] or 0)
+    return {'frames_per_second': result['frames_per_second'], 'seconds': result['seconds'],
+            'n_surface_reused': result['n_surface_reused'], 'n_tracks': len(result['tracks']),
+            'persistent_tracks': sum(1 for track in result['tracks'] if track['persistence'] == 1.0)}
+
+
+def measure_trajectory(work_dir, options, n_frames, repeat=1):
+    """
+    Measures trajectory throughput (see scripts/Trajectory.py) on a synthetic ensemble of TRAJECTORY_SOURCE.
+
+    Both modes run in a fresh process: 'reuse' keeps the surface of earlier frames while the RMSD
+    stays below Trajectory.REUSE_RMSD, 'exact' recomputes every stage on every frame.
+
+    Args:
+    work_dir (str): Folder for the ensemble file.
+    options (dict): Keyword arguments for Pipeline.
+    n_frames (int): Number of frames.
+    repeat (int): Runs per mode; the fastest is kept.
+
+    Returns:
+    trajectory (dict): Atoms, frames and, per mode, frames/s, reused surfaces and track counts.
+    """
+    import Trajectory
+
+    path = os.path.join(work_dir, 'ensemble.pdb')
+    n_atoms = write_ensemble_pdb(os.path.join(EXAMPLES_DIR, TRAJECTORY_SOURCE), n_frames, path)
+    trajectory = {'source': TRAJECTORY_SOURCE, 'atoms': n_atoms, 'frames': n_frames, 'modes': {}}
+    context = multiprocessing.get_context('spawn')
+    for mode, reuse_rmsd in (('reuse', Trajectory.REUSE_RMSD), ('exact', 0.0)):
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            result = pool.apply(_run_trajectory_quietly, ((path, options, reuse_rmsd, repeat),))
+        trajectory['modes'][mode] = result
+        print(f"trajectory {mode:<10} {n_atoms:>8} atoms {n_frames:>4} frames "
+              f"{result['frames_per_second']:>7.2f} frames/s "
+              f"{result['n_surface_reused']:>4} reused surfaces {result['n_tracks']:>4} tracks "
+              f"({result['persistent_tracks']} in every frame)")
+    return trajectory
+
+
+def _run_triage_quietly(args):
+    """Pool entry point: runs one structure in one triage mode; returns the fastest time and the pocket centers."""
+    structure_file, options, repeat = args
+    from Pipeline import Pipeline
+
+    pipeline = Pipeline(profile=True, cache=None, plot=False, save_intermediates=False, **options)
+    totals = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            result = pipeline.run(structure_file)
+            totals.append(sum(stage['wall_s'] for stage in result['profile']['stages'] if stage['parent'] is None))
+    return min(totals), [pocket['center'] for pocket in result['scored']]
+
+
+def _recall(reference, found, top=None):
+    """Counts the reference pocket centers (the first top ones) with a found center within TRIAGE_MATCH_DISTANCE."""
+    import numpy as np
+
+    reference = np.asarray(reference, dtype=float).reshape(-1, 3)[:top]
+    found = np.asarray(found, dtype=float).reshape(-1, 3)
+    if len(found) == 0:
+        return 0, len(reference)
+    distances = np.linalg.norm(reference[:, None, :] - found[None, :, :], axis=2).min(axis=1)
+    return int((distances <= TRIAGE_MATCH_DISTANCE).sum()), len(reference)
+
+
+def measure_triage(cases, options, margins, repeat=1):
+    """
+    Measures the recall/speed trade-off of the triage pass (see scripts/Triage.py) against full mode.
+
+    Every structure runs in a fresh process per mode, with the default pipeline settings.
+
+    Args:
+    cases (list): (name, structure file) tuples; only the example structures are run.
+    options (dict): Keyword arguments for Pipeline.
+    margins (list): Triage margins in Å.
+    repeat (int): Runs per structure and mode; the fastest is kept.
+
+    Returns:
+    triage (dict): Per margin, the total full and triaged time, speedup, and the recall over all
+        full-mode pockets and over the DRIFT_TOP best of every structure; per case, the same figures.
+    """
+    examples = [(name, path) for name, path in cases if not name.startswith('synthetic_')]
+    modes = [('full', options)] + [(margin, dict(options, triage=True, triage_margin=margin)) for margin in margins]
+    runs = {}
+    context = multiprocessing.get_context('spawn')
+    for name, path in examples:
+        for mode, mode_options in modes:
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                runs[name, mode] = pool.apply(_run_triage_quietly, ((path, mode_options, repeat),))
+
+    triage = {'match_distance': TRIAGE_MATCH_DISTANCE, 'margins': {}}
+    for margin in margins:
+        cases_report, sums = {}, [0.0, 0.0, 0, 0, 0, 0]
+        for name, _ in examples:
+            (full_s, full_centers), (triage_s, triage_centers) = runs[name, 'full'], runs[name, margin]
+            found, total = _recall(full_centers, triage_centers)
+            found_top, total_top = _recall(full_centers, triage_centers, DRIFT_TOP)
+            cases_report[name] = {'full_s': round(full_s, 4), 'triage_s': round(triage_s, 4),
+                                  'full_pockets': total, 'triage_pockets': len(triage_centers),
+                                  'found': found, 'found_top': found_top}
+            for index, value in enumerate((full_s, triage_s, found, total, found_top, total_top)):
+                sums[index] += value
+        full_s, triage_s, found, total, found_top, total_top = sums
+        triage['margins'][str(margin)] = {
+            'full_s': round(full_s, 4), 'triage_s': round(triage_s, 4),
+            'speedup': round(full_s / triage_s, 2) if triage_s else None,
+            'recall': round(found / total, 3) if total else None,
+            'recall_top': round(found_top / total_top, 3) if total_top else None,
+            'cases': cases_report,
+        }
+        print(f"triage margin {margin:>5.1f} Å {full_s:>9.3f} s -> {triage_s:>9.3f} s "
+              f"speedup {full_s / triage_s if triage_s else 0:>5.2f}x recall {found}/{total} pockets, "
+              f"{found_top}/{total_top} top-{DRIFT_TOP}")
+    return triage
+
+
+def sanity_check(report):
+    """
+    Checks a report without a baseline: every case finds pockets, no example structure splits
+    into more than MAX_POCKETS, the known sites and ligands are found, every scoring term puts
+    the example pockets in more than one bin and, with --accessibility, the accessibility stage
+    only runs with a threshold and both methods change the surface at it.
+
+    Args:
+    report (dict): Output of run_suite().
+
+    Returns:
+    problems (list): Messages about cases without pockets or with too many, a missed known site or ligand,
+        a constant scoring term, or an accessibility stage that runs for nothing or changes nothing.
+    """
+    problems = []
+    for name, case in report['cases'].items():
+        if case['n_pockets'] == 0:
+            problems.append(f"{name}: no pockets found")
+        if not name.startswith('synthetic_') and case['n_pockets'] > MAX_POCKETS:
+            problems.append(f"{name}: {case['n_pockets']} pockets, expected at most {MAX_POCKETS}")
+        rank = case.get('site_rank')
+        if name in KNOWN_SITES and (rank is None or rank > KNOWN_SITE_TOP):
+            found = 'not found' if rank is None else f"ranked {rank}"
+            problems.append(f"{name}: known site {'+'.join(KNOWN_SITES[name])} {found}, "
+                            f"expected in the top {KNOWN_SITE_TOP}")
+        rank = case.get('ligand_rank')
+        if name in KNOWN_LIGANDS and (rank is None or rank > KNOWN_SITE_TOP):
+            found = 'no pocket' if rank is None else f"the first pocket ranked {rank}"
+            problems.append(f"{name}: {found} within {LIGAND_DISTANCE} Å of the bound ligand, "
+                            f"expected in the top {KNOWN_SITE_TOP}")
+
+    # A term whose bin is the same for every pocket adds a constant and cannot rank them
+    examples = [case for name, case in report['cases'].items() if not name.startswith('synthetic_')]
+    terms = {term for case in examples for term in case.get('term_bins', {})}
+    for term in sorted(terms):
+        seen = set().union(*(case['term_bins'].get(term, []) for case in examples if 'term_bins' in case))
+        if len(seen) < 2:
+            problems.append(f"scoring term '{term}' puts every example pocket in bin {', '.join(map(str, seen))}")
+
+    threshold = report.get('accessibility', {}).get('threshold')
+    for name, case in report.get('accessibility', {}).get('cases', {}).items():
+        if case['computed_without_threshold']:
+            problems.append(f"{name}: the accessibility stage ran without an accessibility threshold")
+        for method in case['unchanged']:
+            problems.append(f"{name}: the {method} accessibility at threshold {threshold} keeps the whole surface")
+        if case['methods_identical']:
+            problems.append(f"{name}: the neighbor and sasa accessibility keep the same surface "
+                            f"at threshold {threshold}")
+    return problems
+
+
+def _slower(value, reference, tolerance, slack):
+    """Returns True when value exceeds reference by more than the relative tolerance plus the slack."""
+    return value > reference * (1 + tolerance) + slack
+
+
+def compare(report, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE,
+            time_slack=TIME_SLACK, drift_distance=DRIFT_DISTANCE):
+    """
+    Compares a report with a baseline report.
+
+    Args:
+    report (dict): Output of run_suite().
+    baseline (dict): Stored output of run_suite().
+    time_tolerance (float): Allowed relative slowdown.
+    memory_tolerance (float): Allowed relative peak RSS growth.
+    time_slack (float): Allowed absolute slowdown in seconds (absorbs noise of short stages).
+    drift_distance (float): Largest center shift in Å of a top-ranked pocket.
+
+    Returns:
+    regressions (list): Messages about slower stages or higher memory.
+    drift (list): Messages about changed pocket rankings.
+    """
+    regressions, drift = [], []
+    if baseline.get('options') != report['options']:
+        print("Warning: baseline was recorded with different pipeline options.")
+
+    for name, check in report.get('startup', {}).items():
+        if check['seconds'] > check['budget_s']:
+            regressions.append(f"startup {name}: {check['seconds']:.3f} s over its {check['budget_s']:.1f} s budget")
+        reference = baseline.get('startup', {}).get(name)
+        if reference and _slower(check['seconds'], reference['seconds'], time_tolerance, time_slack):
+            regressions.append(f"startup {name}: {check['seconds']:.3f} s vs {reference['seconds']:.3f} s")
+
+    for mode, run in report.get('trajectory', {}).get('modes', {}).items():
+        reference = baseline.get('trajectory', {}).get('modes', {}).get(mode)
+        if reference and run['frames_per_second'] * (1 + time_tolerance) < reference['frames_per_second']:
+            regressions.append(f"trajectory {mode}: {run['frames_per_second']:.2f} frames/s "
+                               f"vs {reference['frames_per_second']:.2f} frames/s")
+
+    for name, case in report['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            continue
+
+        if _slower(case['total_s'], reference['total_s'], time_tolerance, time_slack):
+            regressions.append(f"{name}: total {case['total_s']:.3f} s vs {reference['total_s']:.3f} s")
+        for stage, seconds in case['stages'].items():
+            expected = reference['stages'].get(stage)
+            if expected is not None and _slower(seconds, expected, time_tolerance, time_slack):
+                regressions.append(f"{name}: {stage} {seconds:.3f} s vs {reference['stages'][stage]:.3f} s")
+        if case['peak_rss_mb'] and reference.get('peak_rss_mb') and \
+                case['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak RSS {case['peak_rss_mb']:.1f} MB vs {reference['peak_rss_mb']:.1f} MB")
+
+        if case['n_pockets'] != reference['n_pockets']:
+            drift.append(f"{name}: {case['n_pockets']} pockets vs {reference['n_pockets']}")
+        for rank, (pocket, expected) in enumerate(zip(case['top_pockets'], reference['top_pockets']), 1):
+            shift = sum((a - b) ** 2 for a, b in zip(pocket['center'], expected['center'])) ** 0.5
+            if shift > drift_distance or pocket['score'] != expected['score']:
+                drift.append(f"{name}: rank {rank} pocket moved {shift:.1f} Å, "
+                             f"score {pocket['score']} vs {expected['score']}")
+    return regressions, drift
+
+
+def build_parser():
+    """Builds the command-line interface."""
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline and check it against a baseline.")
+    parser.add_argument('--quick', action='store_true', help=f"Only run {', '.join(QUICK_CASES)}")
+    parser.add_argument('--synthetic', default='8,27',
+                        help=f"Comma-separated copy counts of synthetic {SYNTHETIC_SOURCE} assemblies, "
+                             "or 'none' (default: 8,27)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case, fastest kept (default: 3)")
+    parser.add_argument('--no-startup', action='store_true', help="Skip the main.py startup time checks")
+    parser.add_argument('--engine', choices=['dbscan', 'grid'], default='dbscan',
+                        help="Pocket detection engine (default: dbscan)")
+    parser.add_argument('--baseline', default=None,
+                        help="Baseline report (default: benchmarks/baseline_<ENGINE>.json)")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline")
+    parser.add_argument('--output', default=None, help="Also write the report to this JSON file")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="Also rerun the synthetic cases with N threads per structure (0 = one per CPU) "
+                             "and report the speedup")
+    parser.add_argument('--tiling', nargs='?', type=float, const=TILING_SIZE, default=None, metavar='SIZE',
+                        help="Also rerun the examples with tiled detection in tiles of SIZE Å and check that "
+                             f"the pockets are unchanged (default: {TILING_SIZE})")
+    parser.add_argument('--accessibility', nargs='?', type=float, const=ACCESSIBILITY_THRESHOLD, default=None,
+                        metavar='THRESHOLD',
+                        help="Also check that the accessibility stage is skipped without a threshold and that "
+                             f"both methods change the surface at THRESHOLD (default: {ACCESSIBILITY_THRESHOLD})")
+    parser.add_argument('--trajectory', type=int, default=None, metavar='FRAMES',
+                        help=f"Also measure trajectory frames/s on a FRAMES-frame ensemble of {TRAJECTORY_SOURCE}")
+    parser.add_argument('--triage', nargs='?', const=TRIAGE_MARGINS, default=None, metavar='MARGINS',
+                        help="Report the recall/speed trade-off of the triage pass at these comma-separated "
+                             f"margins in Å (default: {TRIAGE_MARGINS})")
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE,
+                        help=f"Allowed relative slowdown (default: {TIME_TOLERANCE})")
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE,
+                        help=f"Allowed relative peak RSS growth (default: {MEMORY_TOLERANCE})")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    synthetic = () if args.synthetic == 'none' else tuple(int(value) for value in args.synthetic.split(','))
+    options = {'engine': args.engine}
+    args.baseline = args.baseline or BASELINE_FILE.format(engine=args.engine)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        cases = collect_cases(args.quick, synthetic, work_dir)
+        report = run_suite(cases, options, args.repeat)
+        if not args.no_startup:
+            report['startup'] = measure_startup(work_dir, args.repeat)
+        if args.threads is not None:
+            report['threads'] = measure_threads(report, cases, options, args.threads, args.repeat)
+        if args.tiling:
+            report['tiling'] = measure_tiling(cases, options, args.tiling)
+        if args.accessibility:
+            report['accessibility'] = measure_accessibility(cases, options, args.accessibility)
+        if args.trajectory:
+            report['trajectory'] = measure_trajectory(work_dir, options, args.trajectory, args.repeat)
+        if args.triage:
+            margins = [float(value) for value in args.triage.split(',')]
+            report['triage'] = measure_triage(cases, options, margins, args.repeat)
+
+    throughput = report['throughput']
+    print(f"Throughput: {throughput['atoms_per_s']:.0f} atoms/s, {throughput['structures_per_min']:.1f} structures/min")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to {args.output}")
+
+    problems = sanity_check(report)
+    for message in problems:
+        print(f"SANITY     {message}")
+
+    if args.save_baseline:
+        if problems:
+            print("Baseline not written: the run fails the sanity checks.")
+            sys.exit(1)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        if problems:
+            sys.exit(1)
+        return
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions, drift = compare(report, baseline, args.time_tolerance, args.memory_tolerance)
+    for name, case in report.get('threads', {}).get('cases', {}).items():
+        if not case['identical']:
+            drift.append(f"{name}: pockets differ between the serial and the {args.threads}-thread run")
+    for name, case in report.get('tiling', {}).get('cases', {}).items():
+        if case['differences']:
+            drift.append(f"{name}: tiled pockets differ from the untiled run ({', '.join(case['differences'][:5])})")
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    for message in drift:
+        print(f"DRIFT      {message}")
+    if problems or regressions or drift:
+        sys.exit(1)
+    print("No regressions or ranking drift against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,65 +10,240 @@ Steps:
 4. Score pockets using geometric heuristics.
 5. Generate a PyMOL visualization script for ranked pockets.
 
+All steps run in this process through scripts/Pipeline.py; this file only parses
+the command line and chooses the output folder.
+
 Usage:
-    python main.py <INPUT_PDB> <OUTPUT_PREFIX>
+    python main.py <INPUT_PDB> <OUTPUT_PREFIX> [options]
+    python main.py --batch <INPUT_DIR|MANIFEST> <OUTPUT_PREFIX> [--workers N] [options]
+    python main.py --trajectory <ENSEMBLE|TRAJECTORY> <OUTPUT_PREFIX> [--topology FILE] [options]
+
+Options:
+    --altloc {all,first,<letter>}     Alternate locations to keep (default: all)
+    --model {all,first,<serial>}      Models to keep (default: all)
+    --hetatm                          Keep HETATM records (ligands, ions, water)
+    --accessibility {neighbor,sasa}   Accessibility model (default: neighbor)
+    --sasa-points N                   Sphere test points per atom for SASA (default: 100)
+    --accessibility-threshold T       Only keep surface facets whose atoms all reach accessibility T; 0 keeps
+                                      the whole surface and skips the accessibility stage (default: 0)
+    --alpha {auto,<float>}            Alpha-shape radius of the surface in Å (default: 3.0)
+    --engine {dbscan,grid}            Pocket detection engine (default: dbscan)
+    --grid-spacing S                  Voxel size in Å of the grid engine (default: 1.0)
+    --tile SIZE                       Compute the surface and DBSCAN pockets in tiles of SIZE Å (large complexes)
+    --tile-overlap H                  Minimum halo around every tile in Å (default: 12.0)
+    --triage                          Run a fast residue-level pass first and only analyze the atoms near its
+                                      candidate concave regions; may miss pockets (see scripts/Triage.py)
+    --triage-margin M                 Distance in Å from a candidate region of the atoms analyzed (default: 10.0)
+    --eps {auto,<float>}              DBSCAN neighborhood radius in Å (default: 2.0)
+    --scoring-config FILE             JSON scoring bins and weights (default: built-in rules, see scripts/Scoring.py)
+    --top-k K                         Only keep the K best-ranked pockets (default: all)
+    --json                            Also write intermediates as JSON (parsed.json, surface.json, pockets.json)
+    --no-intermediates                Do not write parsed, surface and pocket intermediates
+    --plot                            Also render surface.png after the results
+    --plot-background                 Like --plot, but render it in a separate process
+    --profile                         Write per-stage wall/CPU time, peak memory and counters to profile.json
+    --trace                           Also write the stage timeline as a Chrome trace (trace.json)
+    --threads N                       Threads for the kernels of one structure; 0 uses every CPU (default: 1)
+    --batch                           INPUT_PDB is a folder of structures or a manifest (see scripts/Batch.py)
+    --workers N                       Worker processes in batch mode (default: number of CPUs)
+    --top N                           Pockets per structure in the batch summary (default: 3)
+    --trajectory                      INPUT_PDB is a multi-model PDB/mmCIF or an XYZ trajectory; pockets are
+                                      detected per frame and tracked across frames (see scripts/Trajectory.py)
+    --topology FILE                   PDB or mmCIF file listing the atoms of every frame (required for XYZ)
+    --stride N                        Analyze every N-th frame (default: 1)
+    --reuse-rmsd A                    Reuse the surface of an earlier frame within A Å RMSD; 0 recomputes
+                                      every frame (default: 0.5)
+    --rerun                           In batch mode, also rerun structures that already completed
+    --cache-dir DIR                   Stage result cache (default: results/.cache)
+    --cache-size MB                   Cache size limit; least recently used entries are evicted (default: 2048)
+    --no-cache                        Recompute every stage without reading or writing the cache
 
 Project Structure:
     ├── scripts/
-    │   ├── PDBParser.py
+    │   ├── PDBparser.py
     │   ├── SurfAnal.py
     │   ├── PockDet.py
+    │   ├── PockGrid.py
     │   ├── Scoring.py
-    │   └── Visualize.py
+    │   ├── Visualize.py
+    │   ├── Pipeline.py
+    │   ├── Batch.py
+    │   ├── Profiler.py
+    │   ├── Parallel.py
+    │   ├── Tiling.py
+    │   ├── Residues.py
+    │   ├── Trajectory.py
+    │   ├── Triage.py
+    │   ├── Server.py
+    │   └── Cache.py
     └── results/
+        ├── .cache/
         └── <OUTPUT_PREFIX>/
 """
 
 import os
 import sys
-import subprocess
+import argparse
 
-SCRIPT_DIR = os.path.join(os.path.dirname(__file__), 'scripts')
-RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
 
-def run_step(script_name, args=[]):
-    """Run a Python script in the 'scripts' folder with the provided arguments."""
-    script_path = os.path.join(SCRIPT_DIR, script_name)
-    print(f" Running {script_name} with args: {' '.join(args)}")
-    result = subprocess.run(['python', script_path] + args)
-    if result.returncode != 0:
-        print(f" Error while running {script_name}")
-        sys.exit(result.returncode)
-    print(f" {script_name} completed.\n")
+sys.path.insert(0, SCRIPT_DIR)
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python main.py <INPUT_PDB> <OUTPUT_PREFIX>")
-        sys.exit(1)
 
-    pdb_file = sys.argv[1]
-    prefix = sys.argv[2]
+def build_parser():
+    """Builds the command-line interface."""
+    parser = argparse.ArgumentParser(
+        description="Predict ligand binding pockets from a PDB file using geometry.")
+    parser.add_argument('pdb_file', metavar='INPUT_PDB', help="Input PDB or mmCIF file (plain or .gz)")
+    parser.add_argument('prefix', metavar='OUTPUT_PREFIX', help="Results are written to results/<OUTPUT_PREFIX>/")
+    parser.add_argument('--altloc', default='all',
+                        help="Alternate locations to keep: all, first or a letter such as A (default: all)")
+    parser.add_argument('--model', default='all',
+                        help="Models to keep: all, first or a model serial number (default: all)")
+    parser.add_argument('--hetatm', action='store_true', help="Keep HETATM records (ligands, ions, water)")
+    parser.add_argument('--accessibility', choices=['neighbor', 'sasa'], default='neighbor',
+                        help="Accessibility model (default: neighbor)")
+    parser.add_argument('--sasa-points', type=int, default=100,
+                        help="Sphere test points per atom for the SASA model (default: 100)")
+    parser.add_argument('--accessibility-threshold', type=float, default=0.0, metavar='T',
+                        help="Minimum accessibility of every atom of a kept surface facet; 0 keeps the whole "
+                             "alpha-shape surface and skips the accessibility stage (default: 0)")
+    parser.add_argument('--alpha', type=lambda value: value if value == 'auto' else float(value), default=3.0,
+                        help="Alpha-shape circumradius cutoff of the surface in Å, about an atom radius plus the "
+                             "probe radius; 'auto' picks the smallest value keeping every atom (default: 3.0)")
+    parser.add_argument('--engine', choices=['dbscan', 'grid'], default='dbscan',
+                        help="Pocket detection engine: DBSCAN on surface points, or LIGSITE-style grid scans "
+                             "(default: dbscan)")
+    parser.add_argument('--eps', type=lambda value: value if value == 'auto' else float(value), default=2.0,
+                        help="DBSCAN neighborhood radius in Å, or 'auto' to derive it from the point density "
+                             "(default: 2.0)")
+    parser.add_argument('--grid-spacing', type=float, default=1.0,
+                        help="Voxel size in Å of the grid engine; smaller is slower but finer (default: 1.0)")
+    parser.add_argument('--tile', type=float, default=None, metavar='SIZE',
+                        help="Compute the surface and DBSCAN pockets in cubic tiles of SIZE Å, bounding memory "
+                             "on very large complexes (default: whole structure at once)")
+    parser.add_argument('--tile-overlap', type=float, default=12.0, metavar='H',
+                        help="Minimum halo of atoms around every tile in Å; grown to twice alpha when needed "
+                             "(default: 12.0)")
+    parser.add_argument('--triage', action='store_true',
+                        help="Run a fast residue-level pass first and only analyze the atoms near its candidate "
+                             "concave regions at full resolution; faster, but may miss pockets")
+    parser.add_argument('--triage-margin', type=float, default=10.0, metavar='M',
+                        help="Distance in Å from a candidate region of the atoms analyzed; larger recovers more "
+                             "pockets (default: 10.0)")
+    parser.add_argument('--scoring-config', default=None,
+                        help="JSON file with scoring bins and weights (default: built-in rules)")
+    parser.add_argument('--top-k', type=int, default=None,
+                        help="Only keep the K best-ranked pockets (default: all)")
+    parser.add_argument('--json', action='store_true',
+                        help="Also write intermediates as JSON next to the binary .arrays folders")
+    parser.add_argument('--no-intermediates', action='store_true',
+                        help="Do not write parsed, surface and pocket intermediates")
+    parser.add_argument('--plot', action='store_true',
+                        help="Render the surface PCA/t-SNE plot (surface.png) after the results (default: no plot)")
+    parser.add_argument('--plot-background', action='store_true',
+                        help="Like --plot, but render it in a separate process")
+    parser.add_argument('--no-plot', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--profile', action='store_true',
+                        help="Write per-stage wall time, CPU time, peak memory and counters to profile.json")
+    parser.add_argument('--trace', action='store_true',
+                        help="Also write the stage timeline as a Chrome trace (trace.json, implies --profile)")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="Threads for the neighbor, SASA, surface, depth and pocket kernels of one structure; "
+                             "0 uses every CPU (default: 1)")
+    parser.add_argument('--batch', action='store_true',
+                        help="Treat INPUT_PDB as a folder of structures or a manifest and process all of them")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes in batch mode (default: number of CPUs)")
+    parser.add_argument('--top', type=int, default=3,
+                        help="Top-ranked pockets per structure in the batch summary (default: 3)")
+    parser.add_argument('--trajectory', action='store_true',
+                        help="Treat INPUT_PDB as an NMR ensemble or MD trajectory (multi-model PDB/mmCIF, or XYZ "
+                             "with --topology): detect pockets in every frame and track them across frames")
+    parser.add_argument('--topology', default=None,
+                        help="PDB or mmCIF file listing the atoms of every trajectory frame (required for XYZ)")
+    parser.add_argument('--stride', type=int, default=1, help="Analyze every N-th trajectory frame (default: 1)")
+    parser.add_argument('--reuse-rmsd', type=float, default=0.5,
+                        help="Reuse the accessibility and surface of an earlier frame while the RMSD to it stays "
+                             "within this many Å; 0 recomputes every frame (default: 0.5)")
+    parser.add_argument('--rerun', action='store_true',
+                        help="In batch mode, rerun structures that already completed")
+    parser.add_argument('--cache-dir', default=os.path.join(RESULTS_DIR, '.cache'),
+                        help="Folder of the stage result cache (default: results/.cache)")
+    parser.add_argument('--cache-size', type=float, default=2048,
+                        help="Cache size limit in MB; least recently used entries are evicted (default: 2048)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Recompute every stage without reading or writing the cache")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
 
     # Create results/<prefix>/ directory
-    output_dir = os.path.join(RESULTS_DIR, prefix)
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Output file paths
-    parsed_json   = os.path.join(output_dir, "parsed.json")
-    surface_json  = os.path.join(output_dir, "surface.json")
-    surface_plot  = os.path.join(output_dir, "surface.png")
-    pockets_json  = os.path.join(output_dir, "pockets.json")
-    scored_json   = os.path.join(output_dir, "scored.json")
-    pymol_script  = os.path.join(output_dir, "pockets.pml")
-
-    # Run the pipeline steps
-    run_step("PDBParser.py", [pdb_file, parsed_json])
-    run_step("SurfAnal.py", [parsed_json, surface_json, surface_plot])
-    run_step("PockDet.py", [surface_json, pockets_json])
-    run_step("Scoring.py", [pockets_json, scored_json])
-    run_step("Visualize.py", [scored_json, pymol_script])
+    output_dir = os.path.join(RESULTS_DIR, args.prefix)
+
+    options = dict(altloc=None if args.altloc == 'all' else args.altloc,
+                   model=None if args.model == 'all' else args.model,
+                   hetatm=args.hetatm,
+                   accessibility_method=args.accessibility,
+                   n_points=args.sasa_points,
+                   accessibility_threshold=args.accessibility_threshold,
+                   alpha=args.alpha,
+                   engine=args.engine,
+                   tile_size=args.tile,
+                   tile_overlap=args.tile_overlap,
+                   triage=args.triage,
+                   triage_margin=args.triage_margin,
+                   eps=args.eps,
+                   grid_spacing=args.grid_spacing,
+                   scoring_config=args.scoring_config,
+                   top_k=args.top_k,
+                   profile=args.profile,
+                   trace=args.trace,
+                   threads=args.threads,
+                   save_intermediates=not args.no_intermediates,
+                   export_json=args.json,
+                   plot=False if args.no_plot else 'background' if args.plot_background else args.plot)
+
+    # Trajectory frames are not cached: every frame is a new set of coordinates
+    if not args.no_cache and not args.trajectory:
+        from Cache import StageCache
+        options['cache'] = StageCache(args.cache_dir, max_bytes=int(args.cache_size * 1024 ** 2))
+
+    if args.trajectory:
+        import Trajectory
+        from Pipeline import Pipeline
+        try:
+            Trajectory.run_trajectory(Pipeline(**options), args.pdb_file, output_dir, topology_file=args.topology,
+                                      stride=args.stride, reuse_rmsd=args.reuse_rmsd)
+        except (FileNotFoundError, ValueError) as error:
+            print(f"Error: {error}")
+            sys.exit(1)
+        failed = 0
+    elif args.batch:
+        import Batch
+        try:
+            inputs = Batch.collect_inputs(args.pdb_file)
+        except (FileNotFoundError, ValueError) as error:
+            print(f"Error: {error}")
+            sys.exit(1)
+        records = Batch.run_batch(inputs, output_dir, workers=args.workers, top_n=args.top,
+                                  resume=not args.rerun, **options)
+        failed = sum(1 for record in records if record['status'] != 'done')
+    else:
+        from Pipeline import Pipeline
+        try:
+            Pipeline(**options).run(args.pdb_file, output_dir)
+        except FileNotFoundError as error:
+            print(f"Error: {error}")
+            sys.exit(1)
+        failed = 0
 
     print(f" All results saved to: {output_dir}/")
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,254 @@
+"""
+Artifacts.py
+
+Compact binary storage for pipeline intermediates (parsed structure, surface, pockets).
+
+An artifact is a folder holding one uncompressed .npy file per column plus a small
+meta.json describing it. Columns are opened with memory mapping, so a downstream stage
+reads only the pages it touches and nothing is copied or parsed on load.
+
+Layout:
+    parsed.arrays/
+        meta.json
+        coord.npy
+        accessibility.npy
+        ...
+
+Functions:
+- save_arrays(path, columns, meta): Writes a generic artifact.
+- load_arrays(path, mmap=True): Opens a generic artifact.
+- save_parsed / load_parsed: Parsed atoms, residues and accessibility.
+- save_surface / load_surface: Surface points and per-point properties.
+- save_pockets / load_pockets: Pocket table (one column per pocket property).
+"""
+
+import json
+import os
+
+import numpy as np
+
+FORMAT_NAME = 'sbi-arrays'
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+
+
+def is_artifact(path):
+    """Returns True when path is an artifact folder."""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def save_arrays(path, columns, meta=None):
+    """
+    Writes named arrays as an artifact folder.
+
+    Args:
+    path (str): Artifact folder (created if missing).
+    columns (dict): Column name -> array. Object arrays are not allowed.
+    meta (dict): Extra JSON-serializable metadata.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values)
+        if values.dtype.hasobject:
+            raise TypeError(f"Column '{name}' has object dtype and cannot be memory-mapped")
+        np.save(os.path.join(path, name + '.npy'), values, allow_pickle=False)
+
+    header = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'columns': list(columns),
+        'meta': meta or {},
+    }
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(header, f, indent=4)
+
+
+def load_arrays(path, mmap=True):
+    """
+    Opens an artifact folder.
+
+    Args:
+    path (str): Artifact folder.
+    mmap (bool): Memory-map the columns (read-only) instead of reading them into memory.
+
+    Returns:
+    columns (dict): Column name -> array.
+    meta (dict): Metadata stored with the artifact.
+    """
+    with open(os.path.join(path, META_FILE), 'r') as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT_NAME:
+        raise ValueError(f"{path} is not a {FORMAT_NAME} artifact")
+
+    mmap_mode = 'r' if mmap else None
+    columns = {}
+    for name in header['columns']:
+        columns[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+    return columns, header['meta']
+
+
+def records_to_columns(records):
+    """
+    Converts a list of dicts sharing the same keys into a dict of arrays.
+
+    Args:
+    records (list): List of dicts (e.g. pockets).
+
+    Returns:
+    columns (dict): Key -> array with one row per record.
+    """
+    if not records:
+        return {}
+    return {key: np.asarray([record[key] for record in records]) for key in records[0]}
+
+
+def columns_to_records(columns):
+    """
+    Converts a dict of equally long arrays back into a list of dicts of Python values.
+
+    Args:
+    columns (dict): Key -> array with one row per record.
+
+    Returns:
+    records (list): List of dicts.
+    """
+    if not columns:
+        return []
+    lists = {key: np.asarray(values).tolist() for key, values in columns.items()}
+    n_records = len(next(iter(lists.values())))
+    return [{key: values[i] for key, values in lists.items()} for i in range(n_records)]
+
+
+def save_parsed(path, atoms, residues, accessibility, residue_sasa=None):
+    """
+    Saves parsed PDB data and per-atom accessibility as an artifact.
+
+    Args:
+    path (str): Artifact folder.
+    atoms (np.array): Structured atom array (PDBparser.ATOM_DTYPE); one column per field.
+    residues (dict): Dictionary of residues {residue_key: res_type}.
+    accessibility (dict or np.array): Solvent accessibility per atom index.
+    residue_sasa (dict): Optional solvent accessible area per residue.
+    """
+    if isinstance(accessibility, dict):
+        accessibility = [accessibility[i] for i in range(len(atoms))]
+
+    columns = {name: atoms[name] for name in atoms.dtype.names}
+    columns['accessibility'] = np.asarray(accessibility, dtype=float)
+    columns['residue_key'] = np.array(list(residues), dtype=str)
+    columns['residue_type'] = np.array(list(residues.values()), dtype=str)
+    if residue_sasa is not None:
+        columns['residue_sasa'] = np.array([residue_sasa.get(key, 0.0) for key in residues], dtype=float)
+
+    save_arrays(path, columns, {'kind': 'parsed', 'n_atoms': len(atoms), 'atom_fields': list(atoms.dtype.names)})
+    print(f"Data saved to {path}")
+
+
+def load_parsed(path, mmap=True):
+    """
+    Opens a parsed-structure artifact.
+
+    Args:
+    path (str): Artifact folder.
+    mmap (bool): Memory-map the per-atom columns.
+
+    Returns:
+    pdb_data (dict): One array per atom field ('coord', 'name', 'chain', ...) plus
+        'accessibility', the 'residues' dict and 'residue_sasa' when stored.
+    """
+    pdb_data, meta = load_arrays(path, mmap)
+    residue_keys = pdb_data.pop('residue_key').tolist()
+    residue_types = pdb_data.pop('residue_type').tolist()
+    residue_sasa = pdb_data.pop('residue_sasa', None)
+
+    pdb_data['residues'] = dict(zip(residue_keys, residue_types))
+    pdb_data['atom_fields'] = meta['atom_fields']
+    if residue_sasa is not None:
+        pdb_data['residue_sasa'] = dict(zip(residue_keys, residue_sasa.tolist()))
+    return pdb_data
+
+
+def parsed_atoms(pdb_data):
+    """
+    Reassembles the structured atom array from the columns of a parsed artifact (copies).
+
+    Args:
+    pdb_data (dict): Output of load_parsed().
+
+    Returns:
+    atoms (np.array): Structured atom array.
+    """
+    fields = pdb_data['atom_fields']
+    dtype = np.dtype([(name, pdb_data[name].dtype, pdb_data[name].shape[1:]) for name in fields])
+    atoms = np.zeros(len(pdb_data[fields[0]]), dtype=dtype)
+    for name in fields:
+        atoms[name] = pdb_data[name]
+    return atoms
+
+
+def save_surface(path, surface_points, surface_properties, facets=None):
+    """
+    Saves surface points and their per-point properties as an artifact.
+
+    Args:
+    path (str): Artifact folder.
+    surface_points (np.array): Surface points with (x, y, z).
+    surface_properties (dict): Per-point surface properties such as curvature and depth.
+    facets (np.array): Optional surface triangles as indices into surface_points.
+    """
+    columns = {'surface_points': np.asarray(surface_points, dtype=float).reshape(-1, 3)}
+    for key, values in surface_properties.items():
+        columns['property_' + key] = np.asarray(values)
+    if facets is not None:
+        columns['surface_facets'] = np.asarray(facets, dtype=np.int64).reshape(-1, 3)
+
+    save_arrays(path, columns, {'kind': 'surface', 'properties': list(surface_properties)})
+    print(f"Surface data saved to {path}")
+
+
+def load_surface(path, mmap=True):
+    """
+    Opens a surface artifact.
+
+    Args:
+    path (str): Artifact folder.
+    mmap (bool): Memory-map the columns.
+
+    Returns:
+    surface_data (dict): {'surface_points': array, 'surface_properties': {name: array}}, plus
+        'surface_facets' when stored.
+    """
+    columns, meta = load_arrays(path, mmap)
+    surface_data = {
+        'surface_points': columns['surface_points'],
+        'surface_properties': {key: columns['property_' + key] for key in meta['properties']},
+    }
+    if 'surface_facets' in columns:
+        surface_data['surface_facets'] = columns['surface_facets']
+    return surface_data
+
+
+def save_pockets(path, pockets):
+    """
+    Saves a list of pocket dicts as a columnar artifact.
+
+    Args:
+    path (str): Artifact folder.
+    pockets (list): List of pocket dicts sharing the same keys.
+    """
+    save_arrays(path, records_to_columns(pockets), {'kind': 'pockets', 'n_pockets': len(pockets)})
+
+
+def load_pockets(path, mmap=True):
+    """
+    Opens a pocket artifact as a list of pocket dicts.
+
+    Args:
+    path (str): Artifact folder.
+    mmap (bool): Memory-map the columns.
+
+    Returns:
+    pockets (list): List of pocket dicts.
+    """
+    columns, _ = load_arrays(path, mmap)
+    return columns_to_records(columns)
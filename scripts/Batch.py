@@ -0,0 +1,400 @@
+"""
+Batch.py
+
+Runs the pipeline over many structures (a folder or a manifest) with a process pool.
+
+Every structure is written to its own folder <output_dir>/<name>/, exactly as a single
+run of main.py would, plus a status.json recording the outcome and the options it ran
+with. Completed structures are skipped when the batch is started again with the same
+input file (same path, size and modification time) and result-affecting options, so an
+interrupted proteome run resumes where it stopped. A failing structure is recorded (error
+and traceback in status.json, pipeline output in pipeline.log) and never stops the other ones.
+
+A worker process that dies (killed for memory, or crashing in native code) breaks the whole
+process pool, and every unfinished structure fails with it. The structures that were running
+then are retried one at a time in a pool of their own, where the one that breaks it again
+is recorded as failed; those still waiting run in a new pool. With a single worker (or a
+single structure left) the structures run in the batch process itself, which such a death
+stops.
+
+When all structures are processed, batch_summary.json and batch_summary.tsv list the
+top-ranked pockets of every structure and the failures.
+
+Manifest format: one structure per line, "<path> [name]"; blank lines and lines
+starting with '#' are ignored, relative paths are relative to the manifest.
+
+Usage:
+    python Batch.py <INPUT_DIR|MANIFEST> <OUTPUT_DIR> [WORKERS]
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+STRUCTURE_EXTENSIONS = ('.pdb', '.ent', '.cif', '.mmcif')
+STATUS_FILE = 'status.json'
+LOG_FILE = 'pipeline.log'
+SUMMARY_JSON = 'batch_summary.json'
+SUMMARY_TSV = 'batch_summary.tsv'
+
+# Pocket fields copied into the batch summary
+SUMMARY_FIELDS = ('pocket_id', 'score', 'num_points', 'depth', 'volume', 'enclosure', 'curvature', 'center',
+                  'num_lining_residues', 'hydrophobicity', 'polar_fraction', 'charge', 'lining_residues')
+
+# Pipeline options that change how a structure is run but not its results; the others are
+# recorded in status.json and must match for a completed structure to be skipped
+RUNTIME_OPTIONS = ('cache', 'threads', 'profile', 'trace')
+
+# Numerical libraries would otherwise start one thread per core in every worker
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+# Pipeline of the current worker process, built once by _init_worker
+_PIPELINE = None
+
+
+def structure_name(file_path):
+    """Returns the structure name of an input file: its file name without extensions."""
+    name = os.path.basename(file_path)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+def is_structure_file(file_path):
+    """Returns True for PDB/mmCIF file names, optionally gzip-compressed."""
+    name = file_path[:-3] if file_path.endswith('.gz') else file_path
+    return name.lower().endswith(STRUCTURE_EXTENSIONS)
+
+
+def collect_inputs(source):
+    """
+    Lists the structures of a batch.
+
+    Args:
+    source (str): Folder of PDB/mmCIF files, or manifest file with one "<path> [name]" per line.
+
+    Returns:
+    inputs (list): (name, path) tuples in processing order.
+    """
+    if os.path.isdir(source):
+        inputs = [(structure_name(entry), os.path.join(source, entry))
+                  for entry in sorted(os.listdir(source)) if is_structure_file(entry)]
+    elif os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        inputs = []
+        with open(source, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                path = os.path.join(base_dir, fields[0])
+                inputs.append((fields[1] if len(fields) > 1 else structure_name(path), path))
+    else:
+        raise FileNotFoundError(f"Batch input '{source}' not found.")
+
+    names = [name for name, _ in inputs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Structure names must be unique; duplicated: {', '.join(duplicates)}")
+    return inputs
+
+
+def read_status(structure_dir):
+    """Returns the status record of a structure folder, or None when it has not run."""
+    status_file = os.path.join(structure_dir, STATUS_FILE)
+    if not os.path.exists(status_file):
+        return None
+    try:
+        with open(status_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_status(structure_dir, record):
+    """Writes the status record of a structure atomically (temporary file, then rename)."""
+    os.makedirs(structure_dir, exist_ok=True)
+    status_file = os.path.join(structure_dir, STATUS_FILE)
+    with open(status_file + '.tmp', 'w') as f:
+        json.dump(record, f, indent=4)
+    os.replace(status_file + '.tmp', status_file)
+
+
+def result_options(options):
+    """
+    Returns the Pipeline options that determine the results of a structure, as JSON values.
+
+    The scoring configuration is recorded by content (file or defaults), so editing it
+    also counts as a change.
+
+    Args:
+    options (dict): Keyword arguments of Pipeline.
+
+    Returns:
+    recorded (dict): Option name -> value, without RUNTIME_OPTIONS.
+    """
+    from Scoring import load_config
+
+    recorded = {key: value for key, value in options.items() if key not in RUNTIME_OPTIONS}
+    recorded['scoring_config'] = load_config(options.get('scoring_config'))
+    return json.loads(json.dumps(recorded, sort_keys=True))
+
+
+def input_signature(pdb_file):
+    """Returns the size and modification time of an input file, or None when it cannot be read."""
+    try:
+        stat = os.stat(pdb_file)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_complete(record, pdb_file, options=None):
+    """
+    Returns True when a status record shows a successful run on the same input file with the same options.
+
+    The input file must also have kept its size and modification time, so a file replaced
+    in place is run again.
+    """
+    return (record is not None and record.get('status') == 'done'
+            and record.get('input') == os.path.abspath(pdb_file)
+            and record.get('input_file') == input_signature(pdb_file)
+            and record.get('options') == options)
+
+
+def _json_value(value):
+    """Converts numpy scalars and arrays to plain Python values for JSON."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+
+def summarize_pockets(scored, top_n):
+    """Returns the summary fields of the top_n ranked pockets."""
+    return [{key: _json_value(pocket[key]) for key in SUMMARY_FIELDS if key in pocket}
+            for pocket in scored[:top_n]]
+
+
+def _init_worker(options):
+    """Builds the pipeline once per worker process."""
+    global _PIPELINE
+    from Pipeline import Pipeline
+
+    _PIPELINE = Pipeline(**options)
+
+
+def run_structure(name, pdb_file, structure_dir, top_n=3, options=None):
+    """
+    Runs the pipeline on one structure, capturing its output and any failure.
+
+    Args:
+    name (str): Structure name.
+    pdb_file (str): Path to the structure file.
+    structure_dir (str): Output folder of the structure.
+    top_n (int): Number of top-ranked pockets kept in the status record.
+    options (dict): Result-affecting pipeline options (see result_options), kept in the status record.
+
+    Returns:
+    record (dict): Status record (also written to <structure_dir>/status.json).
+    """
+    os.makedirs(structure_dir, exist_ok=True)
+    record = {'name': name, 'input': os.path.abspath(pdb_file), 'input_file': input_signature(pdb_file),
+              'status': 'failed', 'options': options}
+    # Marks the structure as started, for run_batch to tell which ones a dying worker took down
+    write_status(structure_dir, dict(record, status='running', started=time.time()))
+    start = time.perf_counter()
+
+    with open(os.path.join(structure_dir, LOG_FILE), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            result = _PIPELINE.run(pdb_file, structure_dir)
+            record.update({
+                'status': 'done',
+                'n_atoms': len(result['atoms']),
+                'n_residues': len(result['residues']),
+                'n_pockets': len(result['scored']),
+                'top_pockets': summarize_pockets(result['scored'], top_n),
+            })
+            if 'profile' in result:
+                record['stage_seconds'] = {stage['stage']: stage['wall_s'] for stage in result['profile']['stages']
+                                           if stage['parent'] is None}
+                record['peak_rss_mb'] = result['profile']['peak_rss_mb']
+        except Exception as error:
+            # SystemExit is not caught: stages no longer exit on bad input, so it means a real stop
+            record['error'] = f"{type(error).__name__}: {error}"
+            record['traceback'] = traceback.format_exc()
+            print(record['traceback'])
+
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    write_status(structure_dir, record)
+    return record
+
+
+def _run_task(task):
+    """Process-pool entry point: runs one (name, pdb_file, structure_dir, top_n, options) task."""
+    return run_structure(*task)
+
+
+def failed_record(task, error):
+    """Records a task that failed outside run_structure (e.g. its worker process died) and returns the record."""
+    name, pdb_file, structure_dir, _, options = task
+    record = {'name': name, 'input': os.path.abspath(pdb_file), 'input_file': input_signature(pdb_file),
+              'status': 'failed', 'options': options, 'error': error, 'seconds': 0.0}
+    write_status(structure_dir, record)
+    return record
+
+
+def _run_pool(tasks, workers, options):
+    """
+    Runs tasks in process pools and yields their status records as they finish.
+
+    When a worker dies, the pool is broken and all its unfinished futures fail. The tasks
+    that had started then (their status.json says 'running' since the pool started) are
+    rerun alone in a one-worker pool, where breaking it again makes them failed; the tasks
+    that had not started are submitted to a new pool.
+
+    Args:
+    tasks (list): (name, pdb_file, structure_dir, top_n, options) tuples.
+    workers (int): Number of worker processes.
+    options (dict): Keyword arguments for Pipeline.
+    """
+    pending = list(tasks)
+    while pending:
+        started = time.time()
+        broken = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_worker,
+                                 initargs=(options,)) as pool:
+            futures = {pool.submit(_run_task, task): task for task in pending}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    broken.append(futures[future])
+                except Exception as error:
+                    yield failed_record(futures[future], f"{type(error).__name__}: {error}")
+
+        statuses = [read_status(task[2]) or {} for task in broken]
+        running = [task for task, status in zip(broken, statuses)
+                   if status.get('status') == 'running' and status.get('started', 0) >= started]
+        if len(pending) == 1 or (broken and not running):
+            # A lone task broke its pool, or the workers died before running anything
+            for task in broken:
+                yield failed_record(task, "BrokenProcessPool: the worker process died while running this structure "
+                                          "(killed, e.g. out of memory, or crashed in native code)")
+            break
+        for task in running:
+            yield from _run_pool([task], 1, options)
+        pending = [task for task in broken if task not in running]
+
+
+def run_batch(inputs, output_dir, workers=None, top_n=3, resume=True, **options):
+    """
+    Runs the pipeline over many structures and writes the consolidated summary.
+
+    Args:
+    inputs (list): (name, path) tuples, e.g. from collect_inputs().
+    output_dir (str): Batch output folder; structure results go to <output_dir>/<name>/.
+    workers (int): Number of worker processes (default: number of CPUs).
+    top_n (int): Number of top-ranked pockets per structure in the summary.
+    resume (bool): Skip structures whose previous run completed on the same input with the same
+        result-affecting options.
+    **options: Keyword arguments forwarded to Pipeline.
+
+    Returns:
+    records (list): Status record of every structure, in input order.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(inputs) or 1))
+    os.makedirs(output_dir, exist_ok=True)
+
+    recorded = result_options(options)
+    records = {}
+    tasks = []
+    for name, pdb_file in inputs:
+        structure_dir = os.path.join(output_dir, name)
+        previous = read_status(structure_dir)
+        if resume and is_complete(previous, pdb_file, recorded):
+            records[name] = dict(previous, skipped=True)
+        else:
+            tasks.append((name, pdb_file, structure_dir, top_n, recorded))
+
+    print(f"Batch: {len(inputs)} structures, {len(records)} already done, "
+          f"{len(tasks)} to run on {workers} worker(s).")
+
+    start = time.perf_counter()
+    if len(tasks) == 1 or (tasks and workers == 1):
+        _init_worker(options)
+        completed = (_run_task(task) for task in tasks)
+        _collect(completed, records, len(tasks))
+    elif tasks:
+        for variable in THREAD_VARIABLES:
+            os.environ.setdefault(variable, '1')
+        _collect(_run_pool(tasks, workers, options), records, len(tasks))
+    elapsed = time.perf_counter() - start
+
+    ordered = [records[name] for name, _ in inputs]
+    write_summary(ordered, output_dir, elapsed)
+    return ordered
+
+
+def _collect(completed, records, n_tasks):
+    """Stores finished records and prints one progress line per structure."""
+    for count, record in enumerate(completed, 1):
+        records[record['name']] = record
+        outcome = 'done' if record['status'] == 'done' else f"FAILED ({record['error']})"
+        print(f"[{count}/{n_tasks}] {record['name']}: {outcome} in {record['seconds']:.1f}s")
+
+
+def write_summary(records, output_dir, elapsed=None):
+    """
+    Writes batch_summary.json (all records) and batch_summary.tsv (one row per top pocket).
+
+    Args:
+    records (list): Status records in input order.
+    output_dir (str): Batch output folder.
+    elapsed (float): Wall time of this batch run in seconds.
+    """
+    failed = [record for record in records if record['status'] != 'done']
+    summary = {
+        'n_structures': len(records),
+        'n_done': len(records) - len(failed),
+        'n_failed': len(failed),
+        'n_skipped': sum(1 for record in records if record.get('skipped')),
+        'seconds': None if elapsed is None else round(elapsed, 3),
+        'failed': [{'name': record['name'], 'input': record['input'], 'error': record.get('error')}
+                   for record in failed],
+        'structures': [{key: value for key, value in record.items() if key not in ('traceback', 'options')}
+                       for record in records],
+    }
+    with open(os.path.join(output_dir, SUMMARY_JSON), 'w') as f:
+        json.dump(summary, f, indent=4)
+
+    with open(os.path.join(output_dir, SUMMARY_TSV), 'w') as f:
+        f.write("structure\tstatus\trank\tpocket_id\tscore\tnum_points\tdepth\t"
+                "center_x\tcenter_y\tcenter_z\tlining_residues\n")
+        for record in records:
+            pockets = record.get('top_pockets') or [None]
+            for rank, pocket in enumerate(pockets, 1):
+                if pocket is None:
+                    f.write(f"{record['name']}\t{record['status']}\t\t\t\t\t\t\t\t\t\n")
+                    continue
+                x, y, z = pocket['center']
+                f.write(f"{record['name']}\t{record['status']}\t{rank}\t{pocket['pocket_id']}\t{pocket['score']}\t"
+                        f"{pocket['num_points']}\t{pocket['depth']:.3f}\t{x:.3f}\t{y:.3f}\t{z:.3f}\t"
+                        f"{pocket.get('lining_residues', '')}\n")
+
+    print(f"Batch finished: {summary['n_done']} done, {summary['n_failed']} failed "
+          f"({summary['n_skipped']} skipped as already done).")
+    print(f"Summary written to {os.path.join(output_dir, SUMMARY_JSON)}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    n_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    run_batch(collect_inputs(sys.argv[1]), sys.argv[2], workers=n_workers, plot=False)
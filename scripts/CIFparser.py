@@ -0,0 +1,241 @@
+"""
+CIFparser.py
+
+Streaming reader for the atom_site table of PDBx/mmCIF files (plain or .gz).
+
+Large assemblies (ribosomes, viral capsids) are only distributed as mmCIF and exceed
+the 99,999-atom limit of the PDB format. This reader walks the file once, collects the
+atom_site rows in fixed-size blocks and converts each chunk into the same structured
+atom array produced by PDBparser (PDBparser.ATOM_DTYPE), so peak memory is bounded
+by the chunk size plus the selected atoms. Every later stage works unchanged on its
+output. BinaryCIF is not supported.
+
+Functions:
+- iter_atom_site_chunks(file_path, chunk_size): Yields structured atom arrays chunk by chunk.
+- read_cif_atoms(file_path, altloc, model, hetatm, chunk_size): Reads and selects all atoms.
+
+Usage:
+    python CIFparser.py <CIF_FILE>
+"""
+
+import gzip
+import re
+import sys
+
+import numpy as np
+
+from PDBparser import ATOM_DTYPE, decode_column, guess_element, select_atoms
+
+# atom_site items read for every ATOM_DTYPE field, in order of preference
+ATOM_SITE_ITEMS = {
+    'hetatm': ['group_PDB'],
+    'serial': ['id'],
+    'name': ['auth_atom_id', 'label_atom_id'],
+    'altloc': ['label_alt_id'],
+    'resname': ['auth_comp_id', 'label_comp_id'],
+    'chain': ['auth_asym_id', 'label_asym_id'],
+    'resseq': ['auth_seq_id', 'label_seq_id'],
+    'icode': ['pdbx_PDB_ins_code'],
+    'x': ['Cartn_x'],
+    'y': ['Cartn_y'],
+    'z': ['Cartn_z'],
+    'occupancy': ['occupancy'],
+    'bfactor': ['B_iso_or_equiv'],
+    'element': ['type_symbol'],
+    'model': ['pdbx_PDB_model_num'],
+}
+
+# CIF values: quoted strings (a quote only closes before whitespace) or bare words
+TOKEN_PATTERN = re.compile(r"'(.*?)'(?=\s|$)|\"(.*?)\"(?=\s|$)|(\S+)", re.S)
+
+MISSING_VALUES = ('.', '?')
+
+# First line that no longer belongs to a loop: new item, loop, data block, comment or blank line
+# (anchored on the preceding newline, which lets the regex engine scan for it quickly)
+LOOP_END_PATTERN = re.compile(r"\n(?:_|loop_|data_|#|[ \t]*\r?\n)")
+
+
+def open_text(file_path):
+    """Opens a (optionally gzip-compressed) text file for reading."""
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rt')
+    return open(file_path, 'r')
+
+
+def tokenize(text):
+    """
+    Splits the data rows of a CIF loop into values.
+
+    Args:
+    text (str): Data rows of a loop.
+
+    Returns:
+    tokens (list): Values in reading order, with quotes removed.
+    """
+    if "'" not in text and '"' not in text:
+        return text.split()
+    return [quoted or double or bare for quoted, double, bare in TOKEN_PATTERN.findall(text)]
+
+
+def _numbers(values, dtype, default):
+    """Converts a list of CIF values to numbers; '?' and '.' become the default."""
+    try:
+        return np.array(values, dtype=dtype)
+    except ValueError:
+        values = np.array(values)
+        missing = np.isin(values, MISSING_VALUES)
+        result = np.full(len(values), default, dtype=dtype)
+        result[~missing] = values[~missing].astype(dtype)
+        return result
+
+
+def _text(values, dtype):
+    """Converts a list of CIF values to byte strings; '?' and '.' become empty strings."""
+    values = np.array(values, dtype=dtype)
+    values[np.isin(values, [value.encode() for value in MISSING_VALUES])] = b''
+    return values
+
+
+def atom_site_chunk(text, items):
+    """
+    Converts atom_site data rows into a structured atom array.
+
+    Args:
+    text (str): Whole data rows of the atom_site loop.
+    items (list): atom_site item names, in column order.
+
+    Returns:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+    """
+    tokens = tokenize(text)
+    n_items = len(items)
+    if len(tokens) % n_items:
+        raise ValueError(f"atom_site rows do not match its {n_items} columns")
+    position = {item: i for i, item in enumerate(items)}
+
+    def column(field):
+        # Every n_items-th token, as a plain list (no object array in between)
+        for item in ATOM_SITE_ITEMS[field]:
+            if item in position:
+                return tokens[position[item]::n_items]
+        return None
+
+    atoms = np.zeros(len(tokens) // n_items, dtype=ATOM_DTYPE)
+    atoms['occupancy'] = 1.0
+    atoms['model'] = 1
+    for axis, field in enumerate('xyz'):
+        atoms['coord'][:, axis] = _numbers(column(field), float, 0.0)
+
+    converters = {
+        'serial': lambda values: _numbers(values, np.int64, 0),
+        'resseq': lambda values: _numbers(values, np.int64, 0),
+        'model': lambda values: _numbers(values, np.int64, 1),
+        'occupancy': lambda values: _numbers(values, float, 1.0),
+        'bfactor': lambda values: _numbers(values, float, 0.0),
+        'hetatm': lambda values: np.array(values, dtype='U6') == 'HETATM',
+        'element': lambda values: np.char.upper(_text(values, 'S2')),
+    }
+    for field in ('hetatm', 'serial', 'name', 'altloc', 'resname', 'chain', 'resseq',
+                  'icode', 'occupancy', 'bfactor', 'element', 'model'):
+        values = column(field)
+        if values is None:
+            continue
+        if field in converters:
+            atoms[field] = converters[field](values)
+        else:
+            atoms[field] = _text(values, ATOM_DTYPE[field])
+
+    # Fill in elements that the file leaves blank
+    missing = atoms['element'] == b''
+    if missing.any():
+        atoms['element'][missing] = [guess_element(name) for name in decode_column(atoms['name'][missing])]
+    return atoms
+
+
+def iter_atom_site_chunks(file_path, chunk_size=1 << 24):
+    """
+    Streams the atom_site loop of an mmCIF file as structured atom arrays.
+
+    The header is read line by line; the data rows are then read in blocks of
+    chunk_size characters and cut at the last complete row, so the end of the
+    loop is found with one regular expression search per block.
+
+    Args:
+    file_path (str): Path to the mmCIF file (plain or .gz).
+    chunk_size (int): Approximate number of characters converted at a time (~80 per atom).
+
+    Yields:
+    atoms (np.array): Structured array with ATOM_DTYPE for one block of rows.
+    """
+    items = []
+    in_loop = False
+
+    with open_text(file_path) as f:
+        first_row = ''
+        for line in f:
+            if line.startswith('loop_'):
+                in_loop = True
+                items = []
+            elif in_loop and line.startswith('_atom_site.'):
+                items.append(line.split()[0][len('_atom_site.'):])
+            elif items:
+                # First line after the header is the first data row
+                first_row = line
+                break
+            else:
+                in_loop = in_loop and line.startswith('_')
+
+        if not items:
+            return
+
+        pending = first_row
+        while True:
+            block = f.read(chunk_size)
+            text = pending + block
+            # pending always starts a line; the leading newline lets its first line end the loop too
+            end = LOOP_END_PATTERN.search('\n' + text)
+            if end is not None or not block:
+                text = text[:end.start()] if end is not None else text
+                if text.strip():
+                    yield atom_site_chunk(text, items)
+                return
+            cut = text.rfind('\n') + 1
+            if cut:
+                yield atom_site_chunk(text[:cut], items)
+            pending = text[cut:]
+
+
+def read_cif_atoms(file_path, altloc=None, model=None, hetatm=False, chunk_size=1 << 24):
+    """
+    Reads all atoms of an mmCIF file, applying the selection chunk by chunk.
+
+    Args:
+    file_path (str): Path to the mmCIF file (plain or .gz).
+    altloc (str): Alternate location handling (see PDBparser.select_atoms).
+    model (int or str): Model handling (see PDBparser.select_atoms).
+    hetatm (bool): Whether HETATM records are kept.
+    chunk_size (int): Approximate number of characters converted at a time.
+
+    Returns:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+    """
+    chunks = []
+    for chunk in iter_atom_site_chunks(file_path, chunk_size):
+        # Resolve 'first' once so later chunks keep the same model
+        if model == 'first' and len(chunk):
+            model = int(chunk['model'][0])
+        chunks.append(select_atoms(chunk, None, model, hetatm))
+
+    atoms = np.concatenate(chunks) if chunks else np.zeros(0, dtype=ATOM_DTYPE)
+
+    # Alternate locations of one atom may straddle chunks, so select them at the end
+    return select_atoms(atoms, altloc, None, True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python CIFparser.py <CIF_FILE>")
+        sys.exit(1)
+
+    cif_atoms = read_cif_atoms(sys.argv[1])
+    print(f"Parsed {len(cif_atoms)} atoms.")
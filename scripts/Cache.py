@@ -0,0 +1,356 @@
+"""
+Cache.py
+
+Content-addressed cache of pipeline stage results (parse, accessibility, surface, pockets).
+
+Every stage result is stored under a key that hashes the key of the stage it was computed
+from, the stage parameters and the source code of the modules implementing the stage. The
+first key hashes the input file content, so renaming or copying a structure still hits the
+cache, while editing a file, a parameter or a stage's code produces new keys for that stage
+and every stage downstream of it. Changing a DBSCAN eps therefore only recomputes pockets
+and scoring; parsing, accessibility and the surface are reused.
+
+Entries are artifact folders (see Artifacts.py) under <cache_dir>/<stage>/<key>/. Reading an
+entry marks it as recently used; when the cache grows beyond its size limit, the least
+recently used entries are evicted. The cache size is listed once per StageCache and then
+kept as a running total, so storing an entry does not walk the whole cache.
+
+Functions / classes:
+- StageCache(cache_dir, max_bytes): key(), load(), store(), entries(), summary(), purge(), evict().
+- file_digest(file_path): SHA-256 of a file's content.
+
+Usage:
+    python Cache.py <CACHE_DIR> info
+    python Cache.py <CACHE_DIR> purge [STAGE]
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+import Artifacts
+
+# Bumped whenever the way stage results are stored changes
+CACHE_VERSION = 2
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Eviction frees the cache down to this fraction of its limit, so the next full listing
+# only happens after another tenth of the limit has been stored
+EVICT_TARGET = 0.9
+
+# Modules whose source code determines each stage result (Pipeline chooses how every stage is called)
+STAGE_MODULES = {
+    'parse': ('Pipeline', 'PDBparser', 'CIFparser'),
+    'accessibility': ('Pipeline', 'PDBparser', 'Triage', 'PockGrid'),
+    'surface': ('Pipeline', 'SurfAnal', 'Tiling'),
+    'pockets': ('Pipeline', 'PockDet', 'PockGrid', 'Tiling', 'Residues'),
+}
+
+_CODE_VERSIONS = {}
+_FILE_DIGESTS = {}
+
+
+def file_digest(file_path):
+    """
+    Returns the SHA-256 digest of a file's content (memoized on path, size and modification time).
+
+    Args:
+    file_path (str): Path to the file.
+
+    Returns:
+    digest (str): Hexadecimal digest.
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _FILE_DIGESTS:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _FILE_DIGESTS[memo_key] = digest.hexdigest()
+    return _FILE_DIGESTS[memo_key]
+
+
+def code_version(stage):
+    """Returns a digest of the source files of the modules implementing a stage."""
+    if stage not in _CODE_VERSIONS:
+        digest = hashlib.sha256(str(CACHE_VERSION).encode())
+        for module in STAGE_MODULES[stage]:
+            spec = importlib.util.find_spec(module)
+            if spec is not None and spec.origin:
+                digest.update(file_digest(spec.origin).encode())
+        _CODE_VERSIONS[stage] = digest.hexdigest()
+    return _CODE_VERSIONS[stage]
+
+
+def folder_bytes(path):
+    """Returns the total size of the files in a folder (not recursive)."""
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+# Conversions between stage results and artifact columns
+
+def encode_parse(atoms, residues):
+    """Parsed atoms and residues -> columns."""
+    columns = {name: atoms[name] for name in atoms.dtype.names}
+    columns['residue_key'] = np.array(list(residues), dtype=str)
+    columns['residue_type'] = np.array(list(residues.values()), dtype=str)
+    return columns, {'atom_fields': list(atoms.dtype.names)}
+
+
+def decode_parse(columns, meta):
+    """Columns -> (atoms structured array, residues dict)."""
+    atoms = Artifacts.parsed_atoms(dict(columns, atom_fields=meta['atom_fields']))
+    residues = dict(zip(columns['residue_key'].tolist(), columns['residue_type'].tolist()))
+    return atoms, residues
+
+
+def encode_accessibility(accessibility, residue_sasa):
+    """Accessibility array and residue SASA -> columns."""
+    columns = {'accessibility': np.asarray(accessibility, dtype=float)}
+    if residue_sasa is not None:
+        columns['residue_key'] = np.array(list(residue_sasa), dtype=str)
+        columns['residue_sasa'] = np.array(list(residue_sasa.values()), dtype=float)
+    return columns, {}
+
+
+def decode_accessibility(columns, meta):
+    """Columns -> (accessibility array, residue SASA or None)."""
+    residue_sasa = None
+    if 'residue_sasa' in columns:
+        residue_sasa = dict(zip(columns['residue_key'].tolist(), columns['residue_sasa'].tolist()))
+    return np.array(columns['accessibility']), residue_sasa
+
+
+def encode_surface(surface_points, surface_properties, facets):
+    """Surface points, properties and facets -> columns; a missing surface is stored as empty."""
+    if surface_points is None:
+        return {}, {'empty': True}
+    columns = {'surface_points': np.asarray(surface_points, dtype=float).reshape(-1, 3),
+               'surface_facets': np.asarray(facets, dtype=np.int64).reshape(-1, 3)}
+    for key, values in surface_properties.items():
+        columns['property_' + key] = np.asarray(values)
+    return columns, {'properties': list(surface_properties)}
+
+
+def decode_surface(columns, meta):
+    """Columns -> (surface points, surface properties, facets), or (None, None, None)."""
+    if meta.get('empty'):
+        return None, None, None
+    properties = {key: np.array(columns['property_' + key]) for key in meta['properties']}
+    return np.array(columns['surface_points']), properties, np.array(columns['surface_facets'])
+
+
+def encode_pockets(pockets):
+    """Pocket dicts -> columns."""
+    return Artifacts.records_to_columns(pockets), {}
+
+
+def decode_pockets(columns, meta):
+    """Columns -> pocket dicts."""
+    return Artifacts.columns_to_records(columns)
+
+
+STAGE_CODECS = {
+    'parse': (encode_parse, decode_parse),
+    'accessibility': (encode_accessibility, decode_accessibility),
+    'surface': (encode_surface, decode_surface),
+    'pockets': (encode_pockets, decode_pockets),
+}
+
+
+class StageCache:
+    """
+    Size-bounded, content-addressed store of stage results.
+
+    Args:
+    cache_dir (str): Cache folder (created if missing).
+    max_bytes (int): Size limit; least recently used entries are evicted beyond it.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Running cache size, listed on the first store; entries added by other processes
+        # are only counted at the next full listing (when this total exceeds the limit)
+        self._bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, stage, upstream, **params):
+        """
+        Builds the key of a stage result.
+
+        Args:
+        stage (str): Stage name (a key of STAGE_MODULES).
+        upstream (str): Key of the stage result this one is computed from, or the input file digest.
+        **params: Parameters of the stage.
+
+        Returns:
+        key (str): Hexadecimal key.
+        """
+        description = json.dumps({'stage': stage, 'upstream': upstream, 'params': params,
+                                  'code': code_version(stage)}, sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def path(self, stage, key):
+        """Returns the folder of an entry."""
+        return os.path.join(self.cache_dir, stage, key)
+
+    def load(self, stage, key):
+        """
+        Returns a cached stage result, or None on a miss.
+
+        Args:
+        stage (str): Stage name.
+        key (str): Entry key from key().
+
+        Returns:
+        value (tuple or list): Stage result as returned by the stage, or None.
+        """
+        path = self.path(stage, key)
+        if not Artifacts.is_artifact(path):
+            return None
+        try:
+            columns, meta = Artifacts.load_arrays(path)
+            value = STAGE_CODECS[stage][1](columns, meta)
+            os.utime(os.path.join(path, Artifacts.META_FILE))
+        except (OSError, ValueError, KeyError):
+            # Entry evicted or left incomplete by another process
+            return None
+        return value
+
+    def store(self, stage, key, *value):
+        """
+        Stores a stage result and evicts old entries if the running cache size is over its limit.
+
+        Args:
+        stage (str): Stage name.
+        key (str): Entry key from key().
+        *value: Stage result, as passed to the stage's encoder.
+        """
+        columns, meta = STAGE_CODECS[stage][0](*value)
+        path = self.path(stage, key)
+        # Written aside and renamed, so concurrent workers never see half an entry
+        temporary = f"{path}.tmp-{os.getpid()}"
+        Artifacts.save_arrays(temporary, columns, dict(meta, stage=stage, key=key))
+        try:
+            os.rename(temporary, path)
+        except OSError:
+            # Already stored by another process
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+
+        if self._bytes is None:
+            self._bytes = self.summary()['bytes']
+        else:
+            self._bytes += folder_bytes(path)
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """
+        Lists the cache entries.
+
+        Returns:
+        entries (list): Dicts with 'stage', 'key', 'path', 'bytes' and 'last_used' (epoch seconds).
+        """
+        entries = []
+        for stage in sorted(STAGE_CODECS):
+            stage_dir = os.path.join(self.cache_dir, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            for key in os.listdir(stage_dir):
+                path = os.path.join(stage_dir, key)
+                if '.tmp-' in key or not Artifacts.is_artifact(path):
+                    continue
+                try:
+                    entries.append({
+                        'stage': stage,
+                        'key': key,
+                        'path': path,
+                        'bytes': folder_bytes(path),
+                        'last_used': os.path.getmtime(os.path.join(path, Artifacts.META_FILE)),
+                    })
+                except OSError:
+                    continue
+        return entries
+
+    def summary(self):
+        """
+        Summarizes the cache content.
+
+        Returns:
+        summary (dict): {'stages': {stage: {'entries': n, 'bytes': b}}, 'entries': n, 'bytes': b, 'max_bytes': m}.
+        """
+        stages = {}
+        for entry in self.entries():
+            stats = stages.setdefault(entry['stage'], {'entries': 0, 'bytes': 0})
+            stats['entries'] += 1
+            stats['bytes'] += entry['bytes']
+        return {
+            'stages': stages,
+            'entries': sum(stats['entries'] for stats in stages.values()),
+            'bytes': sum(stats['bytes'] for stats in stages.values()),
+            'max_bytes': self.max_bytes,
+        }
+
+    def purge(self, stage=None, older_than=None):
+        """
+        Removes cache entries.
+
+        Args:
+        stage (str): Only remove entries of this stage (default: all stages).
+        older_than (float): Only remove entries not used for this many seconds.
+
+        Returns:
+        removed (int): Number of removed entries.
+        """
+        now = time.time()
+        removed = 0
+        for entry in self.entries():
+            if stage is not None and entry['stage'] != stage:
+                continue
+            if older_than is not None and now - entry['last_used'] < older_than:
+                continue
+            shutil.rmtree(entry['path'], ignore_errors=True)
+            removed += 1
+        self._bytes = None
+        return removed
+
+    def evict(self):
+        """Removes least recently used entries until the cache is under EVICT_TARGET of its size limit."""
+        entries = self.entries()
+        total = sum(entry['bytes'] for entry in entries)
+        for entry in sorted(entries, key=lambda entry: entry['last_used']):
+            if total <= EVICT_TARGET * self.max_bytes:
+                break
+            shutil.rmtree(entry['path'], ignore_errors=True)
+            total -= entry['bytes']
+        self._bytes = total
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[2] not in ('info', 'purge'):
+        print(__doc__)
+        sys.exit(1)
+
+    cache = StageCache(sys.argv[1])
+    if sys.argv[2] == 'info':
+        summary = cache.summary()
+        for stage, stats in sorted(summary['stages'].items()):
+            print(f"{stage:<14} {stats['entries']:>6} entries {stats['bytes'] / 1e6:>10.1f} MB")
+        print(f"{'total':<14} {summary['entries']:>6} entries {summary['bytes'] / 1e6:>10.1f} MB")
+    else:
+        stage = sys.argv[3] if len(sys.argv) > 3 else None
+        print(f"Removed {cache.purge(stage)} cache entries.")
+
+
+if __name__ == '__main__':
+    main()
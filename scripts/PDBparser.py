@@ -1,49 +1,474 @@
 import numpy as np
 import os
 import sys
+import gzip
 import json
 
-def parse_pdb(file_path):
+import Artifacts
+import Parallel
+
+# Van der Waals radii (Å, Bondi 1964) used for the solvent accessible surface
+ELEMENT_RADII = {
+    'H': 1.20,
+    'C': 1.70,
+    'N': 1.55,
+    'O': 1.52,
+    'S': 1.80,
+    'P': 1.80,
+    'SE': 1.90,
+}
+DEFAULT_RADIUS = 1.80
+
+# One row per atom; every PDB/mmCIF reader in the pipeline produces this layout.
+# Text fields are ASCII byte strings (one byte per character, as in the file)
+ATOM_DTYPE = np.dtype([
+    ('hetatm', '?'),
+    ('serial', 'i4'),
+    ('name', 'S4'),
+    ('altloc', 'S1'),
+    ('resname', 'S5'),
+    ('chain', 'S4'),
+    ('resseq', 'i4'),
+    ('icode', 'S1'),
+    ('coord', 'f8', (3,)),
+    ('occupancy', 'f4'),
+    ('bfactor', 'f4'),
+    ('element', 'S2'),
+    ('model', 'i4'),
+])
+
+# Fixed PDB columns (start, end) of the ATOM/HETATM fields
+PDB_COLUMNS = {
+    'serial': (6, 11),
+    'name': (12, 16),
+    'altloc': (16, 17),
+    'resname': (17, 20),
+    'chain': (21, 22),
+    'resseq': (22, 26),
+    'icode': (26, 27),
+    'x': (30, 38),
+    'y': (38, 46),
+    'z': (46, 54),
+    'occupancy': (54, 60),
+    'bfactor': (60, 66),
+    'element': (76, 78),
+}
+
+# Bytes scanned at a time when looking for line breaks (bounds the temporary mask)
+SCAN_BLOCK = 1 << 20
+
+# Atom records converted at a time (bounds the temporary field arrays)
+RECORD_BLOCK = 1 << 15
+
+def read_file_bytes(file_path):
     """
-    Reads a PDB file and extracts atomic positions and residue data.
+    Reads a whole (optionally gzip-compressed) file into memory.
 
     Args:
-    file_path (str): Path to the PDB file.
+    file_path (str): Path to the file; names ending in '.gz' are decompressed.
 
     Returns:
-    atoms (list): List of atoms with (x, y, z) coordinates.
-    residues (dict): Dictionary of residues {res_id: res_type}.
+    data (bytes): File content.
     """
-    if not os.path.exists(file_path):
-        print(f"Error: File '{file_path}' not found.")
-        sys.exit(1)
+    if file_path.endswith('.gz'):
+        with gzip.open(file_path, 'rb') as f:
+            return f.read()
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+def decode_column(values):
+    """Decodes an ATOM_DTYPE text column (e.g. atoms['name']) into a list of str."""
+    return [value.decode() for value in np.asarray(values).tolist()]
+
+def _line_bounds(data):
+    """
+    Locates the lines of a text buffer without splitting it.
+
+    Args:
+    data (bytes): File content.
+
+    Returns:
+    buffer (np.array): uint8 view of the content (no copy).
+    starts (np.array): Offset of the first character of every line.
+    ends (np.array): Offset just past the last character of every line, line breaks excluded.
+    """
+    if b'\n' not in data and b'\r' in data:
+        data = data.replace(b'\r', b'\n')
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    breaks = [np.flatnonzero(buffer[offset:offset + SCAN_BLOCK] == ord('\n')) + offset
+              for offset in range(0, len(buffer), SCAN_BLOCK)]
+    ends = np.concatenate(breaks + [[len(buffer)]]).astype(np.int64)
+    starts = np.zeros_like(ends)
+    starts[1:] = ends[:-1] + 1
+
+    # Windows line endings
+    crlf = np.flatnonzero(ends > starts)
+    ends[crlf[buffer[ends[crlf] - 1] == ord('\r')]] -= 1
+    return buffer, starts, ends
+
+def _field(buffer, starts, ends, start, end):
+    """
+    Gathers the characters start:end of the given lines into a byte matrix.
+
+    Each line's field is copied as one fixed-width string from a sliding-window
+    view of the buffer. Characters past the end of a short line are returned as
+    spaces, as if every line were padded to the full record width.
+
+    Returns:
+    field (np.array): uint8 array of shape (lines, end - start), column-major.
+    """
+    width = end - start
+    offsets = starts + start
+    overflow = offsets > len(buffer) - width
+    if len(buffer) >= width:
+        windows = np.ndarray((len(buffer) - width + 1,), dtype=f'S{width}', buffer=buffer, strides=(1,))
+        field = windows[np.where(overflow, 0, offsets)].view(np.uint8).reshape(len(starts), width)
+    else:
+        field = np.full((len(starts), width), ord(' '), dtype=np.uint8)
+
+    # Blank what the gather read beyond the end of short lines
+    short = np.flatnonzero(ends - starts < end)
+    if len(short):
+        rows = field[short]
+        rows[np.arange(start, end) >= (ends - starts)[short, None]] = ord(' ')
+        field[short] = rows
+    for row in np.flatnonzero(overflow):
+        line = buffer[offsets[row]:ends[row]]
+        field[row] = ord(' ')
+        field[row, :len(line)] = line
+
+    # Column-major, so every character position (and row-wise reduction) is a contiguous run
+    return np.asfortranarray(field)
+
+def _parse_fixed_point(field, decimals):
+    """
+    Converts fixed-width numeric text (e.g. '%8.3f' coordinates) with array arithmetic.
+
+    Args:
+    field (np.array): uint8 array of shape (rows, width) holding the characters.
+    decimals (int): Digits after the decimal point (0 for integers).
+
+    Returns:
+    values (np.array): Parsed numbers (float when decimals > 0, otherwise int).
+    readable (np.array): Rows in the expected format; other rows hold 0 and need a slower parse.
+    """
+    width = field.shape[1]
+    digits = field - np.uint8(ord('0'))
+    is_digit = digits < 10
+    is_minus = field == ord('-')
+    unexpected = ~is_digit & ~is_minus & (field != ord(' '))
+
+    # Place value of every digit, skipping the decimal point
+    position = np.arange(width)
+    powers = width - 1 - position
+    weights = 10.0 ** powers
+    if decimals:
+        point = width - decimals - 1
+        unexpected[:, point] = field[:, point] != ord('.')
+        weights = np.where(position == point, 0.0, 10.0 ** (powers - (position < point)))
+
+    # Accumulated column by column so no (rows, width) float array is needed
+    digits[~is_digit] = 0
+    values = np.zeros(len(field))
+    for column in np.flatnonzero(weights):
+        values += digits[:, column] * weights[column]
+
+    readable = ~unexpected.any(axis=1) & is_digit.any(axis=1)
+    values[is_minus.any(axis=1)] *= -1
+    values[~readable] = 0
+    if decimals:
+        return values / 10 ** decimals, readable
+    return values.astype(np.int64), readable
+
+def _numeric_column(field, dtype, default, decimals=0):
+    """Converts a fixed-width numeric field; blank or unreadable fields get the default value."""
+    values, readable = _parse_fixed_point(field, decimals)
+    values = values.astype(dtype)
+    for i in np.flatnonzero(~readable):
+        try:
+            values[i] = dtype(field[i].tobytes())
+        except ValueError:
+            values[i] = default
+    return values
+
+def _text_column(field, dtype, upper=False):
+    """Converts a fixed-width field to stripped byte strings, stripping each distinct value once."""
+    # Pack the field bytes into one integer so distinct values are found without string sorting
+    codes = np.zeros(len(field), dtype=np.uint64)
+    for column in range(field.shape[1]):
+        codes = codes * np.uint64(256) + field[:, column]
+    _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    unique = np.char.strip(np.ascontiguousarray(field[first]).view(f'S{field.shape[1]}').ravel())
+    if upper:
+        unique = np.char.upper(unique)
+    return unique.astype(dtype)[inverse.ravel()]
+
+def _coordinates(buffer, starts, ends):
+    """Converts the x, y and z fields of the given lines; returns the coordinates and the readable rows."""
+    coords = np.empty((len(starts), 3))
+    readable = np.ones(len(starts), dtype=bool)
+    for axis, name in enumerate('xyz'):
+        coords[:, axis], ok = _parse_fixed_point(_field(buffer, starts, ends, *PDB_COLUMNS[name]), 3)
+        readable &= ok
+    return coords, readable
+
+def _read_records(buffer, starts, ends, atoms):
+    """
+    Converts the fields of a block of ATOM/HETATM lines into rows of a structured array.
+
+    Args:
+    buffer (np.array): uint8 view of the file content.
+    starts (np.array): Offset of every record line.
+    ends (np.array): End offset of every record line.
+    atoms (np.array): ATOM_DTYPE rows to fill, one per line (written in place).
+
+    Returns:
+    valid (np.array): Lines whose coordinates and residue number could be read.
+    """
+    def field(name):
+        return _field(buffer, starts, ends, *PDB_COLUMNS[name])
+
+    coords, readable = _coordinates(buffer, starts, ends)
+    resseq, ok = _parse_fixed_point(field('resseq'), 0)
+    readable &= ok
+
+    # Lines in an unusual layout are read one by one; unreadable ones are reported and skipped
+    valid = np.ones(len(starts), dtype=bool)
+    for i in np.flatnonzero(~readable):
+        row = buffer[starts[i]:ends[i]].tobytes()
+        try:
+            coords[i] = [float(row[30:38]), float(row[38:46]), float(row[46:54])]
+            resseq[i] = int(row[22:26])
+        except ValueError as e:
+            valid[i] = False
+            print(f"Warning: Could not parse line: {row.decode(errors='replace').strip()} - {e}")
+
+    atoms['serial'] = _numeric_column(field('serial'), int, 0)
+    atoms['name'] = _text_column(field('name'), 'S4')
+    atoms['altloc'] = _text_column(field('altloc'), 'S1')
+    atoms['resname'] = _text_column(field('resname'), 'S5')
+    atoms['chain'] = _text_column(field('chain'), 'S4')
+    atoms['resseq'] = resseq
+    atoms['icode'] = _text_column(field('icode'), 'S1')
+    atoms['coord'] = coords
+    atoms['occupancy'] = _numeric_column(field('occupancy'), float, 1.0, decimals=2)
+    atoms['bfactor'] = _numeric_column(field('bfactor'), float, 0.0, decimals=2)
+    atoms['element'] = _text_column(field('element'), 'S2', upper=True)
+    return valid
+
+def read_pdb_atoms(data):
+    """
+    Parses the ATOM and HETATM records of PDB-formatted text in bulk.
 
-    atoms = []
-    residues = {}
+    Line breaks are located in the raw buffer and record lines are picked by their
+    first six characters. Every field is then gathered from the buffer and
+    converted as a whole column, one block of records at a time, straight into
+    the atom array. Lines whose coordinates or residue number cannot be read are
+    reported and skipped.
 
-    with open(file_path, 'r') as f:
-        for line in f:
-            if line.startswith('ATOM'):
-                try:
-                    # Extract atomic coordinates
-                    x = float(line[30:38])
-                    y = float(line[38:46])
-                    z = float(line[46:54])
-                    atom_name = line[12:16].strip()  # Atom name (optional for future use)
+    Args:
+    data (bytes): Content of a PDB file.
+
+    Returns:
+    atoms (np.array): Structured array with ATOM_DTYPE, one row per atom record.
+    """
+    buffer, starts, ends = _line_bounds(data)
+    heads = np.ascontiguousarray(_field(buffer, starts, ends, 0, 6)).view('S6').ravel()
+    is_hetatm = heads == b'HETATM'
+    is_model = heads == b'MODEL '
+    selected = np.flatnonzero((heads == b'ATOM  ') | is_hetatm)
+
+    # MODEL serial of the block each line belongs to (1 before any MODEL record)
+    model_serials = np.ones(is_model.sum() + 1, dtype=np.int32)
+    for i, line in enumerate(np.flatnonzero(is_model)):
+        serial = buffer[starts[line]:ends[line]].tobytes()[10:14]
+        if serial.strip():
+            model_serials[i + 1] = int(serial)
+
+    atoms = np.zeros(len(selected), dtype=ATOM_DTYPE)
+    atoms['hetatm'] = is_hetatm[selected]
+    atoms['model'] = model_serials[np.cumsum(is_model)[selected]]
+    starts, ends = starts[selected], ends[selected]
+    valid = np.ones(len(selected), dtype=bool)
+    for block in range(0, len(selected), RECORD_BLOCK):
+        rows = slice(block, block + RECORD_BLOCK)
+        valid[rows] = _read_records(buffer, starts[rows], ends[rows], atoms[rows])
+    if not valid.all():
+        atoms = atoms[valid]
+
+    # Older files leave the element column blank
+    missing = atoms['element'] == b''
+    if missing.any():
+        names, inverse = np.unique(atoms['name'][missing], return_inverse=True)
+        guessed = np.array([guess_element(name) for name in decode_column(names)], dtype='S2')
+        atoms['element'][missing] = guessed[inverse]
+
+    return atoms
+
+def read_pdb_coords(data):
+    """
+    Parses only the coordinates of the ATOM and HETATM records of PDB-formatted text.
+
+    Used for the frames of a trajectory, whose atom names and residues are read once
+    (see Trajectory.py): no text column is decoded.
+
+    Args:
+    data (bytes): PDB-formatted text, e.g. one MODEL block.
 
-                    # Append atom information
-                    atoms.append((atom_name, x, y, z))
+    Returns:
+    coords (np.array): Coordinates with shape (N, 3), one row per atom record.
+
+    Raises:
+    ValueError: If the coordinates of a record cannot be read.
+    """
+    buffer, starts, ends = _line_bounds(data)
+    heads = np.ascontiguousarray(_field(buffer, starts, ends, 0, 6)).view('S6').ravel()
+    selected = np.flatnonzero((heads == b'ATOM  ') | (heads == b'HETATM'))
+    line_starts, line_ends = starts[selected], ends[selected]
 
-                    # Extract residue data
-                    res_id = int(line[22:26].strip())
-                    res_type = line[17:20].strip()
+    coords, readable = _coordinates(buffer, line_starts, line_ends)
+    for i in np.flatnonzero(~readable):
+        row = buffer[line_starts[i]:line_ends[i]].tobytes()
+        coords[i] = [float(row[30:38]), float(row[38:46]), float(row[46:54])]
+    return coords
 
-                    # Store residue info uniquely (avoids duplicates)
-                    if res_id not in residues:
-                        residues[res_id] = res_type
+def select_atoms(atoms, altloc=None, model=None, hetatm=False):
+    """
+    Selects atoms by record type, model and alternate location.
 
-                except ValueError as e:
-                    print(f"Warning: Could not parse line: {line.strip()} - {e}")
+    Args:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+    altloc (str): None keeps every alternate location, 'first' keeps the first
+        location listed for each atom, and a letter (e.g. 'A') keeps that location.
+        Atoms without an alternate location are always kept.
+    model (int or str): None keeps every model, 'first' keeps the first model,
+        and an integer keeps the model with that serial number.
+    hetatm (bool): Whether HETATM records (ligands, ions, water) are kept.
+
+    Returns:
+    atoms (np.array): The selected atoms.
+    """
+    return atoms[selection_mask(atoms, altloc, model, hetatm)]
+
+def selection_mask(atoms, altloc=None, model=None, hetatm=False):
+    """Returns the boolean row mask of select_atoms (same arguments), e.g. to apply one selection to many frames."""
+    keep = np.ones(len(atoms), dtype=bool)
+    if not hetatm:
+        keep &= ~atoms['hetatm']
+    if model == 'first':
+        keep &= atoms['model'] == (atoms['model'][0] if len(atoms) else 0)
+    elif model is not None:
+        keep &= atoms['model'] == int(model)
+
+    if altloc == 'first':
+        # First row of every (model, chain, residue, atom name) among alternate locations
+        alternates = np.flatnonzero(keep & (atoms['altloc'] != b''))
+        keys = atoms[['model', 'chain', 'resseq', 'icode', 'name']][alternates]
+        _, first = np.unique(keys, return_index=True)
+        keep[alternates] = False
+        keep[alternates[first]] = True
+    elif altloc is not None:
+        keep &= (atoms['altloc'] == b'') | (atoms['altloc'] == altloc.encode())
+
+    return keep
+
+def residue_index(atoms):
+    """
+    Groups atoms into chain-aware residues.
+
+    Residue keys have the form '<chain>:<resseq><icode>', e.g. 'A:57' or 'H:100A'.
+
+    Args:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+
+    Returns:
+    keys (np.array): Residue keys in file order.
+    first (np.array): Index of the first atom of each residue.
+    inverse (np.array): Residue number (position in keys) of every atom.
+    """
+    chain, resseq, icode = atoms['chain'], atoms['resseq'], atoms['icode']
+
+    # Atoms of a residue are normally consecutive, so only the runs need to be grouped
+    starts = np.ones(len(atoms), dtype=bool)
+    starts[1:] = (chain[1:] != chain[:-1]) | (resseq[1:] != resseq[:-1]) | (icode[1:] != icode[:-1])
+    run_first = np.flatnonzero(starts)
+    _, first, inverse = np.unique(atoms[['chain', 'resseq', 'icode']][run_first],
+                                  return_index=True, return_inverse=True)
+    first = run_first[first]
+    inverse = inverse.ravel()[np.cumsum(starts) - 1]
+
+    # Renumber residues by their first appearance in the file
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    first = first[order]
+
+    keys = [f"{chain}:{resseq}{icode}" for chain, resseq, icode in
+            zip(decode_column(atoms['chain'][first]), atoms['resseq'][first].tolist(),
+                decode_column(atoms['icode'][first]))]
+    return np.array(keys, dtype=str), first, rank[inverse.ravel()]
+
+def residue_keys(atoms):
+    """
+    Returns the chain-aware residue key of every atom (see residue_index).
+
+    Args:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+
+    Returns:
+    keys (np.array): Residue key of every atom.
+    """
+    keys, _, inverse = residue_index(atoms)
+    return keys[inverse]
+
+def residue_table(atoms):
+    """
+    Lists the residues of a structure in file order.
+
+    Args:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+
+    Returns:
+    residues (dict): Dictionary of residues {residue_key: res_type}.
+    """
+    keys, first, _ = residue_index(atoms)
+    return dict(zip(keys.tolist(), decode_column(atoms['resname'][first])))
+
+def is_cif(file_path):
+    """Returns True for mmCIF file names (.cif, .mmcif, optionally .gz)."""
+    name = file_path[:-3] if file_path.endswith('.gz') else file_path
+    return name.lower().endswith(('.cif', '.mmcif'))
+
+def parse_pdb(file_path, altloc=None, model=None, hetatm=False):
+    """
+    Reads a PDB or mmCIF file (plain or .gz) and extracts atomic positions and residue data.
+
+    Files ending in .cif or .mmcif are streamed through CIFparser. The defaults keep
+    what earlier versions read: every ATOM record of every model and alternate
+    location, without HETATM records.
+
+    Args:
+    file_path (str): Path to the PDB or mmCIF file.
+    altloc (str): Alternate location handling (see select_atoms).
+    model (int or str): Model handling (see select_atoms).
+    hetatm (bool): Whether HETATM records are kept.
+
+    Returns:
+    atoms (np.array): Structured array with ATOM_DTYPE, one row per atom.
+    residues (dict): Dictionary of residues {residue_key: res_type}.
+
+    Raises:
+    FileNotFoundError: If the file does not exist.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File '{file_path}' not found.")
+
+    if is_cif(file_path):
+        import CIFparser
+        atoms = CIFparser.read_cif_atoms(file_path, altloc, model, hetatm)
+    else:
+        atoms = select_atoms(read_pdb_atoms(read_file_bytes(file_path)), altloc, model, hetatm)
+    residues = residue_table(atoms)
 
     # Debugging print statements
     print(f"Parsed {len(atoms)} atoms.")
@@ -51,73 +476,305 @@ def parse_pdb(file_path):
 
     return atoms, residues
 
-def compute_accessibility(atoms, cutoff=8.0, use_surface_approach=True, scale_factor=10.0, normalize=True):
+def count_neighbors(coords, cutoff=8.0, workers=1):
+    """
+    Counts, for every atom, the other atoms lying strictly closer than the cutoff.
+
+    Uses a KD-tree so the work scales with the number of neighbor pairs instead of
+    all N² atom pairs. Atoms whose count depends on a pair sitting right at the
+    cutoff are re-checked with the explicit Euclidean distance, so the counts match
+    a brute-force `dist < cutoff` comparison exactly.
+
+    Args:
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    cutoff (float): Distance threshold for considering neighbor atoms.
+    workers (int): Threads for the KD-tree queries (see Parallel.resolve_workers).
+
+    Returns:
+    counts (np.array): Number of neighbors per atom.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    if len(coords) == 0:
+        return np.zeros(0, dtype=int)
+
+    from scipy.spatial import cKDTree
+
+    tree = cKDTree(coords)
+    tol = 1e-6 * max(cutoff, 1.0)
+
+    # Counts include the atom itself, which always sits at distance zero
+    threads = Parallel.kdtree_workers(workers)
+    inner = tree.query_ball_point(coords, r=cutoff - tol, return_length=True, workers=threads)
+    outer = tree.query_ball_point(coords, r=cutoff + tol, return_length=True, workers=threads)
+    counts = np.asarray(inner, dtype=int) - 1
+
+    # Resolve atoms with a neighbor at (numerically) the cutoff distance
+    for i in np.nonzero(np.asarray(outer) != np.asarray(inner))[0]:
+        idx = np.asarray(tree.query_ball_point(coords[i], r=cutoff + tol), dtype=int)
+        idx = idx[idx != i]
+        diff = coords[i] - coords[idx]
+        dist = np.sqrt(diff[:, 0] ** 2 + diff[:, 1] ** 2 + diff[:, 2] ** 2)
+        counts[i] = int(np.count_nonzero(dist < cutoff))
+
+    return counts
+
+
+def guess_element(atom_name):
+    """
+    Guesses the chemical element of an atom from its PDB atom name.
+
+    Args:
+    atom_name (str): PDB atom name such as 'CA', 'OG1' or '1HB'.
+
+    Returns:
+    element (str): Element symbol in upper case.
+    """
+    letters = ''.join(c for c in atom_name.upper() if c.isalpha())
+    if letters[:2] == 'SE':
+        return 'SE'
+    return letters[:1]
+
+
+def sphere_points(n_points):
+    """
+    Generates evenly spread unit vectors on a sphere (golden spiral).
+
+    Args:
+    n_points (int): Number of test points per atom sphere.
+
+    Returns:
+    points (np.array): Unit vectors with shape (n_points, 3).
+    """
+    k = np.arange(n_points) + 0.5
+    phi = np.arccos(1 - 2 * k / n_points)
+    theta = np.pi * (1 + 5 ** 0.5) * k
+    return np.column_stack([np.cos(theta) * np.sin(phi),
+                            np.sin(theta) * np.sin(phi),
+                            np.cos(phi)])
+
+
+def compute_sasa(coords, radii, probe_radius=1.4, n_points=100, chunk_size=2000, workers=1):
+    """
+    Computes per-atom solvent accessible surface area with the Shrake-Rupley method.
+
+    Each atom is covered with test points on a sphere of radius (vdW + probe). A
+    point is buried when it falls inside the expanded sphere of any other atom;
+    buried points are found with batched KD-tree queries over blocks of atoms, which
+    run on a thread pool when workers > 1.
+
+    Args:
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    radii (np.array): Van der Waals radius per atom.
+    probe_radius (float): Radius of the solvent probe sphere.
+    n_points (int): Test points per atom; more points are slower but more accurate.
+    chunk_size (int): Number of atoms whose test points are queried together.
+    workers (int): Threads processing blocks of atoms (see Parallel.resolve_workers).
+
+    Returns:
+    sasa (np.array): Solvent accessible area per atom in Å².
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    expanded = np.asarray(radii, dtype=float) + probe_radius
+    n_atoms = len(coords)
+    if n_atoms == 0:
+        return np.zeros(0)
+
+    from scipy.spatial import cKDTree
+
+    unit = sphere_points(n_points)
+    tree = cKDTree(coords)
+    max_radius = expanded.max()
+    exposed = np.zeros(n_atoms)
+
+    def exposed_points(start, stop):
+        block = np.arange(start, stop)
+        points = (coords[block, None, :] + expanded[block, None, None] * unit[None]).reshape(-1, 3)
+        owner = np.repeat(block, n_points)
+        buried = np.zeros(len(points), dtype=bool)
+
+        # Query a fixed number of neighbors and widen it only for the points
+        # whose neighbor list was saturated
+        pending = np.arange(len(points))
+        k = min(4, n_atoms)
+        while len(pending) > 0:
+            dist, idx = tree.query(points[pending], k=k, distance_upper_bound=max_radius)
+            dist = dist.reshape(len(pending), -1)
+            idx = idx.reshape(len(pending), -1)
+            found = idx < n_atoms
+            safe_idx = np.where(found, idx, 0)
+            hits = found & (idx != owner[pending, None]) & (dist < expanded[safe_idx])
+            buried[pending] = hits.any(axis=1)
+
+            if k >= n_atoms:
+                break
+            saturated = found[:, -1] & ~buried[pending]
+            pending = pending[saturated]
+            k = min(2 * k, n_atoms)
+
+        exposed[block] = (~buried).reshape(len(block), n_points).sum(axis=1)
+
+    Parallel.map_blocks(exposed_points, n_atoms, chunk_size, workers)
+    return 4.0 * np.pi * expanded ** 2 * exposed / n_points
+
+
+def atom_radii(atoms):
+    """
+    Looks up the van der Waals radius of every atom from its element.
+
+    Args:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+
+    Returns:
+    radii (np.array): Radius per atom in Å.
+    """
+    elements, inverse = np.unique(atoms['element'], return_inverse=True)
+    table = np.array([ELEMENT_RADII.get(element, DEFAULT_RADIUS) for element in decode_column(elements)], dtype=float)
+    return table[inverse]
+
+
+def relative_sasa(sasa, radii, probe_radius=1.4):
+    """
+    Converts per-atom SASA into the exposed fraction of each expanded atom sphere.
+
+    Args:
+    sasa (np.array): Solvent accessible area per atom.
+    radii (np.array): Van der Waals radius per atom.
+    probe_radius (float): Radius of the solvent probe sphere.
+
+    Returns:
+    accessibility (dict): Relative accessibility (0-1) per atom index.
+    """
+    values = sasa / (4.0 * np.pi * (radii + probe_radius) ** 2)
+    return dict(enumerate(values.tolist()))
+
+
+def compute_residue_sasa(atom_sasa, res_ids):
+    """
+    Sums per-atom SASA into per-residue SASA.
+
+    Args:
+    atom_sasa (np.array): Solvent accessible area per atom.
+    res_ids (np.array): Residue key of every atom.
+
+    Returns:
+    residue_sasa (dict): Solvent accessible area per residue {res_id: area}, in file order.
+    """
+    keys, first, inverse = np.unique(np.asarray(res_ids), return_index=True, return_inverse=True)
+    totals = np.bincount(inverse, weights=atom_sasa, minlength=len(keys))
+    order = np.argsort(first)
+    return dict(zip(keys[order].tolist(), totals[order].tolist()))
+
+
+def compute_accessibility(atoms, cutoff=8.0, use_surface_approach=True, scale_factor=10.0, normalize=True,
+                          method='neighbor', probe_radius=1.4, n_points=100, workers=1):
     """
     Estimates solvent accessibility for residues using a distance-based approach.
 
     Args:
-    atoms (list): List of atoms with (x, y, z) coordinates.
+    atoms (np.array): Structured array with ATOM_DTYPE.
     cutoff (float): Distance threshold for considering neighbor atoms.
     use_surface_approach (bool): Whether to use a simple surface-exposure check.
     scale_factor (float): Scaling factor to adjust the accessibility values.
-    normalize (bool): Whether to normalize the accessibility values.
+    normalize (bool): Whether to normalize the accessibility values (neighbor method only).
+    method (str): 'neighbor' for the neighbor-count heuristic, 'sasa' for the
+        relative Shrake-Rupley SASA (exposed fraction of each atom sphere).
+    probe_radius (float): Solvent probe radius for the 'sasa' method.
+    n_points (int): Sphere test points per atom for the 'sasa' method.
+    workers (int): Threads for the neighbor and SASA kernels.
 
     Returns:
     accessibility (dict): Estimated solvent accessibility per atom index.
     """
-    accessibility = {}
-
-    for i, (atom_name, x1, y1, z1) in enumerate(atoms):
-        count = 0  # Count neighboring atoms
-        for j, (atom_name2, x2, y2, z2) in enumerate(atoms):
-            if i != j:
-                dist = np.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2 + (z1 - z2) ** 2)
-                if dist < cutoff:
-                    count += 1
-
-        # Surface-based approach (simple heuristic for surface atoms)
-        if use_surface_approach:
-            if count <= 2:
-                # Surface atoms have higher accessibility
-                accessibility[i] = scale_factor / (count + 1)
-            else:
-                # Interior atoms have lower accessibility
-                accessibility[i] = scale_factor / (count + 1)
-        else:
-            # Standard approach (no surface-exposure check)
-            accessibility[i] = scale_factor / (count + 1)
+    coords = atoms['coord']
+
+    if method == 'sasa':
+        radii = atom_radii(atoms)
+        sasa = compute_sasa(coords, radii, probe_radius, n_points, workers=workers)
+        accessibility = relative_sasa(sasa, radii, probe_radius)
+        print("Computed relative SASA for all atoms.")
+        return accessibility
+    elif method != 'neighbor':
+        raise ValueError(f"Unknown accessibility method: {method}")
+
+    counts = count_neighbors(coords, cutoff, workers)
+
+    # Surface and interior atoms currently share the same heuristic, so
+    # use_surface_approach does not change the result
+    values = scale_factor / (counts + 1)
 
     # Normalize accessibility values to a range of 0-1 if desired
-    if normalize:
-        max_access = max(accessibility.values())
-        min_access = min(accessibility.values())
-        range_access = max_access - min_access
+    if normalize and len(values) > 0:
+        min_access = values.min()
+        range_access = values.max() - min_access
 
         # Avoid division by zero
         if range_access > 0:
-            for i in accessibility:
-                accessibility[i] = (accessibility[i] - min_access) / range_access
+            values = (values - min_access) / range_access
+
+    accessibility = dict(enumerate(values.tolist()))
 
     print("Computed solvent accessibility for all atoms.")
     return accessibility
 
 
-def save_data_to_file(atoms, residues, accessibility, output_file):
+def analyze_accessibility(atoms, method='neighbor', n_points=100, probe_radius=1.4, workers=1):
     """
-    Saves parsed PDB data and solvent accessibility to a JSON file.
+    Computes per-atom accessibility and, for the SASA method, per-residue areas.
 
     Args:
-    atoms (list): List of atoms with (atom_name, x, y, z) coordinates.
-    residues (dict): Dictionary of residues {res_id: res_type}.
+    atoms (np.array): Structured array with ATOM_DTYPE.
+    method (str): 'neighbor' or 'sasa' (see compute_accessibility).
+    n_points (int): Sphere test points per atom for the 'sasa' method.
+    probe_radius (float): Solvent probe radius for the 'sasa' method.
+    workers (int): Threads for the neighbor and SASA kernels.
+
+    Returns:
     accessibility (dict): Solvent accessibility per atom index.
-    output_file (str): Path to the output JSON file.
+    residue_sasa (dict): Solvent accessible area per residue, or None for the neighbor method.
     """
+    if method != 'sasa':
+        return compute_accessibility(atoms, method=method, workers=workers), None
+
+    radii = atom_radii(atoms)
+    sasa = compute_sasa(atoms['coord'], radii, probe_radius, n_points, workers=workers)
+    accessibility = relative_sasa(sasa, radii, probe_radius)
+    residue_sasa = compute_residue_sasa(sasa, residue_keys(atoms))
+    print("Computed relative SASA for all atoms.")
+    return accessibility, residue_sasa
+
+
+def save_data_to_file(atoms, residues, accessibility, output_file, residue_sasa=None):
+    """
+    Saves parsed PDB data and solvent accessibility.
+
+    Paths ending in '.json' are written as JSON; any other path is written as a
+    binary artifact folder (see Artifacts.py).
+
+    Args:
+    atoms (np.array): Structured array with ATOM_DTYPE.
+    residues (dict): Dictionary of residues {residue_key: res_type}.
+    accessibility (dict or np.array): Solvent accessibility per atom index.
+    output_file (str): Path to the output JSON file or artifact folder.
+    residue_sasa (dict): Optional solvent accessible area per residue.
+    """
+    if not output_file.endswith('.json'):
+        Artifacts.save_parsed(output_file, atoms, residues, accessibility, residue_sasa)
+        return
+
+    if isinstance(accessibility, np.ndarray):
+        accessibility = dict(enumerate(accessibility.tolist()))
+
     # Prepare the data to be saved
     data = {
-        'atoms': [{'atom_name': atom[0], 'coordinates': atom[1:]} for atom in atoms],
+        'atoms': [{'atom_name': name, 'coordinates': coord, 'res_id': res_id, 'element': element}
+                  for name, coord, res_id, element in zip(decode_column(atoms['name']), atoms['coord'].tolist(),
+                                                          residue_keys(atoms).tolist(),
+                                                          decode_column(atoms['element']))],
         'residues': residues,
         'accessibility': accessibility
     }
+    if residue_sasa is not None:
+        data['residue_sasa'] = residue_sasa
 
     # Write the data to the JSON file
     with open(output_file, 'w') as f:
@@ -130,20 +787,26 @@ def main():
     Main function to parse a PDB file, compute solvent accessibility, and save data to a file.
     """
     if len(sys.argv) < 3:
-        print("Usage: python PDBparser.py <PDB_FILE> <OUTPUT_FILE>")
+        print("Usage: python PDBparser.py <PDB_FILE> <OUTPUT_FILE|OUTPUT_DIR> [neighbor|sasa] [N_POINTS]")
         sys.exit(1)
 
     file_path = sys.argv[1]
     output_file = sys.argv[2]
+    method = sys.argv[3] if len(sys.argv) > 3 else 'neighbor'
+    n_points = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+
+    if not os.path.exists(file_path):
+        print(f"Error: File '{file_path}' not found.")
+        sys.exit(1)
 
     # Parse PDB file
     atoms, residues = parse_pdb(file_path)
 
     # Compute solvent accessibility
-    accessibility = compute_accessibility(atoms)
+    accessibility, residue_sasa = analyze_accessibility(atoms, method, n_points)
 
     # Save the data to a file
-    save_data_to_file(atoms, residues, accessibility, output_file)
+    save_data_to_file(atoms, residues, accessibility, output_file, residue_sasa)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
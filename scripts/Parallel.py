@@ -0,0 +1,63 @@
+"""
+Parallel.py
+
+Block-parallel execution of the per-atom and per-point kernels inside one structure.
+
+The kernels (neighbor counts, SASA, hull depth, buriedness, curvature, enclosure) spend
+their time in numpy and scipy calls that release the GIL: KD-tree queries, matrix
+products and batched eigensolvers. Splitting their input into contiguous blocks and
+running the blocks on a thread pool therefore uses several cores without copying the
+coordinates into other processes. Every block writes a disjoint slice of the output, so
+results are identical to serial mode for any number of workers.
+
+KD-tree queries take the worker count directly (cKDTree's own workers argument).
+
+Functions:
+- resolve_workers(workers): Number of threads to use.
+- map_blocks(function, n_items, block_size, workers): Runs function(start, stop) over blocks.
+- kdtree_workers(workers): Worker count in the form cKDTree queries expect.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def resolve_workers(workers):
+    """
+    Returns the number of threads to use.
+
+    Args:
+    workers (int): Requested threads; None, 0 or a negative value means one per CPU.
+
+    Returns:
+    workers (int): At least 1.
+    """
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def map_blocks(function, n_items, block_size, workers=1):
+    """
+    Calls function(start, stop) for consecutive blocks of items, on a thread pool.
+
+    Args:
+    function (callable): Processes items start..stop-1 and returns anything.
+    n_items (int): Number of items.
+    block_size (int): Items per block.
+    workers (int): Threads (see resolve_workers); 1 runs the blocks in this thread.
+
+    Returns:
+    results (list): Return value of every block, in block order.
+    """
+    blocks = [(start, min(start + block_size, n_items)) for start in range(0, n_items, max(1, block_size))]
+    workers = min(resolve_workers(workers), len(blocks))
+    if workers <= 1:
+        return [function(start, stop) for start, stop in blocks]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda block: function(*block), blocks))
+
+
+def kdtree_workers(workers):
+    """Converts a worker count into cKDTree's workers argument (-1 means all CPUs)."""
+    return -1 if workers is None or workers <= 0 else int(workers)
@@ -0,0 +1,389 @@
+"""
+Pipeline.py
+
+Runs the full ligand binding site prediction pipeline inside a single Python process.
+
+Every stage (PDBparser, SurfAnal, PockDet, Scoring, Visualize) is called directly and
+hands its arrays to the next one, so the scientific stack is imported once and no
+intermediate has to be written to disk and read back. Intermediates are only written
+when requested, as binary artifact folders (see Artifacts.py) with optional JSON copies.
+With a stage cache (see Cache.py), parse, accessibility, surface and pocket results are
+reused across runs; only the stages downstream of a changed input, parameter or code
+are recomputed.
+
+Usage (from Python, with the scripts/ folder on sys.path):
+    from Pipeline import Pipeline
+
+    result = Pipeline(accessibility_method='sasa').run('protein.pdb', 'results/PROT')
+    top_pocket = result['scored'][0]
+"""
+
+import contextlib
+import os
+
+import numpy as np
+
+import PDBparser
+import Profiler
+import SurfAnal
+import PockDet
+import Residues
+import Scoring
+import Visualize
+
+
+class Pipeline:
+    """
+    In-process ligand binding site prediction pipeline.
+
+    Args:
+    altloc (str): Alternate location handling: None (keep all), 'first' or a letter.
+    model (int or str): Model handling: None (keep all), 'first' or a model serial number.
+    hetatm (bool): Whether HETATM records (ligands, ions, water) are kept.
+    accessibility_method (str): 'neighbor' (neighbor-count heuristic) or 'sasa' (Shrake-Rupley).
+    n_points (int): Sphere test points per atom for the 'sasa' method.
+    accessibility_threshold (float): Minimum accessibility of the atoms of a surface facet; 0 (default)
+        keeps the whole alpha-shape boundary, and the accessibility is then only computed for the
+        parsed intermediate.
+    alpha (float or str): Alpha-shape circumradius cutoff in Å (default: SurfAnal.SURFACE_ALPHA), or
+        'auto' for the smallest value keeping every atom.
+    engine (str): Pocket detection engine: 'dbscan' (clusters deep surface points, PockDet.py)
+        or 'grid' (LIGSITE-style buried solvent voxels, PockGrid.py).
+    grid_spacing (float): Voxel edge length in Å of the 'grid' engine and of pocket volume measurement.
+    min_psp (int): Minimum protein-solvent-protein events (out of 7) of a buried voxel for the 'grid' engine.
+    tile_size (float): Compute the surface and the 'dbscan' pockets in cubic tiles of this edge
+        length in Å (see Tiling.py), bounding memory on very large complexes; None (default)
+        processes the whole structure at once.
+    tile_overlap (float): Minimum halo of atoms around every tile in Å.
+    triage (bool): Run a residue-level pass first (see Triage.py) and only analyze the atoms
+        within triage_margin Å of its candidate concave regions at full resolution; faster,
+        but pockets away from the candidate regions are missed.
+    triage_margin (float): Distance in Å from a candidate region of the atoms analyzed; larger
+        margins recover more pockets for less speedup.
+    eps (float or str): DBSCAN neighborhood radius used to cluster pocket points, or 'auto'
+        to derive it from the surface point density.
+    min_samples (int): DBSCAN minimum number of points per core point.
+    min_size (int): Minimum number of points for a pocket to be kept.
+    min_depth (float): Minimum mean depth in Å below the convex hull for a pocket to be kept.
+    save_intermediates (bool): Whether to write parsed, surface and pocket data to the output folder.
+    export_json (bool): Whether intermediates are also written as JSON next to the binary artifacts.
+    plot (bool or str): Render the surface PCA/t-SNE plot to the output folder after all other
+        outputs are written: False (default), True, or 'background' to render it in a separate process.
+    cache (Cache.StageCache): Stage result cache; every stage is recomputed when None.
+    scoring_config (str): JSON file with scoring bins and weights (default: Scoring.DEFAULT_CONFIG).
+    top_k (int): Only keep the k best-ranked pockets (default: all).
+    profile (bool): Record wall time, CPU time, peak RSS and counters per stage (see Profiler.py)
+        and write them to profile.json in the output folder.
+    trace (bool): Also write the stage timeline as a Chrome trace (trace.json); implies profile.
+    threads (int): Threads for the neighbor, SASA, surface, depth and pocket kernels of one
+        structure (see Parallel.py); None uses every CPU. Results do not depend on it.
+    """
+
+    def __init__(self, altloc=None, model=None, hetatm=False, accessibility_method='neighbor', n_points=100,
+                 accessibility_threshold=0.0, alpha=SurfAnal.SURFACE_ALPHA, engine='dbscan', grid_spacing=1.0,
+                 min_psp=5, tile_size=None, tile_overlap=12.0, triage=False, triage_margin=10.0, eps=2.0,
+                 min_samples=3, min_size=PockDet.MIN_POCKET_SIZE, min_depth=PockDet.MIN_POCKET_DEPTH,
+                 save_intermediates=True, export_json=False, plot=False, cache=None, scoring_config=None, top_k=None,
+                 profile=False, trace=False, threads=1):
+        self.altloc = altloc
+        self.model = model
+        self.hetatm = hetatm
+        self.accessibility_method = accessibility_method
+        self.n_points = n_points
+        self.accessibility_threshold = accessibility_threshold
+        self.alpha = alpha
+        self.engine = engine
+        self.grid_spacing = grid_spacing
+        self.min_psp = min_psp
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.triage = triage
+        self.triage_margin = triage_margin
+        self._triage = None
+        self.eps = eps
+        self.min_samples = min_samples
+        self.min_size = min_size
+        self.min_depth = min_depth
+        self.save_intermediates = save_intermediates
+        self.export_json = export_json
+        self.plot = plot
+        self.cache = cache
+        self.scoring = Scoring.load_config(scoring_config)
+        self.top_k = top_k
+        self.profile = profile or trace
+        self.trace = trace
+        self.threads = threads
+
+    def parse(self, pdb_file):
+        """Parses the structure; returns (atoms structured array, residues)."""
+        return PDBparser.parse_pdb(pdb_file, self.altloc, self.model, self.hetatm)
+
+    def accessibility(self, atoms):
+        """Computes per-atom accessibility; returns (accessibility array, residue SASA or None)."""
+        if self.triage:
+            import Triage
+            core, context, _ = self.triage_atoms(atoms)
+            return Triage.triaged_accessibility(atoms, core, context, self.accessibility_method, self.n_points,
+                                                workers=self.threads)
+        accessibility, residue_sasa = PDBparser.analyze_accessibility(
+            atoms, self.accessibility_method, self.n_points, workers=self.threads)
+        values = np.array([accessibility[i] for i in range(len(atoms))], dtype=float)
+        return values, residue_sasa
+
+    def needs_accessibility(self):
+        """Whether the surface depends on the accessibility; with a threshold of 0 every facet is kept."""
+        return self.accessibility_threshold > 0
+
+    def triage_atoms(self, atoms):
+        """Runs the triage pass once per structure; returns (core mask, context mask, candidate points)."""
+        if self._triage is None or self._triage[0] is not atoms:
+            import Triage
+            with Profiler.section('triage'):
+                self._triage = (atoms,) + Triage.triage_atoms(atoms, self.triage_margin, workers=self.threads)
+        return self._triage[1:]
+
+    def surface(self, atoms, accessibility):
+        """Computes surface points, properties and facets; returns (None, None, None) when no surface exists."""
+        if self.tile_size:
+            import Tiling
+            return Tiling.compute_surface_tiled(atoms['coord'], accessibility, self.accessibility_threshold,
+                                               alpha=self.alpha, return_facets=True, tile_size=self.tile_size,
+                                               overlap=self.tile_overlap, workers=self.threads)
+        surface_atoms = self.triage_atoms(atoms)[0] if self.triage else None
+        return SurfAnal.compute_surface(atoms['coord'], accessibility, self.accessibility_threshold,
+                                        alpha=self.alpha, return_facets=True, workers=self.threads,
+                                        surface_atoms=surface_atoms)
+
+    def pockets(self, surface_points, surface_properties, atoms=None):
+        """Detects, annotates (lining residues, see Residues.py) and filters pockets with the selected engine."""
+        surface_data = {'surface_points': surface_points, 'surface_properties': surface_properties}
+        if self.engine == 'grid':
+            import PockGrid
+            if self.tile_size:
+                print("Note: the grid engine maps the whole structure; tiling only applies to the surface.")
+            grid_atoms = None
+            if self.triage:
+                _, grid_atoms, regions = self.triage_atoms(atoms)
+                if not grid_atoms.any():
+                    return []
+            pockets = PockGrid.detect_pockets_grid(atoms['coord'], PDBparser.atom_radii(atoms), self.grid_spacing,
+                                                   min_psp=self.min_psp, min_voxels=self.min_size,
+                                                   surface_data=surface_data, workers=self.threads,
+                                                   return_points=True, grid_atoms=grid_atoms)
+            if self.triage:
+                import Triage
+                pockets, points, point_pockets = pockets
+                pockets = Triage.pockets_near(pockets, points, point_pockets, regions, self.triage_margin)
+                pockets = pockets, points, point_pockets
+        elif surface_points is None:
+            return []
+        elif self.tile_size:
+            import Tiling
+            pockets = Tiling.detect_pockets_tiled(surface_data, eps=self.eps, min_samples=self.min_samples,
+                                                  coords=atoms['coord'], radii=PDBparser.atom_radii(atoms),
+                                                  grid_spacing=self.grid_spacing, tile_size=self.tile_size,
+                                                  workers=self.threads, return_points=True)
+        else:
+            pockets = PockDet.detect_pockets(surface_data, eps=self.eps, min_samples=self.min_samples,
+                                             coords=atoms['coord'], radii=PDBparser.atom_radii(atoms),
+                                             grid_spacing=self.grid_spacing, workers=self.threads,
+                                             return_points=True)
+        pockets, points, point_pockets = pockets
+        if atoms is not None:
+            with Profiler.section('annotation'):
+                Residues.annotate_pockets(pockets, points, point_pockets, atoms)
+        return PockDet.filter_pockets(pockets, min_size=self.min_size, min_depth=self.min_depth)
+
+    def score(self, pockets):
+        """Scores and ranks pockets, keeping the top_k best."""
+        return Scoring.rank_pockets(pockets, self.scoring, self.top_k)
+
+    def cached(self, stage, key, compute):
+        """
+        Returns a stage result from the cache, or computes and stores it.
+
+        Args:
+        stage (str): Stage name (see Cache.STAGE_MODULES).
+        key (str): Cache key of the result; the stage is always computed when None.
+        compute (callable): Computes the stage result when it is not cached.
+
+        Returns:
+        value: Stage result.
+        """
+        if self.cache is None or key is None:
+            return compute()
+
+        value = self.cache.load(stage, key)
+        if value is not None:
+            print(f"Reusing cached {stage} result.")
+            Profiler.count(**{stage + '_cache_hit': True})
+            return value
+
+        value = compute()
+        self.cache.store(stage, key, *(value if isinstance(value, tuple) else (value,)))
+        return value
+
+    def cache_keys(self, pdb_file):
+        """Returns the cache key of every cached stage for one input file (all None without a cache)."""
+        keys = dict.fromkeys(('parse', 'accessibility', 'surface', 'pockets'))
+        if self.cache is None:
+            return keys
+
+        from Cache import file_digest
+
+        keys['parse'] = self.cache.key('parse', file_digest(pdb_file), cif=PDBparser.is_cif(pdb_file),
+                                       altloc=self.altloc, model=self.model, hetatm=self.hetatm)
+        triage_params = {'triage_margin': self.triage_margin} if self.triage else {}
+        keys['accessibility'] = self.cache.key('accessibility', keys['parse'],
+                                               method=self.accessibility_method, n_points=self.n_points,
+                                               **triage_params)
+        tile_params = {'tile_size': self.tile_size, 'tile_overlap': self.tile_overlap} if self.tile_size else {}
+        # Without an accessibility threshold the surface only depends on the atoms (and the triage)
+        upstream = keys['accessibility'] if self.needs_accessibility() else keys['parse']
+        keys['surface'] = self.cache.key('surface', upstream, accessibility_threshold=self.accessibility_threshold,
+                                         alpha=self.alpha, **triage_params, **tile_params)
+        engine_params = ({'grid_spacing': self.grid_spacing, 'min_psp': self.min_psp} if self.engine == 'grid'
+                         else dict(eps=self.eps, min_samples=self.min_samples, grid_spacing=self.grid_spacing,
+                                   **tile_params))
+        keys['pockets'] = self.cache.key('pockets', keys['surface'], engine=self.engine, min_size=self.min_size,
+                                         min_depth=self.min_depth, **engine_params)
+        return keys
+
+    def run(self, pdb_file, output_dir=None):
+        """
+        Runs every stage on one structure.
+
+        Args:
+        pdb_file (str): Path to the input PDB or mmCIF file (plain or .gz).
+        output_dir (str): Folder for the outputs; nothing is written when None.
+
+        Returns:
+        result (dict): Stage outputs (atoms, residues, accessibility, surface_points,
+            surface_properties, surface_facets, pockets, scored) plus the paths of written files,
+            and with profiling the Profiler summary under 'profile'.
+        """
+        if not os.path.exists(pdb_file):
+            raise FileNotFoundError(f"File '{pdb_file}' not found.")
+
+        profiler = Profiler.Profiler(os.path.basename(pdb_file)) if self.profile else None
+        with profiler.activate() if profiler else contextlib.nullcontext():
+            result = self._run_stages(pdb_file, output_dir)
+
+        if profiler is not None:
+            result['profile'] = profiler.summary()
+            if output_dir is not None:
+                result['files']['profile'] = os.path.join(output_dir, "profile.json")
+                profiler.save_json(result['files']['profile'])
+                if self.trace:
+                    result['files']['trace'] = os.path.join(output_dir, "trace.json")
+                    profiler.save_trace(result['files']['trace'])
+        return result
+
+    def _run_stages(self, pdb_file, output_dir):
+        """Runs the stages of run(), each inside a profiler section."""
+        keys = self.cache_keys(pdb_file)
+        with Profiler.section('parse'):
+            atoms, residues = self.cached('parse', keys['parse'], lambda: self.parse(pdb_file))
+            Profiler.count(atoms=len(atoms), residues=len(residues))
+        accessibility, residue_sasa = None, None
+        if self.needs_accessibility():
+            with Profiler.section('accessibility'):
+                accessibility, residue_sasa = self.cached('accessibility', keys['accessibility'],
+                                                          lambda: self.accessibility(atoms))
+        with Profiler.section('surface'):
+            surface_points, surface_properties, surface_facets = self.cached(
+                'surface', keys['surface'], lambda: self.surface(atoms, accessibility))
+            Profiler.count(surface_points=0 if surface_points is None else len(surface_points))
+        with Profiler.section('pockets'):
+            pockets = self.cached('pockets', keys['pockets'],
+                                  lambda: self.pockets(surface_points, surface_properties, atoms))
+            Profiler.count(pockets=len(pockets))
+        with Profiler.section('scoring'):
+            scored = self.score([dict(p) for p in pockets])
+        if accessibility is None and output_dir is not None and self.save_intermediates:
+            # Nothing else uses it, but the parsed intermediate records it
+            with Profiler.section('accessibility'):
+                accessibility, residue_sasa = self.cached('accessibility', keys['accessibility'],
+                                                          lambda: self.accessibility(atoms))
+
+        result = {
+            'atoms': atoms,
+            'residues': residues,
+            'accessibility': accessibility,
+            'residue_sasa': residue_sasa,
+            'surface_points': surface_points,
+            'surface_properties': surface_properties,
+            'surface_facets': surface_facets,
+            'pockets': pockets,
+            'scored': scored,
+            'files': {},
+        }
+
+        if output_dir is not None:
+            with Profiler.section('write_outputs'):
+                result['files'] = self.write_outputs(result, output_dir)
+        return result
+
+    def write_outputs(self, result, output_dir):
+        """
+        Writes the final outputs, and optionally intermediates and the surface plot.
+
+        Args:
+        result (dict): Output of run().
+        output_dir (str): Folder for the outputs.
+
+        Returns:
+        files (dict): Paths of the written files keyed by output name.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        files = {
+            'pockets_pdb': os.path.join(output_dir, "pockets.pdb"),
+            'scored_json': os.path.join(output_dir, "scored.json"),
+            'pymol_script': os.path.join(output_dir, "pockets.pml"),
+        }
+        has_surface = result['surface_points'] is not None
+
+        if self.save_intermediates:
+            formats = [('', '.arrays')] + ([('_json', '.json')] if self.export_json else [])
+            for key_suffix, extension in formats:
+                files['parsed' + key_suffix] = os.path.join(output_dir, "parsed" + extension)
+                PDBparser.save_data_to_file(result['atoms'], result['residues'], result['accessibility'],
+                                            files['parsed' + key_suffix], result['residue_sasa'])
+                if has_surface:
+                    files['surface' + key_suffix] = os.path.join(output_dir, "surface" + extension)
+                    SurfAnal.save_surface_data(result['surface_points'], result['surface_properties'],
+                                               files['surface' + key_suffix], result['surface_facets'])
+                files['pockets' + key_suffix] = os.path.join(output_dir, "pockets" + extension)
+                PockDet.save_pockets_to_json(result['pockets'], files['pockets' + key_suffix])
+
+        PockDet.save_pockets_as_pdb(result['pockets'], files['pockets_pdb'])
+        Scoring.save_scored_pockets(result['scored'], files['scored_json'])
+        with Profiler.section('visualization'):
+            Visualize.generate_pymol_script(result['scored'], files['pymol_script'])
+
+        # The plot is never needed by later stages, so it comes last
+        if self.plot and has_surface:
+            files['surface_plot'] = os.path.join(output_dir, "surface.png")
+            with Profiler.section('surface_plot'):
+                if self.plot == 'background':
+                    SurfAnal.plot_in_background(result['surface_points'], result['surface_properties'],
+                                                files['surface_plot'])
+                else:
+                    SurfAnal.visualize_surface(result['surface_points'], result['surface_properties'],
+                                               files['surface_plot'])
+        return files
+
+
+def run_pipeline(pdb_file, output_dir=None, **options):
+    """
+    Convenience wrapper: builds a Pipeline with the given options and runs it on one structure.
+
+    Args:
+    pdb_file (str): Path to the input PDB file.
+    output_dir (str): Folder for the outputs; nothing is written when None.
+    **options: Keyword arguments forwarded to Pipeline.
+
+    Returns:
+    result (dict): Output of Pipeline.run().
+    """
+    return Pipeline(**options).run(pdb_file, output_dir)
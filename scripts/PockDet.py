@@ -6,6 +6,8 @@ and filtering based on volume and depth.
 
 Functions:
 - detect_pockets(surface_data): Uses a geometric method to detect potential ligand-binding pockets.
+- select_pocket_points, cluster_points, build_pockets: The steps of detect_pockets, shared with
+  the tiled mode (Tiling.py).
 - filter_pockets(pockets): Filters pockets based on size and depth.
 
 Input:
@@ -16,61 +18,324 @@ Output:
 """
 
 import json
+import os
 import numpy as np
-from sklearn.cluster import DBSCAN
 
-def detect_pockets(surface_data, eps=2.0, min_samples=3):
-    surface_points = np.array(surface_data['surface_points'])
-    depth_values = np.array(surface_data['surface_properties']['depth'])
+import Artifacts
+import Parallel
+import Profiler
+import PDBparser
+
+# Neighborhood radii whose cluster counts are reported for every structure
+EPS_SWEEP = (1.0, 1.5, 2.0, 2.5)
+
+# Minimum mean depth (Å below the convex hull) of a kept pocket; about the 10th percentile of
+# pocket depths on the example structures with either engine
+MIN_POCKET_DEPTH = 2.0
+
+# Minimum number of points of a kept pocket; smaller clusters are rims and fragments around
+# a pocket rather than sites (with 5, well over half of the example pockets had under 10 points)
+MIN_POCKET_SIZE = 10
+
+# Rays cast from each pocket center to measure its enclosure. Rays about a ligand long, blocked
+# near an atom's van der Waals radius, tell open clefts from buried sites: on the examples the
+# 5th-95th percentile spans 0.59-0.92 (DBSCAN) and 0.47-0.80 (grid). Longer rays or a wider hit
+# radius block almost every direction not pointing straight out of the surface.
+ENCLOSURE_DIRECTIONS = 60
+ENCLOSURE_DISTANCE = 10.0
+ENCLOSURE_START = 3.0  # rays start past the atoms lining the pocket, whose centers may sit next to its center
+ENCLOSURE_STEP = 1.0
+ENCLOSURE_HIT_RADIUS = 1.5
+
+def pocket_enclosure(centers, coords, n_directions=ENCLOSURE_DIRECTIONS, max_distance=ENCLOSURE_DISTANCE,
+                     start=ENCLOSURE_START, step=ENCLOSURE_STEP, hit_radius=ENCLOSURE_HIT_RADIUS, tree=None,
+                     workers=1):
+    """
+    Measures the fraction of ray directions from each pocket center that run into the protein.
+
+    All rays of all pockets are sampled every step Å from start to max_distance and tested
+    with one KD-tree query: a ray is blocked when one of its samples lies within hit_radius
+    of an atom center. A point on a flat surface sees about half its rays blocked.
+
+    Parameters:
+    - centers (np.array): Pocket centers with shape (P, 3).
+    - coords (np.array): Atomic coordinates with shape (N, 3).
+    - n_directions (int): Number of evenly spread ray directions.
+    - max_distance (float): Ray length in Å.
+    - start (float): Distance from the center of the first sample in Å.
+    - step (float): Sampling step along the rays in Å.
+    - hit_radius (float): Distance to an atom center that blocks a ray.
+    - tree (cKDTree): Optional prebuilt KD-tree over coords.
+    - workers (int): Threads for the KD-tree query.
+
+    Returns:
+    - enclosure (np.array): Blocked fraction of directions per pocket, 0 (open) to 1 (enclosed).
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+    if len(centers) == 0:
+        return np.zeros(0)
+    if tree is None:
+        from scipy.spatial import cKDTree
+
+        tree = cKDTree(coords)
+
+    directions = PDBparser.sphere_points(n_directions)
+    distances = np.arange(start, max_distance + step / 2, step)
+    samples = (centers[:, None, None, :]
+               + directions[None, :, None, :] * distances[None, None, :, None])
+    hit, _ = tree.query(samples.reshape(-1, 3), distance_upper_bound=hit_radius,
+                        workers=Parallel.kdtree_workers(workers))
+    blocked = np.isfinite(hit).reshape(len(centers), n_directions, len(distances)).any(axis=2)
+    return blocked.mean(axis=1)
+
+def radius_graph(points, max_eps):
+    """
+    Finds all pairs of points closer than max_eps once, for clustering at any eps <= max_eps.
+
+    Args:
+    - points (np.array): Points with shape (N, 3).
+    - max_eps (float): Largest neighborhood radius that will be queried.
+
+    Returns:
+    - pairs (np.array): Index pairs (i, j) with i < j, shape (P, 2).
+    - distances (np.array): Distance of every pair.
+    """
+    from scipy.spatial import cKDTree
+
+    pairs = cKDTree(points).query_pairs(max_eps, output_type='ndarray')
+    distances = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    return pairs, distances
+
+def dbscan_labels(n_points, pairs, distances, eps, min_samples=3):
+    """
+    Labels points exactly as sklearn's DBSCAN would, from a precomputed radius graph.
+
+    Core points have at least min_samples points (themselves included) within eps. Clusters
+    are connected components of core points, numbered in order of their first core point;
+    a border point joins the lowest-numbered cluster among its core neighbors, which is the
+    cluster sklearn's sequential expansion reaches first. Results match sklearn up to
+    floating-point ties of pair distances exactly equal to eps.
+
+    Args:
+    - n_points (int): Number of points.
+    - pairs (np.array): Index pairs from radius_graph().
+    - distances (np.array): Pair distances from radius_graph().
+    - eps (float): Neighborhood radius (must not exceed the graph's max_eps).
+    - min_samples (int): Minimum neighborhood size of a core point.
+
+    Returns:
+    - labels (np.array): Cluster label per point, -1 for noise.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    close = pairs[distances <= eps]
+    degree = 1 + np.bincount(close.ravel(), minlength=n_points)
+    core = degree >= min_samples
+
+    # Components of the core-core graph, renumbered by their smallest core point
+    core_edges = close[core[close[:, 0]] & core[close[:, 1]]]
+    graph = coo_matrix((np.ones(len(core_edges)), (core_edges[:, 0], core_edges[:, 1])), shape=(n_points, n_points))
+    _, components = connected_components(graph, directed=False)
+    core_components = components[core]
+    _, first = np.unique(core_components, return_index=True)
+    order = np.full(components.max() + 1, -1)
+    order[core_components[np.sort(first)]] = np.arange(len(first))
+
+    labels = np.full(n_points, -1)
+    labels[core] = order[core_components]
+
+    # Border points: the smallest cluster label among their core neighbors
+    border_labels = np.full(n_points, np.iinfo(np.int64).max)
+    for a, b in ((close[:, 0], close[:, 1]), (close[:, 1], close[:, 0])):
+        link = core[a] & ~core[b]
+        np.minimum.at(border_labels, b[link], labels[a[link]])
+    border = ~core & (border_labels < np.iinfo(np.int64).max)
+    labels[border] = border_labels[border]
+    return labels
+
+def auto_eps(points, min_samples=3):
+    """
+    Chooses eps from the point density: the knee of the sorted distances to each point's
+    (min_samples - 1)-th nearest neighbor (the k-distance graph of the DBSCAN paper).
+
+    Args:
+    - points (np.array): Points with shape (N, 3).
+    - min_samples (int): DBSCAN minimum neighborhood size.
+
+    Returns:
+    - eps (float): Neighborhood radius.
+    """
+    k = min(max(min_samples - 1, 1), len(points) - 1)
+    if k < 1:
+        return 0.0
+    from scipy.spatial import cKDTree
+
+    distances, _ = cKDTree(points).query(points, k=k + 1)
+    k_distances = np.sort(distances[:, k])
+
+    # Knee: the point farthest below the chord joining the smallest and largest k-distance
+    x = np.linspace(0.0, 1.0, len(k_distances))
+    span = k_distances[-1] - k_distances[0]
+    if span <= 0:
+        return float(k_distances[-1])
+    y = (k_distances - k_distances[0]) / span
+    return float(k_distances[np.argmax(x - y)])
+
+def select_pocket_points(surface_data):
+    """
+    Selects the deepest half of the surface points, the candidates for pocket clustering.
+
+    Parameters:
+    - surface_data (dict): {'surface_points': array, 'surface_properties': {'depth', 'curvature', ...}}.
+
+    Returns:
+    - pocket_points (np.array): Selected points with shape (P, 3).
+    - depth (np.array): Depth of every selected point.
+    - curvature (np.array): Curvature of every selected point.
+    """
+    surface_points = np.asarray(surface_data['surface_points'], dtype=float)
+    depth_values = np.asarray(surface_data['surface_properties']['depth'], dtype=float)
+    curvature_values = np.asarray(surface_data['surface_properties']['curvature'], dtype=float)
 
     print(f"Depth Min: {depth_values.min()}, Max: {depth_values.max()}, Mean: {depth_values.mean()}")
 
     depth_threshold = np.percentile(depth_values, 50)
     pocket_indices = np.where(depth_values >= depth_threshold)[0]
-    pocket_points = surface_points[pocket_indices]
 
     print(f"Total surface points: {len(surface_points)}")
-    print(f"Points above depth threshold: {len(pocket_points)}")
+    print(f"Points above depth threshold: {len(pocket_indices)}")
+    return surface_points[pocket_indices], depth_values[pocket_indices], curvature_values[pocket_indices]
 
-    if len(pocket_points) == 0:
-        print("No points meet the depth threshold. Adjust thresholding.")
-        return []
+def cluster_points(n_points, pairs, distances, eps, min_samples=3):
+    """
+    Labels pocket points with DBSCAN from their radius graph, reporting the EPS_SWEEP cluster counts.
 
-    for eps_test in [1.0, 1.5, 2.0, 2.5]:
-        clustering_test = DBSCAN(eps=eps_test, min_samples=min_samples).fit(pocket_points)
-        print(f"Eps: {eps_test}, Detected Clusters: {len(set(clustering_test.labels_)) - 1}")
+    Parameters:
+    - n_points (int): Number of pocket points.
+    - pairs (np.array): Index pairs from radius_graph() (built for max(EPS_SWEEP + (eps,))).
+    - distances (np.array): Pair distances from radius_graph().
+    - eps (float): DBSCAN neighborhood radius in Å.
+    - min_samples (int): DBSCAN minimum neighborhood size.
 
-    clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(pocket_points)
+    Returns:
+    - labels (np.array): Cluster label per point, -1 for noise.
+    """
+    for eps_test in EPS_SWEEP:
+        labels_test = dbscan_labels(n_points, pairs, distances, eps_test, min_samples)
+        print(f"Eps: {eps_test}, Detected Clusters: {labels_test.max() + 1}")
 
-    pockets = []
-    for cluster_id in set(clustering.labels_):
-        if cluster_id == -1:
-            continue
+    labels = dbscan_labels(n_points, pairs, distances, eps, min_samples)
+    Profiler.count(clusters=int(labels.max() + 1))
+    return labels
 
-        cluster_indices = np.where(clustering.labels_ == cluster_id)[0]
-        cluster_points = pocket_points[cluster_indices]
+def build_pockets(pocket_points, labels, depth, curvature, volumes, enclosures):
+    """
+    Assembles the pocket dicts of all clusters.
 
-        depth = float(depth_values[pocket_indices][cluster_indices].mean())
-        volume = len(cluster_points)
-        enclosure = min(1.0, len(cluster_points) / 500)  # Normalized placeholder
-        curvature = -0.2  # Placeholder
+    Parameters:
+    - pocket_points (np.array): Clustered candidate points with shape (P, 3).
+    - labels (np.array): Cluster label per point, -1 for noise.
+    - depth (np.array): Depth per point.
+    - curvature (np.array): Curvature per point.
+    - volumes (np.array): Volume per cluster.
+    - enclosures (np.array): Enclosure per cluster.
 
+    Returns:
+    - pockets (list): Pocket dicts (pocket_id, num_points, center, depth, volume, enclosure, curvature).
+    """
+    pockets = []
+    for cluster_id in range(labels.max() + 1):
+        cluster_indices = np.where(labels == cluster_id)[0]
+        cluster_points = pocket_points[cluster_indices]
+
+        mean_depth = float(depth[cluster_indices].mean())
         pocket = {
             'pocket_id': int(cluster_id),
             'num_points': len(cluster_points),
             'center': cluster_points.mean(axis=0).tolist(),
-            'depth_mean': depth,
-            'volume': volume,
-            'depth': depth,
-            'enclosure': enclosure,
-            'curvature': curvature
+            'depth_mean': mean_depth,
+            'volume': float(volumes[cluster_id]),
+            'depth': mean_depth,
+            'enclosure': float(enclosures[cluster_id]),
+            'curvature': float(curvature[cluster_indices].mean())
         }
         pockets.append(pocket)
 
     print(f"Detected {len(pockets)} potential pockets.")
     return pockets
 
-def filter_pockets(pockets, min_size=5, min_depth=0.3):
+def cluster_centers(pocket_points, labels):
+    """Returns the mean position of every cluster, shape (n_clusters, 3)."""
+    return np.array([pocket_points[labels == cluster_id].mean(axis=0) for cluster_id in range(labels.max() + 1)])
+
+def placeholder_properties(labels):
+    """Returns point-count placeholders for the volume and enclosure of every cluster (no atom coordinates)."""
+    print("Warning: No atom coordinates given; volume and enclosure are point-count placeholders.")
+    sizes = np.bincount(labels[labels >= 0], minlength=labels.max() + 1)
+    return sizes.astype(float), np.minimum(1.0, sizes / 500)
+
+def detect_pockets(surface_data, eps=2.0, min_samples=3, coords=None, radii=None, grid_spacing=1.0, workers=1,
+                   return_points=False):
+    """
+    Clusters the deepest half of the surface points into pockets.
+
+    The radius graph is built once for the largest eps needed, so the cluster counts of the
+    whole EPS_SWEEP and the final clustering come from one neighbor search.
+
+    Parameters:
+    - surface_data (dict): {'surface_points': array, 'surface_properties': {'depth', 'curvature', ...}}.
+    - eps (float or str): DBSCAN neighborhood radius in Å, or 'auto' to derive it from the point density.
+    - min_samples (int): DBSCAN minimum neighborhood size.
+    - coords (np.array): Atomic coordinates of the protein, needed for real volume and enclosure.
+    - radii (np.array): Van der Waals radius per atom (default: carbon radius for all).
+    - grid_spacing (float): Voxel size in Å of the grid measuring pocket volumes.
+    - workers (int): Threads for the volume and enclosure kernels.
+    - return_points (bool): Also return the candidate points and their pocket_id (for Residues.annotate_pockets).
+
+    With coords, clusters lining the same void of buried solvent are merged into one pocket
+    (see PockGrid.pocket_volumes). Without coords, volume falls back to the point count and
+    enclosure to a count-based placeholder.
+
+    Returns:
+    - pockets (list): Pocket dicts (pocket_id, num_points, center, depth, volume, enclosure, curvature).
+    - points (np.array): Only with return_points; candidate points with shape (P, 3).
+    - point_pockets (np.array): Only with return_points; pocket_id of every point, -1 for noise.
+    """
+    pocket_points, depth, curvature = select_pocket_points(surface_data)
+    if len(pocket_points) == 0:
+        print("No points meet the depth threshold. Adjust thresholding.")
+        return ([], pocket_points, np.zeros(0, dtype=int)) if return_points else []
+
+    if eps == 'auto':
+        eps = auto_eps(pocket_points, min_samples)
+        print(f"Automatic eps from point density: {eps:.3f}")
+
+    with Profiler.section('clustering', pocket_points=len(pocket_points)):
+        pairs, distances = radius_graph(pocket_points, max(max(EPS_SWEEP), eps))
+        labels = cluster_points(len(pocket_points), pairs, distances, eps, min_samples)
+        n_clusters = labels.max() + 1
+
+    # Volume (merging clusters that line one void) and enclosure of all clusters in one batched pass each
+    clustered = labels >= 0
+    if coords is not None and n_clusters > 0:
+        import PockGrid
+
+        if radii is None:
+            radii = np.full(len(coords), PDBparser.ELEMENT_RADII['C'])
+        with Profiler.section('pocket_volume'):
+            volumes, merged = PockGrid.pocket_volumes(pocket_points[clustered], labels[clustered], n_clusters,
+                                                      coords, radii, grid_spacing, workers=workers)
+            labels[clustered] = merged[labels[clustered]]
+        with Profiler.section('enclosure'):
+            enclosures = pocket_enclosure(cluster_centers(pocket_points, labels), coords, workers=workers)
+    else:
+        volumes, enclosures = placeholder_properties(labels)
+
+    pockets = build_pockets(pocket_points, labels, depth, curvature, volumes, enclosures)
+    return (pockets, pocket_points, labels) if return_points else pockets
+
+def filter_pockets(pockets, min_size=MIN_POCKET_SIZE, min_depth=MIN_POCKET_DEPTH):
     filtered_pockets = [
         p for p in pockets
         if p['num_points'] >= min_size and p['depth_mean'] >= min_depth
@@ -93,17 +358,64 @@ def save_pockets_as_pdb(pockets, output_pdb):
 
     print(f"Pockets saved to {output_pdb} for visualization.")
 
-def main(input_json, output_json):
-    with open(input_json, 'r') as f:
-        surface_data = json.load(f)
-    
-    pockets = detect_pockets(surface_data)
-    filtered_pockets = filter_pockets(pockets)
+def save_pockets_to_json(pockets, output_json):
+    """
+    Saves detected pockets to a JSON file, or to an artifact folder for non-'.json' paths.
+
+    Args:
+    - pockets (list): List of detected pockets.
+    - output_json (str): Output JSON file path or artifact folder.
+    """
+    if not output_json.endswith('.json'):
+        Artifacts.save_pockets(output_json, pockets)
+        return
 
     with open(output_json, 'w') as f:
-        json.dump(filtered_pockets, f, indent=4)
+        json.dump(pockets, f, indent=4)
+
+def load_surface_data(input_path):
+    """
+    Loads surface data written by SurfAnal.py from a JSON file or an artifact folder.
+    """
+    if Artifacts.is_artifact(input_path):
+        return Artifacts.load_surface(input_path)
+    with open(input_path, 'r') as f:
+        return json.load(f)
+
+def load_pockets(input_path):
+    """
+    Loads pockets written by PockDet.py from a JSON file or an artifact folder.
+    """
+    if Artifacts.is_artifact(input_path):
+        return Artifacts.load_pockets(input_path)
+    with open(input_path, 'r') as f:
+        return json.load(f)
+
+def main(input_json, output_json, parsed_data=None):
+    surface_data = load_surface_data(input_json)
+
+    # Atom coordinates (from PDBparser output) give real pocket volumes and enclosures,
+    # and the atom records of an artifact the lining residues
+    coords = radii = atoms = None
+    if parsed_data is not None:
+        import PockGrid
+        if Artifacts.is_artifact(parsed_data):
+            pdb_data = Artifacts.load_parsed(parsed_data)
+            atoms = Artifacts.parsed_atoms(pdb_data)
+        else:
+            with open(parsed_data, 'r') as f:
+                pdb_data = json.load(f)
+        coords, radii = PockGrid.load_atoms(pdb_data)
+
+    pockets, points, point_pockets = detect_pockets(surface_data, coords=coords, radii=radii, return_points=True)
+    if atoms is not None:
+        import Residues
+        Residues.annotate_pockets(pockets, points, point_pockets, atoms)
+    filtered_pockets = filter_pockets(pockets)
+
+    save_pockets_to_json(filtered_pockets, output_json)
 
-    output_pdb_file = output_json.replace(".json", ".pdb")
+    output_pdb_file = os.path.splitext(output_json)[0] + ".pdb"
     save_pockets_as_pdb(filtered_pockets, output_pdb_file)
     
     print(f"Pockets saved to {output_json}")
@@ -111,10 +423,10 @@ def main(input_json, output_json):
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 3:
-        print("Usage: python PockDet.py <INPUT_JSON> <OUTPUT_JSON>")
+        print("Usage: python PockDet.py <INPUT_JSON|INPUT_DIR> <OUTPUT_JSON|OUTPUT_DIR> [PARSED_DATA]")
         sys.exit(1)
     
     input_json = sys.argv[1]
     output_json = sys.argv[2]
     
-    main(input_json, output_json)
+    main(input_json, output_json, sys.argv[3] if len(sys.argv) > 3 else None)
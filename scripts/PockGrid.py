@@ -0,0 +1,398 @@
+"""
+PockGrid.py
+
+Grid-based (LIGSITE-style) pocket detection, an alternative engine to the DBSCAN
+clustering of surface points in PockDet.py.
+
+The protein is mapped onto a 3D occupancy grid cropped to its bounding box, with atoms
+grown by the solvent probe radius so that solvent voxels are positions a probe center can
+reach (packing gaps between atoms do not count as solvent). Every solvent voxel is scanned
+along the 3 axes and the 4 cube diagonals; a scan in which protein lies on both sides of
+the voxel is a protein-solvent-protein (PSP) event. Voxels with enough PSP events are
+buried solvent, and their connected components become pockets with the same schema as
+PockDet.detect_pockets. Buried voxels are probe centers, so the volume of a pocket is the
+space the probe sweeps over them; the DBSCAN engine measures its clusters the same way,
+through the components they line.
+
+The grid spacing sets the speed/accuracy trade-off (voxel count grows with 1/spacing³).
+All scans are whole-grid numpy operations, with log2(grid size) shifted ORs per direction.
+
+Functions:
+- occupancy_grid(coords, radii, spacing, margin): Boolean protein grid and its origin.
+- psp_counts(occupied): Number of PSP events per voxel.
+- pocket_volumes(points, labels, ...): Volumes of clusters of surface points, merging clusters that line one void.
+- detect_pockets_grid(coords, radii, ...): Pockets as connected components of buried voxels.
+
+Usage:
+    python PockGrid.py <PARSED_DATA> <OUTPUT_JSON|OUTPUT_DIR> [GRID_SPACING]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+import Parallel
+import PDBparser
+import Profiler
+import SurfAnal
+import PockDet
+
+# Scan directions: 3 axes and 4 cube diagonals (LIGSITE)
+SCAN_DIRECTIONS = np.array([
+    (1, 0, 0), (0, 1, 0), (0, 0, 1),
+    (1, 1, 1), (1, 1, -1), (1, -1, 1), (1, -1, -1),
+])
+
+# Largest distance (Å) between a buried solvent voxel and a surface point for their cluster to line its component
+# (probe centers stay at least one atom radius plus the probe radius away from atom centers)
+POCKET_REACH = 4.5
+
+# (atom, grid column) pairs examined per batch of atoms when marking occupied voxels (bounds memory)
+BATCH_VOXELS = 2000000
+
+
+def occupancy_grid(coords, radii, spacing=1.0, margin=2.0, lattice=None):
+    """
+    Maps atoms onto a boolean grid cropped to the protein's bounding box.
+
+    A voxel is occupied when its center lies within the van der Waals radius of an atom.
+    Every atom fills one run of voxels per (x, y) column of the grid it crosses, so the work
+    grows with the atom's cross-section rather than its volume in voxels.
+
+    Args:
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    radii (np.array): Van der Waals radius per atom.
+    spacing (float): Voxel edge length in Å.
+    margin (float): Empty border around the bounding box in Å.
+    lattice (np.array): Optional point the voxel centers are aligned to, so that grids over
+        different parts of a structure share their voxels.
+
+    Returns:
+    occupied (np.array): Boolean grid, True inside the protein.
+    origin (np.array): Coordinates of the center of voxel (0, 0, 0).
+    """
+    coords = np.asarray(coords, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    origin = coords.min(axis=0) - margin
+    if lattice is not None:
+        origin = lattice + np.floor((origin - lattice) / spacing) * spacing
+    shape = np.ceil((coords.max(axis=0) + margin - origin) / spacing).astype(int) + 1
+    occupied = np.zeros(shape, dtype=bool)
+
+    # A sphere covers one run of voxels along z in every (x, y) column it crosses: the run
+    # ends are solved per atom and column, nudged by one voxel where rounding disagrees with
+    # the exact center-distance test, and every run is then filled
+    reach = int(np.ceil(radii.max() / spacing)) + 1
+    axis = np.arange(-reach, reach + 1)
+    columns = np.stack(np.meshgrid(axis, axis, indexing='ij'), axis=-1).reshape(-1, 2)
+    lengths = np.linalg.norm(columns, axis=1) * spacing
+
+    # An atom center lies at most half a voxel diagonal from its nearest column, so columns
+    # farther than radius + slack never hit; atoms are batched by radius to prune them
+    slack = np.sqrt(2) / 2 * spacing + 1e-9
+    order = np.argsort(radii, kind='stable')
+    batch_size = max(1, BATCH_VOXELS // len(columns))
+    for start in range(0, len(coords), batch_size):
+        batch_atoms = order[start:start + batch_size]
+        batch, batch_radii = coords[batch_atoms], radii[batch_atoms]
+        nearest = np.rint((batch[:, :2] - origin[:2]) / spacing).astype(int)
+        offsets = columns[lengths <= batch_radii.max() + slack]
+
+        ix = nearest[:, None, 0] + offsets[None, :, 0]
+        iy = nearest[:, None, 1] + offsets[None, :, 1]
+        planar = ((origin[0] + ix * spacing - batch[:, None, 0]) ** 2
+                  + (origin[1] + iy * spacing - batch[:, None, 1]) ** 2)
+        squared = batch_radii[:, None] ** 2
+        half = np.sqrt(np.maximum(squared - planar, 0.0))
+        z = batch[:, None, 2]
+
+        def inside(iz):
+            return planar + (origin[2] + iz * spacing - z) ** 2 <= squared
+
+        low = np.ceil((z - half - origin[2]) / spacing).astype(int)
+        high = np.floor((z + half - origin[2]) / spacing).astype(int)
+        low = np.where(inside(low - 1), low - 1, np.where(inside(low), low, low + 1))
+        high = np.where(inside(high + 1), high + 1, np.where(inside(high), high, high - 1))
+
+        low, high = np.maximum(low, 0), np.minimum(high, shape[2] - 1)
+        keep = (low <= high) & (planar <= squared) & (ix >= 0) & (ix < shape[0]) & (iy >= 0) & (iy < shape[1])
+        first = (ix[keep] * shape[1] + iy[keep]) * shape[2] + low[keep]
+        runs = high[keep] - low[keep] + 1
+        ends = np.cumsum(runs)
+        occupied.ravel()[np.repeat(first - ends + runs, runs) + np.arange(ends[-1] if len(ends) else 0)] = True
+    return occupied, origin
+
+
+def _shift(grid, direction, steps):
+    """Returns grid moved by steps voxels along direction, filling with False."""
+    shifted = np.zeros_like(grid)
+    target, source = [], []
+    for size, delta in zip(grid.shape, np.asarray(direction) * steps):
+        if abs(delta) >= size:
+            return shifted
+        if delta >= 0:
+            target.append(slice(delta, None))
+            source.append(slice(0, size - delta))
+        else:
+            target.append(slice(0, delta))
+            source.append(slice(-delta, None))
+    shifted[tuple(target)] = grid[tuple(source)]
+    return shifted
+
+
+def _protein_behind(occupied, direction):
+    """Marks voxels that have an occupied voxel somewhere behind them along direction."""
+    # Doubling: after each step, 'behind' covers twice as many voxels along the line
+    behind = _shift(occupied, direction, 1)
+    steps = 1
+    while steps < max(occupied.shape):
+        behind |= _shift(behind, direction, steps)
+        steps *= 2
+    return behind
+
+
+def psp_counts(occupied):
+    """
+    Counts protein-solvent-protein events for every voxel.
+
+    Args:
+    occupied (np.array): Boolean protein grid.
+
+    Returns:
+    counts (np.array): Number of scan directions (0-7) with protein on both sides, 0 inside the protein.
+    """
+    counts = np.zeros(occupied.shape, dtype=np.uint8)
+    for direction in SCAN_DIRECTIONS:
+        counts += _protein_behind(occupied, direction) & _protein_behind(occupied, -direction)
+    counts[occupied] = 0
+    return counts
+
+
+def buried_voxels(coords, radii, spacing=1.0, min_psp=5, probe_radius=1.4, lattice=None):
+    """
+    Finds the buried solvent voxels of a protein.
+
+    Args:
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    radii (np.array): Van der Waals radius per atom.
+    spacing (float): Voxel edge length in Å.
+    min_psp (int): Minimum number of PSP events (out of 7) for a solvent voxel to be buried.
+    probe_radius (float): Solvent probe radius added to every atom radius.
+    lattice (np.array): Optional point the voxel centers are aligned to (see occupancy_grid).
+
+    Returns:
+    buried (np.array): Boolean grid of buried solvent voxels.
+    counts (np.array): PSP events per voxel.
+    origin (np.array): Coordinates of the center of voxel (0, 0, 0).
+    """
+    occupied, origin = occupancy_grid(coords, np.asarray(radii, dtype=float) + probe_radius, spacing, lattice=lattice)
+    counts = psp_counts(occupied)
+    return counts >= min_psp, counts, origin
+
+
+def swept_volumes(components, component_pockets, n_pockets, spacing=1.0, probe_radius=1.4):
+    """
+    Measures the volume swept by the solvent probe over the buried voxels of each pocket.
+
+    Buried voxels are probe center positions; the pocket is the union of the probe spheres
+    around them, measured on the same grid (the grid spacing sets the accuracy). Each pocket
+    is dilated within its own bounding box.
+
+    Args:
+    components (np.array): Integer grid of component labels (0 outside buried voxels).
+    component_pockets (np.array): Pocket (0..n_pockets-1) of every component label, -1 for none.
+    n_pockets (int): Number of pockets.
+    spacing (float): Voxel edge length in Å.
+    probe_radius (float): Solvent probe radius in Å.
+
+    Returns:
+    volumes (np.array): Volume per pocket in Å³ (0 for a pocket without buried voxels).
+    """
+    from scipy import ndimage
+
+    pocket_grid = (np.asarray(component_pockets, dtype=np.int32) + 1)[components]
+    steps = int(np.ceil(probe_radius / spacing))
+    axis = np.arange(-steps, steps + 1) * spacing
+    ball = axis[:, None, None] ** 2 + axis[None, :, None] ** 2 + axis[None, None, :] ** 2 <= probe_radius ** 2
+
+    volumes = np.zeros(n_pockets)
+    for pocket, box in enumerate(ndimage.find_objects(pocket_grid, max_label=n_pockets)):
+        if box is None:
+            continue
+        box = tuple(slice(max(part.start - steps, 0), part.stop + steps) for part in box)
+        volumes[pocket] = ndimage.binary_dilation(pocket_grid[box] == pocket + 1, ball).sum()
+    return volumes * spacing ** 3
+
+
+def pocket_volumes(points, labels, n_pockets, coords, radii, spacing=1.0, min_psp=5, probe_radius=1.4,
+                   reach=POCKET_REACH, workers=1):
+    """
+    Measures pocket volumes from the connected components of buried solvent voxels lined by clusters of surface points.
+
+    A cluster lines the components with a voxel within reach of one of its points (one KD-tree
+    query for all clusters). Clusters lining the same component are fragments of one void and
+    are merged; the volume of a merged pocket is the probe volume swept over all the components
+    it lines (see swept_volumes), 0 when it lines none.
+
+    Args:
+    points (np.array): Clustered surface points with shape (M, 3).
+    labels (np.array): Cluster label (0..n_pockets-1) per point.
+    n_pockets (int): Number of clusters.
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    radii (np.array): Van der Waals radius per atom.
+    spacing (float): Voxel edge length in Å.
+    min_psp (int): Minimum number of PSP events (out of 7) for a solvent voxel to be buried.
+    probe_radius (float): Solvent probe radius in Å.
+    reach (float): Largest voxel-to-point distance in Å for a cluster to line a component.
+    workers (int): Threads for the KD-tree query.
+
+    Returns:
+    volumes (np.array): Volume per merged pocket in Å³.
+    merged (np.array): Merged pocket (0..len(volumes)-1) of every cluster.
+    """
+    from scipy import ndimage
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+
+    buried, _, origin = buried_voxels(coords, radii, spacing, min_psp, probe_radius)
+    components, n_components = ndimage.label(buried)
+    voxel_components = components[buried]
+    distances, nearest = cKDTree(points).query(origin + np.argwhere(buried) * spacing, distance_upper_bound=reach,
+                                               workers=Parallel.kdtree_workers(workers))
+    owned = np.isfinite(distances)
+
+    # Graph of clusters (nodes 0..n_pockets-1) and the components they line: each connected
+    # part is one merged pocket
+    lining = np.unique(np.column_stack([labels[nearest[owned]], n_pockets + voxel_components[owned]]), axis=0)
+    graph = coo_matrix((np.ones(len(lining)), (lining[:, 0], lining[:, 1])),
+                       shape=(n_pockets + n_components + 1,) * 2)
+    _, parts = connected_components(graph, directed=False)
+    _, merged = np.unique(parts[:n_pockets], return_inverse=True)
+
+    component_pockets = np.full(n_components + 1, -1)
+    component_pockets[lining[:, 1] - n_pockets] = merged[lining[:, 0]]
+    volumes = swept_volumes(components, component_pockets, merged.max() + 1, spacing, probe_radius)
+    return volumes, merged
+
+
+def detect_pockets_grid(coords, radii, spacing=1.0, min_psp=5, min_voxels=5, probe_radius=1.4, surface_data=None,
+                        workers=1, return_points=False, grid_atoms=None):
+    """
+    Detects pockets as connected components of buried solvent voxels.
+
+    Args:
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    radii (np.array): Van der Waals radius per atom.
+    spacing (float): Voxel edge length in Å.
+    min_psp (int): Minimum number of PSP events (out of 7) for a solvent voxel to be buried.
+    min_voxels (int): Minimum number of voxels per pocket.
+    probe_radius (float): Solvent probe radius added to every atom radius.
+    surface_data (dict): Optional surface ('surface_points', 'surface_properties'); pocket
+        curvature is the mean curvature of the surface points nearest to its voxels.
+    workers (int): Threads for the depth, neighbor and enclosure kernels.
+    return_points (bool): Also return the buried voxel centers and their pocket_id (for Residues.annotate_pockets).
+    grid_atoms (np.array): Optional boolean mask of the atoms mapped on the grid (see Triage.py);
+        the voxels stay on the whole-structure lattice, and depth and enclosure use all atoms.
+
+    Returns:
+    pockets (list): Pocket dicts with the PockDet.detect_pockets schema; 'volume' in Å³.
+    points (np.array): Only with return_points; buried voxel centers with shape (V, 3).
+    point_pockets (np.array): Only with return_points; pocket_id (component label) of every voxel.
+    """
+    from scipy import ndimage
+    from scipy.spatial import cKDTree
+
+    coords = np.asarray(coords, dtype=float)
+    grid_coords, grid_radii, lattice = coords, radii, None
+    if grid_atoms is not None:
+        # Voxels on the lattice of the whole-structure grid (occupancy_grid's default margin)
+        grid_coords, grid_radii = coords[grid_atoms], np.asarray(radii)[grid_atoms]
+        lattice = coords.min(axis=0) - 2.0
+    with Profiler.section('psp_scan'):
+        buried, _, origin = buried_voxels(grid_coords, grid_radii, spacing, min_psp, probe_radius, lattice=lattice)
+    print(f"Grid: {buried.shape} voxels of {spacing} Å, {int(buried.sum())} buried solvent voxels.")
+    Profiler.count(grid_voxels=int(buried.size), buried_voxels=int(buried.sum()))
+
+    labels, n_components = ndimage.label(buried)
+    Profiler.count(clusters=int(n_components))
+    voxel_labels = labels[buried]
+    voxel_centers = origin + np.argwhere(buried) * spacing
+    voxel_depth = SurfAnal.hull_depth(voxel_centers, coords, workers=workers)
+
+    voxel_curvature = np.zeros(len(voxel_centers))
+    if surface_data is not None and surface_data['surface_points'] is not None and len(voxel_centers):
+        _, nearest = cKDTree(surface_data['surface_points']).query(voxel_centers,
+                                                                   workers=Parallel.kdtree_workers(workers))
+        voxel_curvature = np.asarray(surface_data['surface_properties']['curvature'], dtype=float)[nearest]
+
+    # Per-component sums in one pass each (labels are 1..n_components)
+    sizes = np.bincount(voxel_labels, minlength=n_components + 1)
+    sums = {name: np.bincount(voxel_labels, weights=values, minlength=n_components + 1)
+            for name, values in [('depth', voxel_depth), ('curvature', voxel_curvature),
+                                 ('x', voxel_centers[:, 0]), ('y', voxel_centers[:, 1]), ('z', voxel_centers[:, 2])]}
+
+    kept = np.flatnonzero(sizes >= max(min_voxels, 1))
+    kept = kept[kept > 0]
+    component_pockets = np.full(n_components + 1, -1)
+    component_pockets[kept] = np.arange(len(kept))
+    with Profiler.section('pocket_volume'):
+        volumes = swept_volumes(labels, component_pockets, len(kept), spacing, probe_radius)
+    centers = np.stack([sums[axis][kept] / sizes[kept] for axis in 'xyz'], axis=1)
+    with Profiler.section('enclosure'):
+        enclosures = PockDet.pocket_enclosure(centers, coords, workers=workers)
+
+    pockets = []
+    for index, label in enumerate(kept):
+        size = int(sizes[label])
+        depth = float(sums['depth'][label] / size)
+        pockets.append({
+            'pocket_id': int(label),
+            'num_points': size,
+            'center': centers[index].tolist(),
+            'depth_mean': depth,
+            'volume': float(volumes[index]),
+            'depth': depth,
+            'enclosure': float(enclosures[index]),
+            'curvature': float(sums['curvature'][label] / size),
+        })
+
+    print(f"Detected {len(pockets)} potential pockets.")
+    return (pockets, voxel_centers, voxel_labels) if return_points else pockets
+
+
+def load_atoms(pdb_data):
+    """Returns (coords, radii) from parsed PDB data (artifact columns or JSON)."""
+    if 'coord' in pdb_data:
+        return np.asarray(pdb_data['coord']), PDBparser.atom_radii(pdb_data)
+    atoms = pdb_data['atoms']
+    coords = np.array([atom['coordinates'] for atom in atoms], dtype=float).reshape(-1, 3)
+    elements = np.array([atom.get('element', '') for atom in atoms], dtype='S2')
+    return coords, PDBparser.atom_radii({'element': elements})
+
+
+def main(input_path, output_path, spacing=1.0):
+    import json
+    import Artifacts
+
+    if Artifacts.is_artifact(input_path):
+        pdb_data = Artifacts.load_parsed(input_path)
+    else:
+        with open(input_path, 'r') as f:
+            pdb_data = json.load(f)
+
+    coords, radii = load_atoms(pdb_data)
+    pockets = PockDet.filter_pockets(detect_pockets_grid(coords, radii, spacing))
+
+    PockDet.save_pockets_to_json(pockets, output_path)
+    PockDet.save_pockets_as_pdb(pockets, os.path.splitext(output_path)[0] + ".pdb")
+    print(f"Pockets saved to {output_path}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage: python PockGrid.py <PARSED_DATA> <OUTPUT_JSON|OUTPUT_DIR> [GRID_SPACING]")
+        sys.exit(1)
+
+    main(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 1.0)
@@ -0,0 +1,187 @@
+"""
+Profiler.py
+
+Per-stage instrumentation of the pipeline: wall time, CPU time, peak memory and counters.
+
+A Profiler records one entry per stage run inside profiler.stage(name). Code that does not
+hold a profiler (SurfAnal, PockDet) marks sub-stages with the module-level section(name),
+which records into the active profiler and does nothing when there is none, so the stage
+modules keep working on their own without any profiling overhead.
+
+Stages nest: a section opened inside a stage is recorded with that stage as its parent.
+Results are written as JSON (one record per stage plus the counters) and, optionally, as a
+Chrome trace (open chrome://tracing or https://ui.perfetto.dev and load the file).
+
+Peak RSS is the process high-water mark when the stage ends; its growth during the stage
+is reported as well, but it stays 0 for stages that do not push the peak higher.
+
+Usage (from Python, with the scripts/ folder on sys.path):
+    from Profiler import Profiler
+
+    profiler = Profiler()
+    with profiler.activate(), profiler.stage('parse'):
+        ...
+        profiler.count(atoms=n_atoms)
+    profiler.save_json('profile.json')
+    profiler.save_trace('trace.json')
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Profiler receiving section() records in this process, set by Profiler.activate()
+_ACTIVE = None
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB (None when unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+class Profiler:
+    """
+    Records wall time, CPU time, peak RSS and counters of pipeline stages.
+
+    Args:
+    name (str): Name of the profiled run (e.g. the structure name), stored in the outputs.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.records = []
+        self.counters = {}
+        self._local = threading.local()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def _open(self):
+        """Stages currently open in the calling thread, innermost last."""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def stage(self, name, **counters):
+        """
+        Context manager timing one stage.
+
+        Args:
+        name (str): Stage name.
+        **counters: Counters set when the stage starts (more can be added with count()).
+        """
+        record = {'stage': name, 'parent': self._open[-1]['stage'] if self._open else None,
+                  'thread': threading.get_ident()}
+        rss_before = peak_rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        self._open.append(record)
+        self.count(**counters)
+        try:
+            yield record
+        finally:
+            self._open.pop()
+            record.update({
+                'start_s': round(wall - self._start, 6),
+                'wall_s': round(time.perf_counter() - wall, 6),
+                'cpu_s': round(time.process_time() - cpu, 6),
+            })
+            rss_after = peak_rss_mb()
+            if rss_after is not None:
+                record['peak_rss_mb'] = round(rss_after, 1)
+                record['peak_rss_growth_mb'] = round(rss_after - rss_before, 1)
+            with self._lock:
+                self.records.append(record)
+
+    def count(self, **counters):
+        """Sets counters (e.g. atoms=1234) on the current stage and in the run totals."""
+        if not counters:
+            return
+        counters = {key: value.item() if hasattr(value, 'item') else value for key, value in counters.items()}
+        if self._open:
+            self._open[-1].setdefault('counters', {}).update(counters)
+        with self._lock:
+            self.counters.update(counters)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Makes this profiler receive section() records until the block ends."""
+        global _ACTIVE
+        previous, _ACTIVE = _ACTIVE, self
+        try:
+            yield self
+        finally:
+            _ACTIVE = previous
+
+    def summary(self):
+        """
+        Summarizes the run.
+
+        Returns:
+        summary (dict): Run name, total wall time, peak RSS, counters and the stage records in start order.
+        """
+        return {
+            'name': self.name,
+            'wall_s': round(time.perf_counter() - self._start, 6),
+            'peak_rss_mb': peak_rss_mb(),
+            'counters': dict(self.counters),
+            'stages': sorted(self.records, key=lambda record: record['start_s']),
+        }
+
+    def save_json(self, output_file):
+        """Writes the summary as JSON."""
+        with open(output_file, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+        print(f"Profile written to {output_file}")
+
+    def save_trace(self, output_file):
+        """Writes the stage records in the Chrome trace event format (complete 'X' events, microseconds)."""
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.name or 'pipeline'}}]
+        for record in self.summary()['stages']:
+            args = {key: record[key] for key in ('cpu_s', 'peak_rss_mb', 'peak_rss_growth_mb') if key in record}
+            args.update(record.get('counters', {}))
+            events.append({
+                'name': record['stage'],
+                'cat': record['parent'] or 'stage',
+                'ph': 'X',
+                'ts': round(record['start_s'] * 1e6, 1),
+                'dur': round(record['wall_s'] * 1e6, 1),
+                'pid': pid,
+                'tid': record['thread'],
+                'args': args,
+            })
+        with open(output_file, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        print(f"Chrome trace written to {output_file}")
+
+
+def section(name, **counters):
+    """
+    Times a sub-stage in the active profiler; a no-op context when no profiler is active.
+
+    Args:
+    name (str): Sub-stage name.
+    **counters: Counters recorded on the sub-stage.
+    """
+    if _ACTIVE is None:
+        return contextlib.nullcontext()
+    return _ACTIVE.stage(name, **counters)
+
+
+def count(**counters):
+    """Sets counters on the active profiler's current stage; does nothing without an active profiler."""
+    if _ACTIVE is not None:
+        _ACTIVE.count(**counters)
@@ -0,0 +1,157 @@
+"""
+Residues.py
+
+Residue property tables and the pocket-lining residue annotation.
+
+The atoms lining every pocket are found with one KD-tree query over the points of all
+pockets; the lining residues are then grouped per pocket (chain-aware keys, see
+PDBparser.residue_index) and described with per-residue lookup tables (hydropathy,
+polarity, charge), all with array operations, so annotation costs little next to pocket
+detection even for thousands of pockets.
+
+Residues missing from the tables (nucleotides, ligands, modified residues) are listed as
+lining residues but do not enter the composition features.
+
+Functions:
+- residue_properties(resnames): Hydropathy, polarity and charge of residue names.
+- lining_pairs(points, point_pockets, coords, distance): (pocket, atom) hits within distance.
+- annotate_pockets(pockets, points, point_pockets, atoms, distance): Adds lining residues and
+  their composition to pocket dicts.
+"""
+
+import numpy as np
+
+import PDBparser
+
+# Kyte-Doolittle hydropathy (positive = hydrophobic)
+HYDROPATHY = {
+    'ALA': 1.8, 'ARG': -4.5, 'ASN': -3.5, 'ASP': -3.5, 'CYS': 2.5,
+    'GLN': -3.5, 'GLU': -3.5, 'GLY': -0.4, 'HIS': -3.2, 'ILE': 4.5,
+    'LEU': 3.8, 'LYS': -3.9, 'MET': 1.9, 'PHE': 2.8, 'PRO': -1.6,
+    'SER': -0.8, 'THR': -0.7, 'TRP': -0.9, 'TYR': -1.3, 'VAL': 4.2,
+}
+
+# Residues with a polar side chain (hydrogen-bond donors/acceptors or charged)
+POLAR = {'ARG', 'ASN', 'ASP', 'GLN', 'GLU', 'HIS', 'LYS', 'SER', 'THR', 'TYR', 'CYS'}
+
+# Side-chain charge at pH 7 (histidine counted as neutral)
+CHARGE = {'ARG': 1, 'LYS': 1, 'ASP': -1, 'GLU': -1}
+
+# Largest distance (Å) between a pocket point and the center of an atom lining it
+# (pocket voxel centers of the grid engine sit a probe radius plus an atom radius away)
+LINING_DISTANCE = 4.5
+
+# Lookup arrays over the sorted residue names of HYDROPATHY
+_NAMES = np.array(sorted(HYDROPATHY))
+_HYDROPATHY = np.array([HYDROPATHY[name] for name in _NAMES])
+_POLAR = np.array([name in POLAR for name in _NAMES], dtype=float)
+_CHARGE = np.array([CHARGE.get(name, 0) for name in _NAMES], dtype=float)
+
+
+def residue_properties(resnames):
+    """
+    Looks up the properties of residue names in one vectorized pass.
+
+    Args:
+    resnames (np.array): Residue names (e.g. 'LEU').
+
+    Returns:
+    known (np.array): True for names in the tables.
+    hydropathy (np.array): Kyte-Doolittle hydropathy (0 when unknown).
+    polar (np.array): 1.0 for polar residues, else 0.0.
+    charge (np.array): Side-chain charge at pH 7 (0 when unknown).
+    """
+    resnames = np.char.upper(np.char.strip(np.asarray(resnames, dtype=str)))
+    position = np.minimum(np.searchsorted(_NAMES, resnames), len(_NAMES) - 1)
+    known = _NAMES[position] == resnames
+    return (known, np.where(known, _HYDROPATHY[position], 0.0), np.where(known, _POLAR[position], 0.0),
+            np.where(known, _CHARGE[position], 0.0))
+
+
+def lining_pairs(points, point_pockets, coords, distance=LINING_DISTANCE):
+    """
+    Finds the atoms within distance of the points of every pocket, with one (dual-tree) KD-tree query.
+
+    Args:
+    points (np.array): Points of all pockets with shape (P, 3).
+    point_pockets (np.array): Pocket of every point (any integer id; negative ids are skipped).
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    distance (float): Largest point-to-atom distance in Å.
+
+    Returns:
+    pockets (np.array): Pocket id of every (point, atom) hit; a pair repeats when several
+        points of a pocket reach the same atom.
+    atoms (np.array): Atom index of every hit.
+    """
+    from scipy.spatial import cKDTree
+
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    point_pockets = np.asarray(point_pockets, dtype=np.int64)
+    keep = point_pockets >= 0
+    points, point_pockets = points[keep], point_pockets[keep]
+    if len(points) == 0 or len(coords) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    hits = cKDTree(points).sparse_distance_matrix(cKDTree(coords), distance, output_type='ndarray')
+    return point_pockets[hits['i']], hits['j'].astype(np.int64)
+
+
+def annotate_pockets(pockets, points, point_pockets, atoms, distance=LINING_DISTANCE):
+    """
+    Adds the lining residues of every pocket and their composition to the pocket dicts.
+
+    Args:
+    pockets (list): Pocket dicts with 'pocket_id' (modified in place).
+    points (np.array): Points of all pockets with shape (P, 3).
+    point_pockets (np.array): pocket_id of every point (-1 for points outside any pocket).
+    atoms (np.array): Structured array with PDBparser.ATOM_DTYPE.
+    distance (float): Largest point-to-atom distance in Å.
+
+    Adds to every pocket:
+    - lining_residues (str): Comma-separated residue keys ('A:57,A:102') in file order.
+    - num_lining_residues (int): Number of lining residues.
+    - hydrophobicity (float): Mean Kyte-Doolittle hydropathy of the known lining residues.
+    - polar_fraction (float): Fraction of the known lining residues that are polar.
+    - charge (float): Net side-chain charge of the lining residues.
+
+    Returns:
+    pockets (list): The same pocket dicts.
+    """
+    if not pockets:
+        return pockets
+    pair_pockets, pair_atoms = lining_pairs(points, point_pockets, atoms['coord'], distance)
+
+    # Unique (pocket, residue) pairs sorted by pocket, then residue (numbered in file order);
+    # a sort and a neighbor comparison are much faster than np.unique on millions of hits
+    keys, first, residue_of_atom = PDBparser.residue_index(atoms)
+    n_residues = len(keys)
+    codes = np.sort(pair_pockets * n_residues + residue_of_atom[pair_atoms])
+    codes = codes[np.concatenate([[True], codes[1:] != codes[:-1]])] if len(codes) else codes
+    pair_pockets, pair_residues = codes // n_residues, codes % n_residues
+
+    # Per-pocket sums over the lining residues, with pockets renumbered 0..n-1
+    pocket_ids = np.array([pocket['pocket_id'] for pocket in pockets], dtype=np.int64)
+    order = np.argsort(pocket_ids)
+    slot = np.searchsorted(pocket_ids[order], pair_pockets)
+    listed = (slot < len(order)) & (pocket_ids[order][np.minimum(slot, len(order) - 1)] == pair_pockets)
+    slot, pair_residues = order[slot[listed]], pair_residues[listed]
+
+    known, hydropathy, polar, charge = residue_properties(atoms['resname'][first])
+    n = len(pockets)
+    counts = np.bincount(slot, minlength=n)
+    n_known = np.bincount(slot, weights=known[pair_residues], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_hydropathy = np.bincount(slot, weights=hydropathy[pair_residues], minlength=n) / n_known
+        polar_fraction = np.bincount(slot, weights=polar[pair_residues], minlength=n) / n_known
+    net_charge = np.bincount(slot, weights=charge[pair_residues], minlength=n)
+
+    # Residue keys grouped per pocket (pairs are sorted by pocket id, then residue)
+    grouped = np.argsort(slot, kind='stable')
+    residue_lists = np.split(keys[pair_residues[grouped]], np.cumsum(counts)[:-1])
+    for i, pocket in enumerate(pockets):
+        pocket['lining_residues'] = ','.join(residue_lists[i].tolist())
+        pocket['num_lining_residues'] = int(counts[i])
+        pocket['hydrophobicity'] = float(np.nan_to_num(mean_hydropathy[i]))
+        pocket['polar_fraction'] = float(np.nan_to_num(polar_fraction[i]))
+        pocket['charge'] = float(net_charge[i])
+    return pockets
@@ -5,10 +5,15 @@ Implements heuristic scoring rules for ranking potential ligand-binding pockets
 based on geometric criteria such as volume, depth, enclosure, and curvature.
 
 Usage:
-    python Scoring.py <input_pockets.json> <output_scored_pockets.json>
+    python Scoring.py <input_pockets.json> <output_scored_pockets.json> [scoring_config.json] [TOP_K]
+
+Scoring bins and weights come from DEFAULT_CONFIG, or from a JSON config file with the
+same layout. Pocket artifact folders are scored as columns in one vectorized pass, so
+large pocket tables can be re-scored without re-running detection. Pass "" as the config
+to keep the default rules while giving TOP_K.
 
 Inputs:
-    - input_pockets.json: JSON file with a list of pocket dicts, each containing:
+    - input_pockets.json: JSON file (or pocket artifact folder) with a list of pocket dicts, each containing:
         {
             'volume': float,
             'depth': float,
@@ -17,13 +22,122 @@ Inputs:
         }
 
 Outputs:
-    - output_scored_pockets.json: Same as input, with an added 'score' field and sorted by score.
+    - output_scored_pockets.json: Same as input, with an added 'score' field and sorted by score
+      (only the TOP_K best when given).
 """
 
 import sys
 import json
 
-def score_pocket(pocket):
+import numpy as np
+
+import Artifacts
+
+# Scoring terms: a pocket earns points[i] for the bin its value falls in, times the term's
+# weight. Bins follow np.digitize: with "right": true a value equal to an edge stays in the
+# lower bin (strict '>' thresholds); with "right": false it moves up (strict '<' thresholds).
+# A JSON file with the same layout (any subset of terms/keys) overrides these defaults.
+DEFAULT_CONFIG = {
+    # Å³ swept by the probe; below 100 Å³ hardly a small ligand fits (the 3PTB S1 pocket is about 240 Å³)
+    'volume': {'bins': [100, 400], 'points': [0, 1, 2], 'right': True, 'weight': 1.0},
+    # Å below the convex hull; about the quartiles of DBSCAN pocket depths on the example structures
+    'depth': {'bins': [6, 10], 'points': [0, 1, 2], 'right': True, 'weight': 1.0},
+    # Blocked ray fraction; about the medians of the two engines on the example structures
+    'enclosure': {'bins': [0.6, 0.75], 'points': [0, 1, 2], 'right': True, 'weight': 1.0},
+    # 1/Å, lower = less convex; pocket surfaces average mildly convex at the 8 Å fit scale, and
+    # the edges sit near the lower quartile and the median of pocket curvature on the examples
+    'curvature': {'bins': [0.02, 0.05], 'points': [2, 1, 0], 'right': False, 'weight': 1.0},
+}
+
+def load_config(config_file=None):
+    """
+    Loads the scoring configuration, filling missing terms and keys from DEFAULT_CONFIG.
+
+    Parameters:
+    - config_file (str): JSON file with scoring terms; None returns the defaults.
+
+    Returns:
+    - config (dict): Term name -> {'bins', 'points', 'right', 'weight'}.
+    """
+    config = {term: dict(spec) for term, spec in DEFAULT_CONFIG.items()}
+    if config_file is None:
+        return config
+
+    with open(config_file, 'r') as f:
+        overrides = json.load(f)
+    for term, spec in overrides.items():
+        config[term] = dict(config.get(term, {'right': True, 'weight': 1.0}), **spec)
+        if len(config[term]['points']) != len(config[term]['bins']) + 1:
+            raise ValueError(f"Scoring term '{term}' needs one more points value than bins")
+    return config
+
+def term_bins(table, config=None):
+    """
+    Finds the bin of every pocket for every scoring term.
+
+    Parameters:
+    - table (dict): Column name -> array with one row per pocket.
+    - config (dict): Scoring configuration (default: DEFAULT_CONFIG).
+
+    Returns:
+    - bins (dict): Term name -> bin index per pocket (0 = below the first edge).
+    """
+    config = config or DEFAULT_CONFIG
+    return {term: np.digitize(np.asarray(table[term], dtype=float), spec['bins'], right=spec.get('right', True))
+            for term, spec in config.items()}
+
+def score_table(table, config=None):
+    """
+    Scores a columnar pocket table in one vectorized pass per term.
+
+    Parameters:
+    - table (dict): Column name -> array with one row per pocket (e.g. from Artifacts.load_arrays).
+    - config (dict): Scoring configuration (default: DEFAULT_CONFIG).
+
+    Returns:
+    - scores (np.array): Score per pocket (higher = more likely to bind ligand).
+    """
+    config = config or DEFAULT_CONFIG
+    n_pockets = len(next(iter(table.values()))) if table else 0
+    scores = np.zeros(n_pockets)
+    for term, bins in term_bins(table, config).items():
+        spec = config[term]
+        scores += spec.get('weight', 1.0) * np.asarray(spec['points'], dtype=float)[bins]
+    return scores
+
+def top_k(scores, k=None, tiebreak=None):
+    """
+    Returns the indices of the k best pockets, best first, without sorting all of them.
+
+    The candidates are found with np.argpartition; only those are sorted. Ties are ordered
+    by descending tiebreak value, then keep the original pocket order, as a stable full
+    sort would.
+
+    Parameters:
+    - scores (np.array): Score per pocket.
+    - k (int): Number of pockets to return (default: all).
+    - tiebreak (np.array): Optional secondary key per pocket, larger first (e.g. the volume).
+
+    Returns:
+    - order (np.array): Pocket indices sorted by descending score.
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    tiebreak = np.zeros(n) if tiebreak is None else np.asarray(tiebreak, dtype=float)
+    if k is None or k >= n:
+        candidates = np.arange(n)
+    elif k <= 0:
+        return np.zeros(0, dtype=int)
+    else:
+        # Everything strictly above the k-th best score, then the best ties to fill up to k
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)
+        ties = ties[np.lexsort((ties, -tiebreak[ties]))][:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    return candidates[np.lexsort((candidates, -tiebreak[candidates], -scores[candidates]))]
+
+def score_pocket(pocket, config=None):
     """
     Scores a pocket based on its geometric properties.
 
@@ -35,71 +149,79 @@ def score_pocket(pocket):
             'enclosure': float,  # 0 to 1 (1 = fully enclosed)
             'curvature': float,  # avg negative curvature preferred
         }
+    - config (dict): Scoring configuration (default: DEFAULT_CONFIG).
 
     Returns:
-    - int: Heuristic score (higher = more likely to bind ligand)
+    - float: Heuristic score (higher = more likely to bind ligand)
     """
-    score = 0
-
-    # Volume scoring
-    if pocket['volume'] > 800:
-        score += 2
-    elif pocket['volume'] > 300:
-        score += 1
-
-    # Depth scoring
-    if pocket['depth'] > 10:
-        score += 2
-    elif pocket['depth'] > 5:
-        score += 1
-
-    # Enclosure scoring
-    if pocket['enclosure'] > 0.7:
-        score += 2
-    elif pocket['enclosure'] > 0.4:
-        score += 1
+    table = {term: [pocket[term]] for term in (config or DEFAULT_CONFIG)}
+    return float(score_table(table, config)[0])
 
-    # Curvature (negative = concave, desirable)
-    if pocket['curvature'] < -0.3:
-        score += 2
-    elif pocket['curvature'] < -0.1:
-        score += 1
 
-    return score
-
-
-def rank_pockets(pockets):
+def rank_pockets(pockets, config=None, k=None):
     """
-    Ranks a list of pockets by their heuristic scores.
+    Ranks a list of pockets by their heuristic scores; equal scores rank the larger volume first.
 
     Parameters:
     - pockets (list): List of dicts, each representing a pocket.
+    - config (dict): Scoring configuration (default: DEFAULT_CONFIG).
+    - k (int): Only return the k best pockets (default: all).
 
     Returns:
     - List of dicts, each with an added 'score' field, sorted by score descending.
     """
-    for pocket in pockets:
-        pocket['score'] = score_pocket(pocket)
-    return sorted(pockets, key=lambda p: p['score'], reverse=True)
-
+    if not pockets:
+        return []
+    table = Artifacts.records_to_columns(pockets)
+    scores = score_table(table, config)
+    for pocket, score in zip(pockets, scores.tolist()):
+        pocket['score'] = score
+    return [pockets[i] for i in top_k(scores, k, table.get('volume'))]
 
-def main(input_file, output_file):
-    with open(input_file, 'r') as f:
-        pockets = json.load(f)
 
-    ranked = rank_pockets(pockets)
+def save_scored_pockets(ranked, output_file):
+    """
+    Writes ranked pockets to a JSON file.
 
+    Parameters:
+    - ranked (list): List of scored pocket dicts.
+    - output_file (str): Path of the output JSON file.
+    """
     with open(output_file, 'w') as f:
         json.dump(ranked, f, indent=4)
 
     print(f"Scored pockets written to {output_file}")
 
 
+def main(input_file, output_file, config_file=None, k=None):
+    config = load_config(config_file)
+
+    if not Artifacts.is_artifact(input_file):
+        with open(input_file, 'r') as f:
+            pockets = json.load(f)
+        save_scored_pockets(rank_pockets(pockets, config, k), output_file)
+        return
+
+    # Pocket artifacts are scored column-wise without building a dict per pocket
+    table, _ = Artifacts.load_arrays(input_file)
+    if not table:
+        save_scored_pockets([], output_file)
+        return
+    scores = score_table(table, config)
+    order = top_k(scores, k, table.get('volume'))
+    ranked = Artifacts.columns_to_records({name: np.asarray(values)[order] for name, values in table.items()})
+    for pocket, score in zip(ranked, scores[order].tolist()):
+        pocket['score'] = score
+    save_scored_pockets(ranked, output_file)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
+    if len(sys.argv) < 3:
         print(__doc__)
         sys.exit(1)
 
     input_file = sys.argv[1]
     output_file = sys.argv[2]
-    main(input_file, output_file)
+    config_file = sys.argv[3] or None if len(sys.argv) > 3 else None
+    k = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    main(input_file, output_file, config_file, k)
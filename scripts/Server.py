@@ -0,0 +1,473 @@
+"""
+Server.py
+
+Long-running local prediction service with pre-warmed pipeline workers.
+
+The service listens on localhost HTTP or on a Unix socket and runs the pipeline in a pool
+of worker processes that import the scientific stack and build their Pipeline once, at
+startup, so a request only pays for the computation itself. At most WORKERS structures
+run at a time and at most QUEUE more wait for a worker; beyond that a request is refused
+at once with 503 and a Retry-After header (back-pressure) rather than piling up.
+
+Endpoints:
+- GET  /health   Service state: workers, running and queued requests, capacity.
+- POST /predict  Runs the pipeline on one structure. The body is the structure file (PDB or
+                 mmCIF, optionally gzip-compressed; ?name=<file name> tells the format from
+                 its extension, PDB by default), or empty with ?path=<local file>. Pipeline
+                 options can be given as query parameters (see REQUEST_OPTIONS), e.g.
+                 ?engine=grid&top_k=5.
+
+A prediction is streamed back as NDJSON (one JSON object per line, chunked transfer):
+{"event": "accepted"}, then {"event": "pocket", "rank": 1, ...} for every ranked pocket,
+{"event": "pymol", "script": "..."} with the script of Visualize.py, and finally
+{"event": "done", ...} or {"event": "error", "error": "..."}.
+
+Usage:
+    python Server.py serve [--host HOST] [--port PORT | --socket PATH] [--workers N] [--queue N]
+    python Server.py submit <STRUCTURE_FILE> [--port PORT | --socket PATH] [--path] [-o OPTION=VALUE ...]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Largest accepted request body (structure file) in bytes
+MAX_BODY_BYTES = 512 * 1024 ** 2
+
+# Pipeline options a request may override, with the conversion of their query values
+REQUEST_OPTIONS = {
+    'altloc': lambda value: None if value == 'all' else value,
+    'model': lambda value: None if value == 'all' else value,
+    'hetatm': lambda value: value.lower() in ('1', 'true', 'yes'),
+    'accessibility_method': str,
+    'accessibility_threshold': float,
+    'alpha': lambda value: value if value == 'auto' else float(value),
+    'engine': str,
+    'grid_spacing': float,
+    'eps': lambda value: value if value == 'auto' else float(value),
+    'min_size': int,
+    'min_depth': float,
+    'top_k': int,
+}
+
+# Options and pipeline of the current worker process, set by _init_worker
+_OPTIONS = None
+_PIPELINE = None
+
+
+def _init_worker(options):
+    """Builds the pipeline once per worker process and imports everything the stages use."""
+    global _OPTIONS, _PIPELINE
+    import scipy.ndimage
+    import scipy.sparse.csgraph
+    import scipy.spatial
+    import PockGrid
+    from Pipeline import Pipeline
+
+    _OPTIONS = options
+    _PIPELINE = Pipeline(**options)
+
+
+def _warm_up(seconds):
+    """Keeps a worker busy for a moment, so that the pool starts all of its workers."""
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _json_value(value):
+    """Converts numpy scalars and arrays to plain Python values for JSON."""
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+def predict(structure, name=None, overrides=None):
+    """
+    Worker entry point: runs the pipeline on one structure without writing any file.
+
+    Args:
+    structure (str or bytes): Path of the structure file, or its content.
+    name (str): File name of the content (its extension selects the format).
+    overrides (dict): Pipeline options replacing those of the service for this request.
+
+    Returns:
+    result (dict): 'pockets' (ranked pocket dicts with 'score'), 'pymol_script', 'n_atoms' and 'seconds'.
+    """
+    import contextlib
+    import Visualize
+    from Pipeline import Pipeline
+
+    start = time.perf_counter()
+    pipeline = Pipeline(**dict(_OPTIONS, **overrides)) if overrides else _PIPELINE
+    temporary = None
+    if isinstance(structure, bytes):
+        suffix = ''.join(os.path.basename(name or 'structure.pdb').partition('.')[1:]) or '.pdb'
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+            f.write(structure)
+        structure = temporary = f.name
+
+    try:
+        # The pipeline's progress output stays out of the service log
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = pipeline.run(structure)
+    finally:
+        if temporary is not None:
+            os.remove(temporary)
+
+    pockets = [{key: _json_value(value) for key, value in pocket.items()} for pocket in result['scored']]
+    return {
+        'pockets': pockets,
+        'pymol_script': Visualize.build_pymol_script(pockets),
+        'n_atoms': len(result['atoms']),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def parse_options(query):
+    """
+    Converts request query parameters into pipeline options.
+
+    Args:
+    query (dict): Parsed query string (parameter -> list of values).
+
+    Returns:
+    overrides (dict): Pipeline options.
+    """
+    overrides = {}
+    for key, values in query.items():
+        if key in ('name', 'path'):
+            continue
+        if key not in REQUEST_OPTIONS:
+            raise ValueError(f"Unknown option '{key}'")
+        try:
+            overrides[key] = REQUEST_OPTIONS[key](values[-1])
+        except ValueError:
+            raise ValueError(f"Invalid value '{values[-1]}' for option '{key}'")
+    if overrides.get('engine', 'dbscan') not in ('dbscan', 'grid'):
+        raise ValueError(f"Unknown engine '{overrides['engine']}'")
+    return overrides
+
+
+class PocketService:
+    """
+    Pool of pre-warmed pipeline workers with a bounded number of admitted requests.
+
+    Args:
+    workers (int): Worker processes (default: number of CPUs).
+    queue (int): Requests allowed to wait for a worker on top of the running ones.
+    **options: Keyword arguments for Pipeline used by every request.
+    """
+
+    def __init__(self, workers=None, queue=None, **options):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue = self.workers if queue is None else max(0, queue)
+        self.options = dict(options, save_intermediates=False, plot=False)
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue)
+        self.admitted = 0
+        self.lock = threading.Lock()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(self.options,))
+
+    def warm_up(self):
+        """Starts every worker and waits until all of them have imported the pipeline."""
+        start = time.perf_counter()
+        pids = set(self.pool.map(_warm_up, [0.2] * self.workers))
+        print(f"{len(pids)} worker(s) ready in {time.perf_counter() - start:.1f}s.")
+
+    def try_admit(self):
+        """Takes a request slot; returns False when the service is at capacity."""
+        if not self.slots.acquire(blocking=False):
+            return False
+        with self.lock:
+            self.admitted += 1
+        return True
+
+    def release(self):
+        """Gives a request slot back."""
+        with self.lock:
+            self.admitted -= 1
+        self.slots.release()
+
+    def submit(self, structure, name=None, overrides=None):
+        """Submits one prediction to the pool; returns its future."""
+        return self.pool.submit(predict, structure, name, overrides)
+
+    def health(self):
+        """Returns the service state."""
+        with self.lock:
+            admitted = self.admitted
+        return {
+            'status': 'ok',
+            'workers': self.workers,
+            'running': min(admitted, self.workers),
+            'queued': max(0, admitted - self.workers),
+            'capacity': self.workers + self.queue,
+        }
+
+    def close(self):
+        """Stops the workers."""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a PocketService (available as self.server.service)."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def send_json(self, status, body, headers=()):
+        """Sends a complete JSON response."""
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_event(self, event, **fields):
+        """Streams one NDJSON line as an HTTP chunk."""
+        data = json.dumps(dict(event=event, **fields)).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == '/health':
+            self.send_json(200, self.server.service.health())
+        else:
+            self.send_json(404, {'error': f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/predict':
+            self.send_json(404, {'error': f"Unknown endpoint {url.path}"})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {'error': f"Structure larger than {MAX_BODY_BYTES} bytes"},
+                           [('Connection', 'close')])
+            self.close_connection = True
+            return
+        body = self.rfile.read(length) if length else b''
+
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            overrides = parse_options(query)
+        except ValueError as error:
+            self.send_json(400, {'error': str(error)})
+            return
+        if 'path' in query:
+            structure, name = query['path'][-1], None
+            if not os.path.isfile(structure):
+                self.send_json(404, {'error': f"File '{structure}' not found."})
+                return
+        elif body:
+            structure, name = body, query.get('name', ['structure.pdb'])[-1]
+        else:
+            self.send_json(400, {'error': "Send the structure as the request body or give ?path="})
+            return
+
+        service = self.server.service
+        if not service.try_admit():
+            self.send_json(503, {'error': "Service at capacity, retry later", **service.health()},
+                           [('Retry-After', '1')])
+            return
+        admitted = True
+
+        try:
+            future = service.submit(structure, name, overrides)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            health = service.health()
+            self.send_event('accepted', running=health['running'], queued=health['queued'])
+            try:
+                result, error = future.result(), None
+            except Exception as failure:
+                result, error = None, f"{type(failure).__name__}: {failure}"
+            # The worker is free again before the (possibly slow) client reads the results
+            service.release()
+            admitted = False
+
+            if error is not None:
+                self.send_event('error', error=error)
+            else:
+                for rank, pocket in enumerate(result['pockets'], 1):
+                    self.send_event('pocket', rank=rank, **pocket)
+                self.send_event('pymol', script=result['pymol_script'])
+                self.send_event('done', n_pockets=len(result['pockets']), n_atoms=result['n_atoms'],
+                                seconds=result['seconds'])
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client left; the prediction still finishes and frees its slot
+            self.close_connection = True
+            if admitted:
+                future.add_done_callback(lambda _: service.release())
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server on a Unix socket."""
+
+    daemon_threads = True
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    Builds the HTTP server of a service.
+
+    Args:
+    service (PocketService): Workers serving the requests.
+    host (str): Interface to listen on (localhost by default).
+    port (int): TCP port; 0 picks a free one.
+    socket_path (str): Listen on this Unix socket instead of TCP.
+
+    Returns:
+    server (socketserver.BaseServer): Server with the service attached; call serve_forever().
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP client connection over a Unix socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=None):
+    """Opens a client connection to a service."""
+    if socket_path is not None:
+        return UnixHTTPConnection(socket_path, timeout=timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def submit(structure_file, send_path=False, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, **options):
+    """
+    Client: sends one structure to a running service and yields its events as they arrive.
+
+    Args:
+    structure_file (str): Structure file.
+    send_path (bool): Send the file path (the service reads the file) instead of its content.
+    host, port, socket_path: Address of the service (see make_server).
+    **options: Pipeline options for this request (see REQUEST_OPTIONS).
+
+    Yields:
+    event (dict): Decoded NDJSON events; a refused request yields one {'event': 'error', 'status': ...}.
+    """
+    query = {key: value for key, value in options.items() if value is not None}
+    if send_path:
+        query['path'] = os.path.abspath(structure_file)
+        body = b''
+    else:
+        query['name'] = os.path.basename(structure_file)
+        with open(structure_file, 'rb') as f:
+            body = f.read()
+
+    connection = connect(host, port, socket_path)
+    try:
+        connection.request('POST', '/predict?' + urllib.parse.urlencode(query), body=body,
+                           headers={'Content-Type': 'application/octet-stream'})
+        response = connection.getresponse()
+        if response.status != 200:
+            yield dict(json.loads(response.read() or b'{}'), event='error', status=response.status)
+            return
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        connection.close()
+
+
+def build_parser():
+    """Builds the command-line interface."""
+    parser = argparse.ArgumentParser(description="Local pocket prediction service.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="Run the service")
+    submit_command = commands.add_parser('submit', help="Send a structure to a running service")
+    for command in (serve, submit_command):
+        command.add_argument('--host', default=DEFAULT_HOST, help=f"Interface (default: {DEFAULT_HOST})")
+        command.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+        command.add_argument('--socket', default=None, help="Unix socket path instead of TCP")
+
+    serve.add_argument('--workers', type=int, default=None, help="Worker processes (default: number of CPUs)")
+    serve.add_argument('--queue', type=int, default=None,
+                       help="Requests that may wait for a worker before new ones are refused (default: workers)")
+    serve.add_argument('--engine', choices=['dbscan', 'grid'], default='dbscan', help="Default pocket engine")
+    serve.add_argument('--cache-dir', default=None, help="Stage result cache shared by the workers (default: none)")
+
+    submit_command.add_argument('structure', help="PDB or mmCIF file")
+    submit_command.add_argument('--path', action='store_true', help="Send the file path instead of its content")
+    submit_command.add_argument('-o', '--option', action='append', default=[], metavar='OPTION=VALUE',
+                                help=f"Pipeline option for this request, repeatable: {', '.join(REQUEST_OPTIONS)}")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    if args.command == 'submit':
+        options = dict(option.split('=', 1) for option in args.option)
+        failed = False
+        for event in submit(args.structure, args.path, args.host, args.port, args.socket, **options):
+            if event['event'] == 'pymol':
+                print(event['script'], end='')
+            else:
+                print(json.dumps(event))
+            failed = failed or event['event'] == 'error'
+        sys.exit(1 if failed else 0)
+
+    options = {'engine': args.engine}
+    if args.cache_dir:
+        from Cache import StageCache
+        options['cache'] = StageCache(args.cache_dir)
+
+    service = PocketService(args.workers, args.queue, **options)
+    server = make_server(service, args.host, args.port, args.socket)
+    service.warm_up()
+    address = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"Serving on {address} with {service.workers} worker(s), up to {service.queue} queued request(s).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
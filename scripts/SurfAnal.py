@@ -1,87 +1,416 @@
 import numpy as np
-import scipy.spatial as spatial
-from scipy.spatial import Delaunay
-from scipy.spatial.qhull import QhullError
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-import matplotlib.pyplot as plt
 import json
 import sys
 
-def compute_surface(pdb_data, accessibility_threshold=0.5):
+import Artifacts
+import Parallel
+import PDBparser
+import Profiler
+import Residues
+
+def load_pdb_data(pdb_data):
     """
-    Computes the molecular surface using Alpha Shapes (Delaunay triangulation).
-    
+    Converts parsed PDB data (as written by PDBparser.py) into coordinate and accessibility arrays.
+
     Args:
-    pdb_data (dict): Parsed PDB data containing atoms, residues, and accessibility.
-    accessibility_threshold (float): The minimum accessibility value for an atom to be considered accessible.
-    
+    pdb_data (dict): Parsed PDB data, either loaded from JSON or from an artifact folder.
+
     Returns:
-    surface_points (np.array): Surface points with (x, y, z).
-    surface_properties (dict): Surface properties such as curvature and depth.
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    accessibility (np.array): Solvent accessibility per atom.
     """
+    # Artifacts already hold columns, which are used without copying
+    if 'coord' in pdb_data:
+        return pdb_data['coord'], pdb_data['accessibility']
+
     atoms = pdb_data['atoms']
-    residues = pdb_data['residues']
     accessibility = pdb_data['accessibility']
-    
-    # Check the lengths of atoms and accessibility to ensure they are valid
-    print(f"Total atoms: {len(atoms)}")
-    
-    # Extract coordinates of atoms that are accessible (above the threshold)
-    accessible_atoms = [
-        atom for i, atom in enumerate(atoms) if accessibility[str(i)] >= accessibility_threshold
-    ]
-    print(f"Accessible atoms count: {len(accessible_atoms)}")
-    
-    # If no accessible atoms, print the reason
-    if not accessible_atoms:
-        print("Warning: No accessible atoms found based on the accessibility data.")
-        return None, None
-    
-    # Extract the coordinates of accessible atoms (coordinates are stored in 'coordinates' list)
-    accessible_coords = np.array([atom['coordinates'] for atom in accessible_atoms])
 
-    # Check the shape to ensure it is 2D with 3 coordinates per atom
-    print(f"Accessible coordinates shape: {accessible_coords.shape}")
+    coords = np.array([atom['coordinates'] for atom in atoms], dtype=float).reshape(-1, 3)
+    values = np.array([accessibility[str(i)] for i in range(len(atoms))], dtype=float)
+    return coords, values
+
+# Default alpha-shape circumradius cutoff (Å): about a heavy-atom radius plus the 1.4 Å
+# solvent probe, so removed tetrahedra are those a probe fits into
+SURFACE_ALPHA = 3.0
+
+# Radius (Å) of the sphere in which atoms are counted for the buriedness of a surface point
+BURIEDNESS_RADIUS = 10.0
+
+# Radius (Å) of the surface neighborhood fitted around each point for its curvature: pocket
+# scale, about a ligand's contact patch (a few neighbors only span one surface atom, a convex
+# bump), and the largest number of neighbors fitted (the nearest are kept beyond it; the
+# examples have at most 88 surface points within 8 Å)
+CURVATURE_RADIUS = 8.0
+CURVATURE_MAX_NEIGHBORS = 96
+
+# Largest number of surface points embedded in the PCA/t-SNE plot (t-SNE is quadratic in it)
+PLOT_MAX_POINTS = 2000
+
+# Vertex triples of the four triangular faces of a tetrahedron; face i lies opposite vertex i
+TETRAHEDRON_FACES = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+
+def circumradii(tetrahedra):
+    """
+    Computes the circumsphere radius of every tetrahedron.
+
+    Args:
+    tetrahedra (np.array): Vertex coordinates with shape (T, 4, 3).
+
+    Returns:
+    radii (np.array): Circumradius per tetrahedron; np.inf for flat (degenerate) ones.
+    """
+    a = tetrahedra[:, 1] - tetrahedra[:, 0]
+    b = tetrahedra[:, 2] - tetrahedra[:, 0]
+    c = tetrahedra[:, 3] - tetrahedra[:, 0]
+    b_cross_c = np.cross(b, c)
+    c_cross_a = np.cross(c, a)
+    a_cross_b = np.cross(a, b)
+
+    # Circumcenter relative to the first vertex: (|a|² b×c + |b|² c×a + |c|² a×b) / (2 a·(b×c))
+    numerator = ((a * a).sum(axis=1)[:, None] * b_cross_c
+                 + (b * b).sum(axis=1)[:, None] * c_cross_a
+                 + (c * c).sum(axis=1)[:, None] * a_cross_b)
+    denominator = 2.0 * np.abs((a * b_cross_c).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radii = np.linalg.norm(numerator, axis=1) / denominator
+    radii[~np.isfinite(radii)] = np.inf
+    return radii
+
+def auto_alpha(simplices, radii, n_points):
+    """
+    Returns the smallest alpha for which every point belongs to at least one kept tetrahedron.
+
+    Args:
+    simplices (np.array): Delaunay tetrahedra as vertex indices with shape (T, 4).
+    radii (np.array): Circumradius per tetrahedron.
+    n_points (int): Number of triangulated points.
+
+    Returns:
+    alpha (float): Circumradius cutoff in Å.
+    """
+    smallest = np.full(n_points, np.inf)
+    np.minimum.at(smallest, simplices.ravel(), np.repeat(radii, 4))
+    smallest = smallest[np.isfinite(smallest)]
+    return float(smallest.max()) if len(smallest) else np.inf
+
+def alpha_shape(points, alpha=None):
+    """
+    Extracts the boundary of the alpha shape of a point set.
+
+    Delaunay tetrahedra with a circumradius above alpha are discarded; the surface is made
+    of the faces that belong to exactly one remaining tetrahedron. Unlike the convex hull,
+    the alpha shape follows concave regions whose openings are wider than alpha allows.
+
+    Args:
+    points (np.array): Coordinates with shape (N, 3).
+    alpha (float): Circumradius cutoff in Å; None picks the smallest alpha that keeps every point.
+
+    Returns:
+    vertices (np.array): Sorted indices into points of the unique surface vertices.
+    facets (np.array): Surface triangles as indices into vertices, shape (M, 3), oriented outwards.
+    alpha (float): Alpha that was used.
+    """
+    from scipy.spatial import Delaunay
+
+    tri = Delaunay(points)
+    simplices = tri.simplices
+    radii = circumradii(points[simplices])
+    if alpha is None:
+        alpha = auto_alpha(simplices, radii, len(points))
+
+    kept = simplices[radii <= alpha]
+    faces = kept[:, TETRAHEDRON_FACES].reshape(-1, 3)
+    opposite = kept.reshape(-1)
+
+    # A face shared by two kept tetrahedra is interior; count faces by their sorted vertex triple
+    ordered = np.sort(faces, axis=1).astype(np.int64)
+    n = np.int64(len(points))
+    codes = (ordered[:, 0] * n + ordered[:, 1]) * n + ordered[:, 2]
+    _, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    boundary = first[counts == 1]
+    facets = faces[boundary]
+
+    # Orient every facet away from the tetrahedron it bounds
+    corner = points[facets[:, 0]]
+    normals = np.cross(points[facets[:, 1]] - corner, points[facets[:, 2]] - corner)
+    inward = (normals * (points[opposite[boundary]] - corner)).sum(axis=1) > 0
+    facets[inward] = facets[inward][:, [0, 2, 1]]
+
+    vertices = np.unique(facets)
+    return vertices, np.searchsorted(vertices, facets), alpha
+
+def hull_depth(points, coords, chunk_size=4096, workers=1):
+    """
+    Computes how far each point lies below the convex hull of the protein.
+
+    The depth of a point inside the hull is its distance to the closest hull plane,
+    evaluated for all points and facets at once (in chunks of points to bound memory,
+    processed on a thread pool when workers > 1).
+    Points on the hull have depth 0; pocket floors lie several Å deep.
+
+    Args:
+    points (np.array): Query points with shape (S, 3).
+    coords (np.array): Atomic coordinates of the whole protein with shape (N, 3).
+    chunk_size (int): Number of points evaluated per batch.
+    workers (int): Threads processing the chunks (see Parallel.resolve_workers).
 
-    if accessible_coords.shape[0] < 4:
-        print("Error: Not enough accessible coordinates to perform Delaunay triangulation.")
-        return None, None
+    Returns:
+    depth (np.array): Depth per point in Å (0 for points on or outside the hull).
+    """
+    from scipy.spatial import ConvexHull, QhullError
 
-    # Compute Delaunay triangulation (used for surface calculation)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
     try:
-        tri = Delaunay(accessible_coords)
+        equations = ConvexHull(coords).equations
     except QhullError:
-        print("Error: Unable to compute Delaunay triangulation. Try a different distance threshold.")
-        return None, None
+        # Flat or tiny structures have no volume, hence no depth
+        return np.zeros(len(points))
 
-    # Extract surface points from convex hull (used for Alpha Shape approximation)
-    surface_indices = tri.convex_hull
-    surface_points = accessible_coords[surface_indices.flatten()]
+    # Hull planes n·x + d <= 0 inside, with unit outward normals n
+    normals, offsets = equations[:, :3], equations[:, 3]
+    depth = np.empty(len(points))
 
-    # Compute surface properties (placeholder for curvature and depth)
-    surface_properties = {
-        'curvature': np.random.rand(len(surface_points)),  # Placeholder for curvature
-        'depth': np.random.rand(len(surface_points))  # Placeholder for depth
-    }
+    def block_depth(start, stop):
+        depth[start:stop] = (-(points[start:stop] @ normals.T + offsets)).min(axis=1)
+
+    Parallel.map_blocks(block_depth, len(points), chunk_size, workers)
+    return np.maximum(depth, 0.0)
+
+def atom_buriedness(points, coords, radius=BURIEDNESS_RADIUS, tree=None, workers=1):
+    """
+    Counts the protein atoms within a sphere around each point (half-sphere exposure proxy).
+
+    Args:
+    points (np.array): Query points with shape (S, 3).
+    coords (np.array): Atomic coordinates of the whole protein with shape (N, 3).
+    radius (float): Sphere radius in Å.
+    tree (cKDTree): Optional prebuilt KD-tree over coords.
+    workers (int): Threads for the KD-tree query.
+
+    Returns:
+    counts (np.array): Number of atoms within radius of each point.
+    """
+    if tree is None:
+        from scipy.spatial import cKDTree
+
+        tree = cKDTree(coords)
+    counts = tree.query_ball_point(points, radius, return_length=True, workers=Parallel.kdtree_workers(workers))
+    return np.asarray(counts, dtype=np.int64)
+
+def vertex_normals(points, facets):
+    """
+    Computes outward unit normals at the vertices of an oriented triangle mesh.
+
+    Args:
+    points (np.array): Vertex coordinates with shape (S, 3).
+    facets (np.array): Outward-oriented triangles as vertex indices, shape (M, 3).
+
+    Returns:
+    normals (np.array): Area-weighted unit normal per vertex, shape (S, 3).
+    """
+    corner = points[facets[:, 0]]
+    facet_normals = np.cross(points[facets[:, 1]] - corner, points[facets[:, 2]] - corner)
+    normals = np.zeros((len(points), 3))
+    for axis in range(3):
+        np.add.at(normals, facets[:, axis], facet_normals)
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+def local_curvature(points, normals, radius=CURVATURE_RADIUS, max_neighbors=CURVATURE_MAX_NEIGHBORS, workers=1,
+                    chunk_size=2048):
+    """
+    Estimates the signed curvature of the surface at every point from its neighbors within radius.
+
+    For every point, the plane through its neighborhood (covariance eigenvector with the
+    smallest eigenvalue, oriented like the mesh normal) is the tangent plane. Neighbor heights
+    above it follow h = -k d² / 2 on a sphere of curvature k, so k is fitted by least squares
+    over all neighborhoods at once. Convex points get positive values and concave points
+    (pockets) negative values, in 1/Å. Neighborhoods are padded to max_neighbors and the
+    padding is masked out of every sum; a point with fewer than 3 neighbors gets 0.
+
+    Args:
+    points (np.array): Surface points with shape (S, 3).
+    normals (np.array): Outward normals used to orient the fitted planes, shape (S, 3).
+    radius (float): Neighborhood radius in Å.
+    max_neighbors (int): Largest number of (nearest) neighbors per neighborhood.
+    workers (int): Threads for the neighbor query and the per-chunk fits.
+    chunk_size (int): Number of points fitted per batch.
+
+    Returns:
+    curvature (np.array): Signed curvature per point.
+    """
+    max_neighbors = min(max_neighbors, len(points) - 1)
+    if max_neighbors < 3:
+        return np.zeros(len(points))
+
+    # Neighbors of every point in one batched query (the first hit is the point itself);
+    # missing neighbors come back at infinite distance with index len(points)
+    from scipy.spatial import cKDTree
+
+    distances, neighbors = cKDTree(points).query(points, k=max_neighbors + 1, distance_upper_bound=radius,
+                                                 workers=Parallel.kdtree_workers(workers))
+    inside = np.isfinite(distances[:, 1:])
+    neighbors = np.where(inside, neighbors[:, 1:], 0)
+    curvature = np.zeros(len(points))
+
+    def block_curvature(start, stop):
+        # Neighbors come sorted by distance, so the padding is trimmed to the fullest neighborhood
+        width = max(int(inside[start:stop].sum(axis=1).max()), 1)
+        mask = inside[start:stop, :width, None]
+        offsets = np.where(mask, points[neighbors[start:stop, :width]] - points[start:stop, None, :], 0.0)
+        counts = mask.sum(axis=1)
+
+        # Tangent-plane normal: eigenvector of the neighborhood covariance with the smallest eigenvalue
+        centered = np.where(mask, offsets - offsets.sum(axis=1, keepdims=True) / np.maximum(counts, 1)[:, None], 0.0)
+        covariance = np.einsum('sni,snj->sij', centered, centered)
+        plane_normals = np.linalg.eigh(covariance)[1][:, :, 0]
+        flip = (plane_normals * normals[start:stop]).sum(axis=1) < 0
+        plane_normals[flip] *= -1
+
+        heights = np.einsum('sni,si->sn', offsets, plane_normals)
+        squared = (offsets ** 2).sum(axis=2)
+        fitted = counts[:, 0] >= 3
+        curvature[start:stop][fitted] = (-2.0 * (heights * squared).sum(axis=1)[fitted]
+                                         / (squared ** 2).sum(axis=1)[fitted])
+
+    Parallel.map_blocks(block_curvature, len(points), chunk_size, workers)
+    return curvature
+
+def surface_point_properties(surface_points, facets, atom_index, coords, workers=1):
+    """
+    Computes the per-point properties of a surface (see compute_surface).
+
+    Trajectory.py calls it directly on frames that keep the surface of an earlier frame,
+    with the points moved to the new atom positions.
+
+    Args:
+    surface_points (np.array): Surface points with shape (P, 3).
+    facets (np.array): Surface triangles as indices into surface_points, shape (M, 3).
+    atom_index (np.array): Index of the atom each point sits on.
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    workers (int): Threads for the curvature, depth and buriedness kernels (see Parallel.py).
+
+    Returns:
+    surface_properties (dict): 'atom_index', 'curvature', 'depth' and 'buriedness' per point.
+    """
+    surface_properties = {'atom_index': atom_index}
+    with Profiler.section('curvature'):
+        normals = vertex_normals(surface_points, facets)
+        surface_properties['curvature'] = local_curvature(surface_points, normals, workers=workers)
+    with Profiler.section('depth'):
+        surface_properties['depth'] = hull_depth(surface_points, coords, workers=workers)
+        surface_properties['buriedness'] = atom_buriedness(surface_points, coords, workers=workers)
+    return surface_properties
+
+def compute_surface(coords, accessibility, accessibility_threshold=0.0, alpha=SURFACE_ALPHA, return_facets=False,
+                    workers=1, surface_atoms=None):
+    """
+    Computes the molecular surface as the boundary of the alpha shape of all atoms.
+
+    A Delaunay tetrahedron whose circumsphere is wider than alpha has room for a solvent probe
+    between its atoms, so with alpha near an atom radius plus the probe radius the boundary runs
+    along the atoms that solvent can touch, into pockets and clefts. Facets with an atom below
+    the accessibility threshold are then dropped.
+
+    Args:
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    accessibility (np.array): Solvent accessibility per atom; None keeps every facet (only valid with a
+        threshold of 0).
+    accessibility_threshold (float): Minimum accessibility of every atom of a kept facet; 0 keeps the
+        whole boundary.
+    alpha (float or str): Alpha-shape circumradius cutoff in Å; 'auto' (or None) picks the smallest
+        alpha that keeps every atom.
+    return_facets (bool): Also return the surface triangles.
+    workers (int): Threads for the curvature, depth and buriedness kernels (see Parallel.py).
+    surface_atoms (np.array): Optional boolean mask of the atoms that may carry surface points (see
+        Triage.py); with a numeric alpha only the atoms within 2 * alpha of them are triangulated,
+        which leaves their facets unchanged.
+
+    Returns:
+    surface_points (np.array): Unique surface points with (x, y, z).
+    surface_properties (dict): Per-point surface properties: 'depth' (Å below the convex hull
+        of all atoms), 'buriedness' (atoms within BURIEDNESS_RADIUS), 'curvature' (1/Å,
+        negative when concave), and 'atom_index', the index of the atom each point sits on.
+    facets (np.array): Only with return_facets; triangles as indices into surface_points, shape (M, 3).
+    """
+    coords = np.asarray(coords, dtype=float)
+    accessibility = None if accessibility is None else np.asarray(accessibility, dtype=float)
+    empty = (None, None, None) if return_facets else (None, None)
+    alpha = None if alpha == 'auto' else alpha
+
+    print(f"Total atoms: {len(coords)}")
+    triangulated = np.arange(len(coords))
+    if surface_atoms is not None:
+        if not surface_atoms.any():
+            print("Warning: No atoms selected for the surface.")
+            return empty
+        if alpha is not None:
+            # The alpha shape is local: a kept tetrahedron fits in a sphere of radius alpha
+            from scipy.spatial import cKDTree
+
+            distances, _ = cKDTree(coords[surface_atoms]).query(coords, distance_upper_bound=2 * alpha,
+                                                                workers=Parallel.kdtree_workers(workers))
+            triangulated = np.flatnonzero(np.isfinite(distances))
+    print(f"Triangulated atoms: {len(triangulated)}")
+
+    if len(triangulated) < 4:
+        print("Error: Not enough coordinates to perform Delaunay triangulation.")
+        return empty
+
+    from scipy.spatial import QhullError
+
+    # Alpha shape of the atoms (Delaunay triangulation filtered by circumradius)
+    try:
+        with Profiler.section('alpha_shape'):
+            vertices, facets, alpha = alpha_shape(coords[triangulated], alpha)
+    except QhullError:
+        print("Error: Unable to compute Delaunay triangulation.")
+        return empty
+
+    # Keep the facets whose atoms are all accessible (and selected)
+    facet_atoms = triangulated[vertices][facets]
+    kept = np.ones(len(facet_atoms), dtype=bool)
+    if accessibility is not None:
+        kept &= (accessibility[facet_atoms] >= accessibility_threshold).all(axis=1)
+    if surface_atoms is not None:
+        kept &= surface_atoms[facet_atoms].all(axis=1)
+    facet_atoms = facet_atoms[kept]
+    atom_index = np.unique(facet_atoms)
+    facets = np.searchsorted(atom_index, facet_atoms)
+
+    if len(atom_index) == 0:
+        print(f"Error: No surface left at alpha = {alpha:.2f} Å and accessibility >= {accessibility_threshold}. "
+              f"Try a larger alpha or a lower threshold.")
+        return empty
+
+    surface_points = coords[atom_index]
+    print(f"Alpha shape (alpha = {alpha:.2f} Å): {len(surface_points)} surface points, {len(facets)} facets.")
+
+    Profiler.count(triangulated_atoms=len(triangulated), surface_points=len(surface_points),
+                   surface_facets=len(facets))
+
+    surface_properties = surface_point_properties(surface_points, facets, atom_index, coords, workers=workers)
 
     print("Computed molecular surface.")
+    if return_facets:
+        return surface_points, surface_properties, facets
     return surface_points, surface_properties
 
 
 
-def measure_pocket_depth(surface_points):
+def measure_pocket_depth(surface_points, coords):
     """
-    Estimates the depth of surface pockets based on distance from surface to protein core.
+    Estimates the depth of surface pockets as the distance below the protein's convex hull.
     
     Args:
     surface_points (np.array): Surface points with (x, y, z).
+    coords (np.array): Atomic coordinates of the whole protein with shape (N, 3).
     
     Returns:
-    pocket_depth (dict): Estimated depth of surface pockets.
+    pocket_depth (dict): Depth in Å per surface point index.
     """
-    # Placeholder: Random depth values
-    pocket_depth = {i: np.random.rand() for i in range(len(surface_points))}
+    pocket_depth = dict(enumerate(hull_depth(surface_points, coords).tolist()))
 
     print("Estimated pocket depth.")
     return pocket_depth
@@ -94,54 +423,133 @@ def calculate_hydrophobicity(residues):
     residues (dict): Dictionary of residues {res_id: res_type}.
     
     Returns:
-    hydrophobicity (dict): Hydrophobicity scores per residue.
+    hydrophobicity (dict): Kyte-Doolittle hydropathy per residue (see Residues.HYDROPATHY),
+        0 for residue types outside the scale.
     """
-    # Placeholder: Random hydrophobicity scores
-    hydrophobicity = {res_id: np.random.rand() for res_id in residues}
+    _, hydropathy, _, _ = Residues.residue_properties(list(residues.values()))
+    hydrophobicity = dict(zip(residues, hydropathy.tolist()))
 
     print("Computed hydrophobicity scores.")
     return hydrophobicity
 
-def visualize_surface(surface_points, surface_properties, output_image_file):
+def atom_residue_keys(pdb_data):
+    """Returns the residue key of every atom of parsed PDB data (artifact columns or JSON)."""
+    if 'coord' in pdb_data:
+        return PDBparser.residue_keys(Artifacts.parsed_atoms(pdb_data))
+    return np.array([atom['res_id'] for atom in pdb_data['atoms']], dtype=str)
+
+def subsample_surface(surface_points, surface_properties, max_points=PLOT_MAX_POINTS, seed=0):
+    """
+    Draws a reproducible random subset of surface points for plotting.
+
+    Args:
+    surface_points (np.array): Surface points with (x, y, z).
+    surface_properties (dict): Surface properties such as curvature and depth.
+    max_points (int): Largest number of points kept.
+    seed (int): Seed of the random subset.
+
+    Returns:
+    points (np.array): Subset of the surface points (all of them when there are few enough).
+    curvature (np.array): Curvature of the kept points.
+    """
+    points = np.asarray(surface_points, dtype=float)
+    curvature = np.asarray(surface_properties['curvature'], dtype=float)
+    if len(points) > max_points:
+        keep = np.sort(np.random.default_rng(seed).choice(len(points), max_points, replace=False))
+        points, curvature = points[keep], curvature[keep]
+    return points, curvature
+
+
+def visualize_surface(surface_points, surface_properties, output_image_file, max_points=PLOT_MAX_POINTS):
     """
     Visualizes the molecular surface using PCA and t-SNE, and saves the plot as an image file.
+
+    Large surfaces are subsampled to max_points before embedding, since t-SNE cost grows
+    quadratically with the point count. matplotlib and scikit-learn are only imported here,
+    so the rest of the pipeline never loads them.
     
     Args:
     surface_points (np.array): Surface points with (x, y, z).
     surface_properties (dict): Surface properties such as curvature and depth.
     output_image_file (str): Path to save the generated surface image.
+    max_points (int): Largest number of points embedded and drawn.
     """
-    # Perform PCA for dimensionality reduction
-    pca = PCA(n_components=2)
-    pca_points = pca.fit_transform(surface_points)
+    import matplotlib
+    matplotlib.use('Agg')  # Render to file only, no display needed
+    import matplotlib.pyplot as plt
+    from sklearn.manifold import TSNE
+
+    points, curvature = subsample_surface(surface_points, surface_properties, max_points)
 
-    # Perform t-SNE for further dimensionality reduction
-    tsne = TSNE(n_components=2)
-    tsne_points = tsne.fit_transform(surface_points)
+    # PCA projection from the SVD of the centered points
+    centered = points - points.mean(axis=0)
+    pca_points = centered @ np.linalg.svd(centered, full_matrices=False)[2][:2].T
+
+    # Perform t-SNE for further dimensionality reduction (perplexity must stay below the point count)
+    tsne = TSNE(n_components=2, perplexity=min(30.0, len(points) - 1.0), init='pca', random_state=0)
+    tsne_points = tsne.fit_transform(points)
 
     # Visualize the surface properties
     fig, axes = plt.subplots(1, 2, figsize=(12, 6))
-    for ax, points, title in zip(axes, [pca_points, tsne_points], ['PCA', 't-SNE']):
-        scatter = ax.scatter(points[:, 0], points[:, 1], c=surface_properties['curvature'], cmap='viridis')
+    for ax, embedded, title in zip(axes, [pca_points, tsne_points], ['PCA', 't-SNE']):
+        ax.scatter(embedded[:, 0], embedded[:, 1], c=curvature, cmap='viridis', s=4)
         ax.set_title(title)
         ax.set_xticks([])
         ax.set_yticks([])
+    if len(points) < len(surface_points):
+        fig.suptitle(f"{len(points)} of {len(surface_points)} surface points")
 
     # Save the plot to the specified file
     plt.savefig(output_image_file, bbox_inches='tight')  # Save image without opening it
-    plt.close()  # Close the plot to avoid displaying it
+    plt.close(fig)  # Close the plot to avoid displaying it
     print(f"Surface visualization saved to {output_image_file}")
 
 
-def save_surface_data(surface_points, surface_properties, output_file):
+def plot_in_background(surface_points, surface_properties, output_image_file, max_points=PLOT_MAX_POINTS):
+    """
+    Renders the surface plot in a separate process and returns without waiting for it.
+
+    Only the subsampled points are sent to the plotting process. Python waits for the
+    process before exiting, so the image is complete once the command returns.
+
+    Args:
+    surface_points (np.array): Surface points with (x, y, z).
+    surface_properties (dict): Surface properties such as curvature and depth.
+    output_image_file (str): Path to save the generated surface image.
+    max_points (int): Largest number of points embedded and drawn.
+
+    Returns:
+    process (multiprocessing.Process): The plotting process, or None when the plot was rendered
+        in this process (daemonic workers, e.g. batch mode, cannot start child processes).
     """
-    Saves computed surface data to a JSON file.
+    import multiprocessing
+
+    if multiprocessing.current_process().daemon:
+        visualize_surface(surface_points, surface_properties, output_image_file, max_points)
+        return None
+
+    points, curvature = subsample_surface(surface_points, surface_properties, max_points)
+    process = multiprocessing.Process(target=visualize_surface,
+                                      args=(points, {'curvature': curvature}, output_image_file, max_points))
+    process.start()
+    print(f"Rendering surface visualization to {output_image_file} in the background.")
+    return process
+
+
+def save_surface_data(surface_points, surface_properties, output_file, facets=None):
+    """
+    Saves computed surface data to a JSON file, or to an artifact folder for non-'.json' paths.
     
     Args:
     surface_points (np.array): Surface points with (x, y, z).
     surface_properties (dict): Surface properties such as curvature and depth.
-    output_file (str): Path to the output JSON file.
+    output_file (str): Path to the output JSON file or artifact folder.
+    facets (np.array): Optional surface triangles as indices into surface_points.
     """
+    if not output_file.endswith('.json'):
+        Artifacts.save_surface(output_file, surface_points, surface_properties, facets)
+        return
+
     # Convert numpy arrays to lists for JSON serialization
     surface_points_list = surface_points.tolist()  # Convert to a list of lists
 
@@ -154,6 +562,8 @@ def save_surface_data(surface_points, surface_properties, output_file):
         'surface_points': surface_points_list,
         'surface_properties': surface_properties_list
     }
+    if facets is not None:
+        data['surface_facets'] = np.asarray(facets).tolist()
 
     # Write the data to the JSON file
     with open(output_file, 'w') as f:
@@ -162,45 +572,52 @@ def save_surface_data(surface_points, surface_properties, output_file):
     print(f"Surface data saved to {output_file}")
 
 
-def main(pdb_data, output_file, output_image_file):
+def main(pdb_data, output_file, output_image_file=None):
     """
-    Main function to compute surface properties, save data to a file, and save the surface visualization.
+    Main function to compute surface properties, save data to a file, and optionally save the surface visualization.
     
     Args:
     pdb_data (dict): Parsed PDB data containing atoms, residues, and accessibility.
     output_file (str): Path to the output JSON file.
-    output_image_file (str): Path to save the generated surface image.
+    output_image_file (str): Path to save the generated surface image; no plot when None.
     """
     # Compute molecular surface
-    surface_points, surface_properties = compute_surface(pdb_data)
+    coords, accessibility = load_pdb_data(pdb_data)
+    surface_points, surface_properties, facets = compute_surface(coords, accessibility, return_facets=True)
 
     if surface_points is not None:
         # Measure pocket depth
-        pocket_depth = measure_pocket_depth(surface_points)
+        pocket_depth = measure_pocket_depth(surface_points, coords)
 
-        # Calculate hydrophobicity
+        # Hydrophobicity of the residue each surface point sits on
         hydrophobicity = calculate_hydrophobicity(pdb_data['residues'])
-
-        # Visualize the surface and save the plot to a file
-        visualize_surface(surface_points, surface_properties, output_image_file)
+        point_residues = atom_residue_keys(pdb_data)[surface_properties['atom_index']]
+        surface_properties['hydrophobicity'] = np.array([hydrophobicity[key] for key in point_residues.tolist()])
 
         # Save the data to a file
-        save_surface_data(surface_points, surface_properties, output_file)
+        save_surface_data(surface_points, surface_properties, output_file, facets)
+
+        # Visualize the surface once the data is safely written
+        if output_image_file is not None:
+            visualize_surface(surface_points, surface_properties, output_image_file)
 
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 4:
-        print("Usage: python SurfAnal.py <PDB_DATA_FILE> <OUTPUT_FILE> <OUTPUT_IMAGE_FILE>")
+    if len(sys.argv) < 3:
+        print("Usage: python SurfAnal.py <PDB_DATA_FILE> <OUTPUT_FILE> [OUTPUT_IMAGE_FILE]")
         sys.exit(1)
 
     pdb_data_file = sys.argv[1]
     output_file = sys.argv[2]
-    output_image_file = sys.argv[3]  # Add image file argument
+    output_image_file = sys.argv[3] if len(sys.argv) > 3 else None  # Plot only when an image file is given
 
     # Load parsed PDB data
-    with open(pdb_data_file, 'r') as f:
-        pdb_data = json.load(f)
+    if Artifacts.is_artifact(pdb_data_file):
+        pdb_data = Artifacts.load_parsed(pdb_data_file)
+    else:
+        with open(pdb_data_file, 'r') as f:
+            pdb_data = json.load(f)
 
     # Analyze the molecular surface
     main(pdb_data, output_file, output_image_file)
@@ -0,0 +1,374 @@
+"""
+Tiling.py
+
+Spatially tiled surface and pocket detection for very large complexes (capsids, cryo-EM
+assemblies), whose single Delaunay triangulation and global grids do not fit in memory.
+
+The structure is cut into cubic tiles of tile_size Å. Every tile is processed with the
+atoms of its core plus a halo of overlap Å around it, and only the results belonging to
+its core are kept, so working memory grows with the tile size rather than the atom count:
+- Surface: the alpha shape is local (a kept tetrahedron has an empty circumsphere of
+  radius <= alpha), so with a halo of at least 2 * alpha the surface vertices and facets
+  of the core atoms are those of the whole structure. When alpha is picked automatically
+  it is found tile by tile first, and the halo grows until it covers 2 * alpha. Depth is
+  measured against the convex hull of the whole structure (built from the hulls of the
+  tiles), buriedness counts atoms within the halo, and curvature is fitted over the
+  surface points of the tile.
+- Pockets: each tile finds the point pairs of its core points with the points around it;
+  together these form the radius graph of the whole structure, so DBSCAN clusters that
+  cross tile boundaries are stitched exactly. Enclosure is measured per tile around each
+  pocket center. Volumes are not local (a PSP scan runs to the edge of the grid, and a
+  pocket claims whole connected components of buried voxels), so they are measured on one
+  grid of the whole structure after clustering: the pockets are the same as without
+  tiling, and that grid (a few bytes per voxel) is the only whole-structure array left.
+
+Tiles run on a thread pool when workers > 1 (see Parallel.py); peak memory then grows with
+the number of tiles processed at once.
+
+Functions:
+- compute_surface_tiled(coords, accessibility, ...): SurfAnal.compute_surface, tile by tile.
+- detect_pockets_tiled(surface_data, ...): PockDet.detect_pockets, tile by tile.
+"""
+
+import numpy as np
+
+import Parallel
+import PDBparser
+import Profiler
+import SurfAnal
+import PockDet
+
+# Edge length (Å) of a tile
+TILE_SIZE = 60.0
+
+# Halo (Å) of atoms added around every tile; at least the buriedness radius, grown to 2 * alpha
+TILE_OVERLAP = 12.0
+
+# Extra halo (Å) beyond 2 * alpha, so the curvature neighborhoods of core points only
+# contain surface points that are exact as well
+TILE_MARGIN = SurfAnal.CURVATURE_RADIUS
+
+
+class TileIndex:
+    """
+    Points sorted into cubic cells of a lattice, for lookups of the points in and around a cell.
+
+    Args:
+    points (np.array): Coordinates with shape (N, 3).
+    tile_size (float): Cell edge length in Å.
+    origin (np.array): Corner of cell (0, 0, 0); indexes sharing it have aligned cells.
+    """
+
+    def __init__(self, points, tile_size, origin):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.tile_size = float(tile_size)
+        self.origin = np.asarray(origin, dtype=float)
+
+        cells = np.floor((self.points - self.origin) / self.tile_size).astype(np.int64)
+        self.order = np.lexsort(cells.T[::-1])
+        sorted_cells = cells[self.order]
+        boundaries = np.flatnonzero(np.any(np.diff(sorted_cells, axis=0) != 0, axis=1)) + 1
+        self.starts = np.concatenate([[0], boundaries, [len(self.points)]])
+        self.cells = sorted_cells[self.starts[:-1]] if len(self.points) else np.zeros((0, 3), dtype=np.int64)
+        self._lookup = {tuple(cell): i for i, cell in enumerate(self.cells.tolist())}
+
+    def box(self, cell, halo=0.0):
+        """Returns the (lower, upper) corners of a cell grown by halo Å on every side."""
+        lower = self.origin + np.asarray(cell) * self.tile_size
+        return lower - halo, lower + self.tile_size + halo
+
+    def core(self, cell):
+        """Returns the sorted indices of the points inside a cell."""
+        i = self._lookup.get(tuple(cell))
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(self.order[self.starts[i]:self.starts[i + 1]])
+
+    def members(self, cell, halo):
+        """Returns the sorted indices of the points inside a cell grown by halo Å."""
+        rings = int(np.ceil(halo / self.tile_size))
+        steps = np.arange(-rings, rings + 1)
+        offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape(-1, 3)
+        found = [self.core(cell + offset) for offset in offsets]
+        candidates = np.sort(np.concatenate(found))
+        lower, upper = self.box(cell, halo)
+        inside = ((self.points[candidates] >= lower) & (self.points[candidates] <= upper)).all(axis=1)
+        return candidates[inside]
+
+
+def hull_points(index):
+    """
+    Returns the vertices of the per-tile convex hulls, whose convex hull is that of all points.
+
+    Args:
+    index (TileIndex): Tiled points.
+
+    Returns:
+    points (np.array): Candidate hull vertices with shape (H, 3).
+    """
+    from scipy.spatial import ConvexHull, QhullError
+
+    vertices = []
+    for cell in index.cells:
+        core = index.points[index.core(cell)]
+        try:
+            vertices.append(core[ConvexHull(core).vertices])
+        except (QhullError, ValueError):
+            # Fewer than 4 or coplanar points: keep them all
+            vertices.append(core)
+    return np.concatenate(vertices)
+
+
+def tiled_alpha(index, halo, workers=1):
+    """
+    Finds the alpha SurfAnal.alpha_shape would pick for all points, one tile at a time.
+
+    Every point's smallest incident circumradius is exact when it is at most halo / 2; the
+    halo is grown and the pass repeated until the resulting alpha satisfies that.
+
+    Args:
+    index (TileIndex): Tiled atoms.
+    halo (float): Initial halo in Å.
+    workers (int): Tiles processed at once.
+
+    Returns:
+    alpha (float): Circumradius cutoff in Å.
+    halo (float): Halo in Å that was needed.
+    """
+    from scipy.spatial import Delaunay, QhullError
+
+    while True:
+        def tile_alpha(start, stop):
+            cell = index.cells[start]
+            members = index.members(cell, halo)
+            if len(members) < 4:
+                return 0.0
+            try:
+                simplices = Delaunay(index.points[members]).simplices
+            except QhullError:
+                return 0.0
+            radii = SurfAnal.circumradii(index.points[members][simplices])
+            smallest = np.full(len(members), np.inf)
+            np.minimum.at(smallest, simplices.ravel(), np.repeat(radii, 4))
+            smallest = smallest[np.isin(members, index.core(cell)) & np.isfinite(smallest)]
+            return float(smallest.max()) if len(smallest) else 0.0
+
+        alpha = max(Parallel.map_blocks(tile_alpha, len(index.cells), 1, workers), default=0.0)
+        if alpha <= halo / 2:
+            return alpha, halo
+        halo = 2 * alpha + TILE_MARGIN
+        print(f"Alpha {alpha:.2f} Å needs a larger halo; retrying with {halo:.1f} Å.")
+
+
+def compute_surface_tiled(coords, accessibility, accessibility_threshold=0.0, alpha=SurfAnal.SURFACE_ALPHA,
+                          return_facets=False, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, workers=1):
+    """
+    Computes the molecular surface of SurfAnal.compute_surface tile by tile.
+
+    Args:
+    coords (np.array): Atomic coordinates with shape (N, 3).
+    accessibility (np.array): Solvent accessibility per atom; None keeps every facet.
+    accessibility_threshold (float): Minimum accessibility of every atom of a kept facet.
+    alpha (float or str): Alpha-shape circumradius cutoff in Å; 'auto' (or None) picks the smallest
+        alpha that keeps every atom.
+    return_facets (bool): Also return the surface triangles.
+    tile_size (float): Tile edge length in Å.
+    overlap (float): Minimum halo around every tile in Å.
+    workers (int): Tiles processed at once.
+
+    Returns:
+    surface_points, surface_properties[, facets]: As SurfAnal.compute_surface, in the same order.
+    """
+    coords = np.asarray(coords, dtype=float)
+    accessibility = None if accessibility is None else np.asarray(accessibility, dtype=float)
+    empty = (None, None, None) if return_facets else (None, None)
+    alpha = None if alpha == 'auto' else alpha
+
+    print(f"Total atoms: {len(coords)}")
+    if len(coords) < 4:
+        print("Error: Not enough coordinates to perform Delaunay triangulation.")
+        return empty
+
+    atom_index = TileIndex(coords, tile_size, coords.min(axis=0))
+    with Profiler.section('hull'):
+        hull = hull_points(atom_index)
+
+    halo = max(overlap, SurfAnal.BURIEDNESS_RADIUS)
+    if alpha is None:
+        with Profiler.section('alpha'):
+            alpha, halo = tiled_alpha(atom_index, halo, workers)
+    halo = max(halo, 2 * alpha + TILE_MARGIN)
+    print(f"Tiled surface: {len(atom_index.cells)} tiles of {tile_size:.0f} Å, "
+          f"halo {halo:.1f} Å, alpha = {alpha:.2f} Å.")
+
+    from scipy.spatial import QhullError
+
+    def tile_surface(start, stop):
+        cell = atom_index.cells[start]
+        members = atom_index.members(cell, halo)
+        if len(members) < 4:
+            return None
+        try:
+            vertices, facets, _ = SurfAnal.alpha_shape(coords[members], alpha)
+        except QhullError:
+            print(f"Warning: Delaunay triangulation failed in tile {tuple(cell)}; its surface is skipped.")
+            return None
+
+        # Accessible facets, as in SurfAnal.compute_surface
+        facet_ids = members[vertices][facets]
+        if accessibility is not None:
+            facet_ids = facet_ids[(accessibility[facet_ids] >= accessibility_threshold).all(axis=1)]
+        if len(facet_ids) == 0:
+            return None
+        vertex_ids = np.unique(facet_ids)
+        facets = np.searchsorted(vertex_ids, facet_ids)
+
+        points = coords[vertex_ids]
+        curvature = SurfAnal.local_curvature(points, SurfAnal.vertex_normals(points, facets))
+
+        # Keep the core vertices, and the facets whose smallest vertex is a core vertex
+        in_core = np.isin(vertex_ids, atom_index.core(cell))
+        owned = in_core[facets[np.arange(len(facets)), facet_ids.argmin(axis=1)]]
+
+        kept = points[in_core]
+        buried_atoms = coords[atom_index.members(cell, SurfAnal.BURIEDNESS_RADIUS)]
+        return (vertex_ids[in_core], curvature[in_core], SurfAnal.hull_depth(kept, hull),
+                SurfAnal.atom_buriedness(kept, buried_atoms), facet_ids[owned])
+
+    with Profiler.section('tiles', tiles=len(atom_index.cells)):
+        tiles = [tile for tile in Parallel.map_blocks(tile_surface, len(atom_index.cells), 1, workers)
+                 if tile is not None]
+    if not tiles:
+        print(f"Error: No surface left at alpha = {alpha:.2f} Å and accessibility >= {accessibility_threshold}.")
+        return empty
+
+    # Stitch: surface vertices in atom order, as the untiled alpha shape returns them
+    vertex_ids, curvature, depth, buriedness, facet_ids = (np.concatenate(column) for column in zip(*tiles))
+    order = np.argsort(vertex_ids)
+    vertex_ids = vertex_ids[order]
+    facets = np.minimum(np.searchsorted(vertex_ids, facet_ids), len(vertex_ids) - 1)
+    facets = facets[(vertex_ids[facets] == facet_ids).all(axis=1)]
+    # Facet order of the untiled alpha shape: by sorted vertex triple
+    facets = facets[np.lexsort(np.sort(facets, axis=1).T[::-1])]
+
+    surface_points = coords[vertex_ids]
+    surface_properties = {
+        'atom_index': vertex_ids,
+        'curvature': curvature[order],
+        'depth': depth[order],
+        'buriedness': buriedness[order],
+    }
+    Profiler.count(surface_points=len(surface_points), surface_facets=len(facets))
+    print(f"Alpha shape (alpha = {alpha:.2f} Å): {len(surface_points)} surface points, {len(facets)} facets.")
+    print("Computed molecular surface.")
+    if return_facets:
+        return surface_points, surface_properties, facets
+    return surface_points, surface_properties
+
+
+def tiled_radius_graph(index, max_eps, workers=1):
+    """
+    Builds PockDet.radius_graph of all points from per-tile neighbor searches.
+
+    Each tile pairs its core points with the points within max_eps of the tile, keeping pairs
+    (i, j) with i < j and i in the core, so every pair of the whole set is found exactly once.
+
+    Args:
+    index (TileIndex): Tiled points.
+    max_eps (float): Largest neighborhood radius that will be queried.
+    workers (int): Tiles processed at once.
+
+    Returns:
+    pairs (np.array): Index pairs (i, j) with i < j, shape (P, 2).
+    distances (np.array): Distance of every pair.
+    """
+    from scipy.spatial import cKDTree
+
+    def tile_pairs(start, stop):
+        cell = index.cells[start]
+        core, members = index.core(cell), index.members(cell, max_eps)
+        near = cKDTree(index.points[core]).sparse_distance_matrix(cKDTree(index.points[members]), max_eps,
+                                                                  output_type='ndarray')
+        i, j = core[near['i']], members[near['j']]
+        return np.column_stack([i, j])[i < j]
+
+    pairs = np.concatenate(Parallel.map_blocks(tile_pairs, len(index.cells), 1, workers) or [np.zeros((0, 2), int)])
+    pairs = pairs.astype(np.int64).reshape(-1, 2)
+    distances = np.linalg.norm(index.points[pairs[:, 0]] - index.points[pairs[:, 1]], axis=1)
+    return pairs, distances
+
+
+def detect_pockets_tiled(surface_data, eps=2.0, min_samples=3, coords=None, radii=None, grid_spacing=1.0,
+                         tile_size=TILE_SIZE, workers=1, return_points=False):
+    """
+    Detects pockets as PockDet.detect_pockets does, with clustering and enclosure run tile by tile.
+
+    Args:
+    surface_data (dict): {'surface_points': array, 'surface_properties': {'depth', 'curvature', ...}}.
+    eps (float or str): DBSCAN neighborhood radius in Å, or 'auto'.
+    min_samples (int): DBSCAN minimum neighborhood size.
+    coords (np.array): Atomic coordinates of the protein, needed for real volume and enclosure.
+    radii (np.array): Van der Waals radius per atom (default: carbon radius for all).
+    grid_spacing (float): Voxel size in Å of the grid measuring pocket volumes.
+    tile_size (float): Tile edge length in Å.
+    workers (int): Tiles processed at once (and threads for the volume grid).
+    return_points (bool): Also return the candidate points and their pocket_id.
+
+    Returns:
+    pockets (list): Pocket dicts, as PockDet.detect_pockets (with return_points, also the
+        points and their pocket_id).
+    """
+    pocket_points, depth, curvature = PockDet.select_pocket_points(surface_data)
+    if len(pocket_points) == 0:
+        print("No points meet the depth threshold. Adjust thresholding.")
+        return ([], pocket_points, np.zeros(0, dtype=int)) if return_points else []
+
+    if eps == 'auto':
+        eps = PockDet.auto_eps(pocket_points, min_samples)
+        print(f"Automatic eps from point density: {eps:.3f}")
+
+    origin = pocket_points.min(axis=0) if coords is None else np.asarray(coords, dtype=float).min(axis=0)
+    point_index = TileIndex(pocket_points, tile_size, origin)
+    with Profiler.section('clustering', pocket_points=len(pocket_points)):
+        pairs, distances = tiled_radius_graph(point_index, max(max(PockDet.EPS_SWEEP), eps), workers)
+        labels = PockDet.cluster_points(len(pocket_points), pairs, distances, eps, min_samples)
+        n_clusters = labels.max() + 1
+
+    if coords is None or n_clusters == 0:
+        volumes, enclosures = PockDet.placeholder_properties(labels)
+        pockets = PockDet.build_pockets(pocket_points, labels, depth, curvature, volumes, enclosures)
+        return (pockets, pocket_points, labels) if return_points else pockets
+
+    import PockGrid
+
+    coords = np.asarray(coords, dtype=float)
+    if radii is None:
+        radii = np.full(len(coords), PDBparser.ELEMENT_RADII['C'])
+    atom_index = TileIndex(coords, tile_size, origin)
+
+    # Whether a voxel is buried depends on protein anywhere along its scan lines, so volumes
+    # (and the merging of clusters lining one void) come from one grid of the whole structure,
+    # exactly as without tiling
+    clustered = labels >= 0
+    with Profiler.section('pocket_volume'):
+        volumes, merged = PockGrid.pocket_volumes(pocket_points[clustered], labels[clustered], n_clusters, coords,
+                                                  radii, grid_spacing, workers=workers)
+        labels[clustered] = merged[labels[clustered]]
+
+    centers = PockDet.cluster_centers(pocket_points, labels)
+    center_index = TileIndex(centers, tile_size, origin)
+    reach = PockDet.ENCLOSURE_DISTANCE + PockDet.ENCLOSURE_HIT_RADIUS
+    enclosures = np.zeros(len(volumes))
+
+    def tile_enclosure(start, stop):
+        cell = center_index.cells[start]
+        pockets = center_index.core(cell)
+        atoms = atom_index.members(cell, reach)
+        if len(atoms):
+            enclosures[pockets] = PockDet.pocket_enclosure(centers[pockets], coords[atoms])
+
+    with Profiler.section('enclosure'):
+        Parallel.map_blocks(tile_enclosure, len(center_index.cells), 1, workers)
+
+    pockets = PockDet.build_pockets(pocket_points, labels, depth, curvature, volumes, enclosures)
+    return (pockets, pocket_points, labels) if return_points else pockets
@@ -0,0 +1,485 @@
+"""
+Trajectory.py
+
+Frame-by-frame pocket detection over NMR ensembles and MD trajectories, with pocket
+tracking across frames.
+
+Frames are the MODEL blocks of a PDB file (plain or .gz), the models of an mmCIF file or
+the frames of an XYZ file. The atoms (names, residues, elements, radii) are read once,
+from the first frame or from a separate topology file; later frames only have their
+coordinates parsed, and every frame must list the same atoms in the same order.
+
+Every frame runs the accessibility (only with an accessibility threshold), surface, pocket
+and scoring stages of a Pipeline. The accessibility and the alpha-shape topology (which
+atoms form the surface and how they are triangulated) do not change under rigid motion and
+change little under small internal motion, so they are reused while a frame stays within
+reuse_rmsd Å (RMSD after optimal superposition) of the frame they were computed on; the
+surface points then follow their atoms and only the per-point properties (curvature, depth,
+buriedness) are recomputed. Pockets are always detected on the frame's own coordinates.
+reuse_rmsd=0 recomputes every stage on every frame.
+
+Pockets are tracked across frames: every frame is superposed onto the first one, and its
+pockets are matched one-to-one (Hungarian assignment) to the tracks seen in the last
+max_gap + 1 frames, on the distance between superposed centers and the overlap (Jaccard
+index) of their lining residues. Every track then
+reports how persistent, mobile and variable its pocket is.
+
+Outputs (in the output folder):
+- frames.tsv: One row per pocket and frame, with its track.
+- tracks.tsv: One row per track, most persistent first.
+- tracks.json: The track statistics, plus frame counts and throughput.
+
+Functions:
+- read_frames(trajectory_file, topology_file, altloc, hetatm): Atoms and an iterator of frame coordinates.
+- superpose(reference, coords): Rigid motion and RMSD of the optimal superposition.
+- run_trajectory(pipeline, trajectory_file, output_dir, ...): Detects and tracks pockets over all frames.
+
+Classes:
+- PocketTracker: Matches the pockets of consecutive frames into tracks.
+
+Usage:
+    python Trajectory.py <TRAJECTORY> <OUTPUT_DIR> [TOPOLOGY]
+"""
+
+import contextlib
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import PDBparser
+import Profiler
+import SurfAnal
+
+# Largest RMSD (Å, after superposition) to the frame the surface was computed on for a
+# frame to reuse its accessibility and alpha-shape topology
+REUSE_RMSD = 0.5
+
+# Largest distance (Å) between the centers of two pockets matched across frames
+TRACK_DISTANCE = 4.0
+
+# Lining residue overlap (Jaccard index) at which pockets are matched regardless of their
+# center distance (pockets whose center moves as they open, merge or split)
+TRACK_OVERLAP = 0.5
+
+# Frames a track may go undetected and still be continued
+TRACK_GAP = 2
+
+# Fraction of its frames in which a residue lines a track to be listed as a consensus residue
+CONSENSUS_FRACTION = 0.5
+
+
+def _open_binary(file_path):
+    """Opens a (optionally gzip-compressed) file for reading bytes."""
+    return gzip.open(file_path, 'rb') if file_path.endswith('.gz') else open(file_path, 'rb')
+
+
+def is_xyz(file_path):
+    """Returns True for XYZ coordinate files (.xyz or .xyz.gz)."""
+    return file_path.lower().removesuffix('.gz').endswith('.xyz')
+
+
+def pdb_model_blocks(file_path):
+    """
+    Yields the MODEL blocks of a PDB file as bytes; a file without MODEL records is one block.
+
+    Args:
+    file_path (str): Path to the PDB file (plain or .gz).
+    """
+    with _open_binary(file_path) as f:
+        block, has_atoms = [], False
+        for line in f:
+            block.append(line)
+            has_atoms = has_atoms or line.startswith((b'ATOM  ', b'HETATM'))
+            if line.startswith(b'ENDMDL'):
+                if has_atoms:
+                    yield b''.join(block)
+                block, has_atoms = [], False
+        if has_atoms:
+            yield b''.join(block)
+
+
+def read_xyz_frames(file_path):
+    """
+    Yields the coordinates of every frame of an XYZ file (atom count, comment, then one
+    'element x y z' line per atom, repeated for every frame).
+
+    Args:
+    file_path (str): Path to the XYZ file (plain or .gz).
+
+    Raises:
+    ValueError: If a frame is truncated or its header is not an atom count.
+    """
+    with _open_binary(file_path) as f:
+        frame = 0
+        for header in f:
+            if not header.strip():
+                continue
+            n_atoms = int(header)
+            f.readline()
+            rows = [f.readline().split()[1:4] for _ in range(n_atoms)]
+            if any(len(row) < 3 for row in rows):
+                raise ValueError(f"Frame {frame} of '{file_path}' is truncated.")
+            yield np.array(rows, dtype=float)
+            frame += 1
+
+
+def _pdb_frames(file_path, mask):
+    """Yields the selected coordinates of every MODEL block (see read_frames)."""
+    for frame, block in enumerate(pdb_model_blocks(file_path)):
+        coords = PDBparser.read_pdb_coords(block)
+        if len(coords) != len(mask):
+            raise ValueError(f"Frame {frame} has {len(coords)} atom records, the first frame {len(mask)}.")
+        yield coords[mask]
+
+
+def _checked(frames, n_atoms):
+    """Yields (frame index, coordinates), checking every frame against the topology's atom count."""
+    for frame, coords in enumerate(frames):
+        if len(coords) != n_atoms:
+            raise ValueError(f"Frame {frame} has {len(coords)} atoms, the topology {n_atoms}.")
+        yield frame, coords
+
+
+def read_frames(trajectory_file, topology_file=None, altloc=None, hetatm=False):
+    """
+    Reads the atoms of a trajectory once and returns an iterator over its frame coordinates.
+
+    Args:
+    trajectory_file (str): Multi-model PDB or mmCIF file, or XYZ file (plain or .gz).
+    topology_file (str): PDB or mmCIF file listing the atoms of every frame (its first model);
+        required for XYZ files, otherwise the first frame is the topology.
+    altloc (str): Alternate location handling (see PDBparser.select_atoms).
+    hetatm (bool): Whether HETATM records are kept.
+
+    Returns:
+    atoms (np.array): Structured array with PDBparser.ATOM_DTYPE (coordinates of the first frame).
+    residues (dict): Residue table of the atoms.
+    frames (iterator): (frame index, coordinates with shape (N, 3)) for every frame, read lazily.
+
+    Raises:
+    FileNotFoundError: If a file does not exist.
+    ValueError: If an XYZ file has no topology.
+    """
+    if not os.path.exists(trajectory_file):
+        raise FileNotFoundError(f"File '{trajectory_file}' not found.")
+
+    atoms = residues = None
+    if topology_file is not None:
+        atoms, residues = PDBparser.parse_pdb(topology_file, altloc, 'first', hetatm)
+
+    if is_xyz(trajectory_file):
+        if atoms is None:
+            raise ValueError("XYZ frames need a topology file (PDB or mmCIF) listing their atoms.")
+        return atoms, residues, _checked(read_xyz_frames(trajectory_file), len(atoms))
+
+    if PDBparser.is_cif(trajectory_file):
+        # mmCIF models are read together; the selection is applied per model
+        import CIFparser
+        models = CIFparser.read_cif_atoms(trajectory_file, altloc, None, hetatm)
+        serials = models['model'][np.sort(np.unique(models['model'], return_index=True)[1])]
+        if atoms is None:
+            atoms = models[models['model'] == serials[0]]
+            residues = PDBparser.residue_table(atoms)
+        frames = (models['coord'][models['model'] == serial] for serial in serials)
+        return atoms, residues, _checked(frames, len(atoms))
+
+    # The atom records of the first MODEL block are parsed in full, later blocks for coordinates only
+    first = PDBparser.read_pdb_atoms(next(pdb_model_blocks(trajectory_file), b''))
+    mask = PDBparser.selection_mask(first, altloc, None, hetatm)
+    if atoms is None:
+        atoms = first[mask]
+        residues = PDBparser.residue_table(atoms)
+        print(f"Parsed {len(atoms)} atoms.")
+        print(f"Extracted {len(residues)} unique residues.")
+    return atoms, residues, _checked(_pdb_frames(trajectory_file, mask), len(atoms))
+
+
+def superpose(reference, coords):
+    """
+    Finds the rigid motion superposing a conformation onto a reference (Kabsch).
+
+    Args:
+    reference (np.array): Coordinates with shape (N, 3).
+    coords (np.array): Coordinates of the same atoms with shape (N, 3).
+
+    Returns:
+    rotation (np.array): Rotation matrix with shape (3, 3).
+    translation (np.array): Translation; coords @ rotation.T + translation is superposed onto reference.
+    rmsd (float): Root-mean-square deviation after superposition in Å.
+    """
+    reference_center, center = reference.mean(axis=0), coords.mean(axis=0)
+    a, b = reference - reference_center, coords - center
+    u, singular, vt = np.linalg.svd(b.T @ a)
+    sign = np.sign(np.linalg.det(u @ vt)) or 1.0
+    rotation = (u @ np.diag([1.0, 1.0, sign]) @ vt).T
+    squared = ((a ** 2).sum() + (b ** 2).sum() - 2 * (singular[0] + singular[1] + sign * singular[2])) / max(len(a), 1)
+    return rotation, reference_center - center @ rotation.T, float(np.sqrt(max(squared, 0.0)))
+
+
+def superposed_rmsd(reference, coords):
+    """Returns the RMSD in Å between two conformations after optimal superposition (see superpose)."""
+    return superpose(reference, coords)[2]
+
+
+class PocketTracker:
+    """
+    Matches the pockets of consecutive frames into tracks.
+
+    Args:
+    max_distance (float): Largest center distance in Å of a match (see TRACK_DISTANCE).
+    min_overlap (float): Lining residue overlap matching pockets at any distance (see TRACK_OVERLAP).
+    max_gap (int): Frames a track may go undetected and still be continued.
+    """
+
+    def __init__(self, max_distance=TRACK_DISTANCE, min_overlap=TRACK_OVERLAP, max_gap=TRACK_GAP):
+        self.max_distance = max_distance
+        self.min_overlap = min_overlap
+        self.max_gap = max_gap
+        self.n_frames = 0
+        self.tracks = []
+
+    def update(self, frame, pockets, rotation=None, translation=None):
+        """
+        Assigns the pockets of the next frame to tracks, starting new tracks for unmatched pockets.
+
+        Args:
+        frame (int): Frame index in the trajectory.
+        pockets (list): Pocket dicts with 'center' and optionally 'lining_residues'; a
+            'track_id' is added to each.
+        rotation (np.array): Optional rotation superposing the frame onto a common reference (see superpose);
+            centers are compared and summarized in that reference.
+        translation (np.array): Translation applied after the rotation.
+        """
+        from scipy.optimize import linear_sum_assignment
+
+        step = self.n_frames
+        self.n_frames += 1
+        active = [track for track in self.tracks if track['last_step'] >= step - 1 - self.max_gap]
+        residues = [set(filter(None, pocket.get('lining_residues', '').split(','))) for pocket in pockets]
+
+        centers = np.array([pocket['center'] for pocket in pockets], dtype=float).reshape(-1, 3)
+        if rotation is not None:
+            centers = centers @ rotation.T + translation
+
+        matches = []
+        if active and pockets:
+            track_centers = np.array([track['center'] for track in active])
+            distance = np.linalg.norm(track_centers[:, None, :] - centers[None, :, :], axis=2)
+            overlap = np.array([[len(track['residues'] & current) / max(len(track['residues'] | current), 1)
+                                 for current in residues] for track in active])
+            allowed = (distance <= self.max_distance) | (overlap >= self.min_overlap)
+            cost = np.where(allowed, distance / self.max_distance + (1 - overlap), 1e6)
+            rows, columns = linear_sum_assignment(cost)
+            matches = [(row, column) for row, column in zip(rows, columns) if allowed[row, column]]
+
+        matched = {column: active[row] for row, column in matches}
+        for i, pocket in enumerate(pockets):
+            track = matched.get(i)
+            if track is None:
+                track = {'track_id': len(self.tracks), 'observations': []}
+                self.tracks.append(track)
+            track.update(center=centers[i], residues=residues[i], last_step=step)
+            track['observations'].append((frame, i + 1, pocket, centers[i], residues[i]))
+            pocket['track_id'] = track['track_id']
+
+    def summary(self, residue_order=None):
+        """
+        Computes the statistics of every track.
+
+        Args:
+        residue_order (dict): Position of every residue key, for listing consensus residues in
+            file order (default: sorted keys).
+
+        Returns:
+        tracks (list): Per-track dicts, most persistent first (ties broken by mean score):
+            track_id, n_frames, persistence (fraction of frames), first_frame, last_frame,
+            mean_rank, score_mean/std, volume_mean/std, depth_mean/std, center (mean, in the
+            superposition reference), center_rmsf (Å, RMS distance of the centers to their mean) and consensus_residues
+            (residues lining the pocket in at least CONSENSUS_FRACTION of its frames).
+        """
+        tracks = []
+        for track in self.tracks:
+            frames, ranks, pockets, centers, residue_sets = zip(*track['observations'])
+            centers = np.array(centers)
+            center = centers.mean(axis=0)
+            stats = {'track_id': track['track_id'], 'n_frames': len(frames),
+                     'persistence': round(len(frames) / max(self.n_frames, 1), 4),
+                     'first_frame': int(frames[0]), 'last_frame': int(frames[-1]),
+                     'mean_rank': round(float(np.mean(ranks)), 3)}
+            for field in ('score', 'volume', 'depth'):
+                values = np.array([pocket.get(field, np.nan) for pocket in pockets], dtype=float)
+                stats[field + '_mean'] = round(float(np.mean(values)), 3)
+                stats[field + '_std'] = round(float(np.std(values)), 3)
+            stats['center'] = [round(float(value), 3) for value in center]
+            stats['center_rmsf'] = round(float(np.sqrt(((centers - center) ** 2).sum(axis=1).mean())), 3)
+
+            counts = {}
+            for residue_set in residue_sets:
+                for residue in residue_set:
+                    counts[residue] = counts.get(residue, 0) + 1
+            consensus = [residue for residue, n in counts.items() if n >= CONSENSUS_FRACTION * len(frames)]
+            stats['consensus_residues'] = ','.join(sorted(consensus, key=residue_order.get) if residue_order
+                                                   else sorted(consensus))
+            tracks.append(stats)
+        tracks.sort(key=lambda stats: (-stats['n_frames'], -np.nan_to_num(stats['score_mean'])))
+        return tracks
+
+
+def run_trajectory(pipeline, trajectory_file, output_dir=None, topology_file=None, stride=1, max_frames=None,
+                   reuse_rmsd=REUSE_RMSD, tracker=None):
+    """
+    Detects pockets in every frame of a trajectory and tracks them across frames.
+
+    Args:
+    pipeline (Pipeline.Pipeline): Stage settings (accessibility, surface, engine, scoring, threads, profile);
+        its model option is ignored, every model is a frame.
+    trajectory_file (str): Multi-model PDB or mmCIF file, or XYZ file (see read_frames).
+    output_dir (str): Folder for frames.tsv, tracks.tsv and tracks.json; nothing is written when None.
+    topology_file (str): File listing the atoms of every frame (required for XYZ).
+    stride (int): Analyze every stride-th frame.
+    max_frames (int): Stop after this many analyzed frames (default: all).
+    reuse_rmsd (float): Largest RMSD in Å for reusing the surface of an earlier frame; 0 disables reuse.
+    tracker (PocketTracker): Tracker to use (default: one with the default settings).
+
+    Returns:
+    result (dict): 'tracks' (PocketTracker.summary), 'frames' (ranked pockets per analyzed frame,
+        each with its track_id), counts and throughput, the paths of written files, and
+        with profiling the Profiler summary under 'profile'.
+    """
+    tracker = tracker or PocketTracker()
+    profiler = Profiler.Profiler(os.path.basename(trajectory_file)) if pipeline.profile else None
+    start = time.perf_counter()
+    frames, reference, first_coords, n_reused = [], None, None, 0
+
+    with profiler.activate() if profiler else contextlib.nullcontext():
+        with Profiler.section('parse'):
+            atoms, residues, coordinates = read_frames(trajectory_file, topology_file, pipeline.altloc, pipeline.hetatm)
+            Profiler.count(atoms=len(atoms), residues=len(residues))
+
+        for frame, coords in coordinates:
+            if frame % max(1, stride):
+                continue
+            if max_frames is not None and len(frames) >= max_frames:
+                break
+
+            with Profiler.section('frame', frame=frame):
+                atoms['coord'] = coords
+                if first_coords is None:
+                    first_coords = coords
+                rotation, translation, _ = superpose(first_coords, coords)
+                reused = (reference is not None and reuse_rmsd > 0
+                          and superposed_rmsd(reference['coords'], coords) <= reuse_rmsd)
+                if reused:
+                    # Same surface atoms and triangles, moved with their atoms
+                    with Profiler.section('surface'):
+                        surface_points = coords[reference['atom_index']]
+                        surface_properties = SurfAnal.surface_point_properties(
+                            surface_points, reference['facets'], reference['atom_index'], coords,
+                            workers=pipeline.threads)
+                    n_reused += 1
+                else:
+                    accessibility = None
+                    if pipeline.needs_accessibility():
+                        with Profiler.section('accessibility'):
+                            accessibility, _ = pipeline.accessibility(atoms)
+                    with Profiler.section('surface'):
+                        surface_points, surface_properties, facets = pipeline.surface(atoms, accessibility)
+                    reference = None if surface_points is None else {
+                        'coords': coords, 'atom_index': surface_properties['atom_index'], 'facets': facets}
+
+                with Profiler.section('pockets'):
+                    pockets = pipeline.pockets(surface_points, surface_properties, atoms)
+                with Profiler.section('scoring'):
+                    scored = pipeline.score([dict(pocket) for pocket in pockets])
+                with Profiler.section('tracking'):
+                    tracker.update(frame, scored, rotation, translation)
+            frames.append({'frame': frame, 'surface_reused': bool(reused), 'pockets': scored})
+            print(f"Frame {frame}: {len(scored)} pockets" + (" (surface reused)" if reused else ""))
+
+        with Profiler.section('tracking_summary'):
+            residue_order = {key: i for i, key in enumerate(PDBparser.residue_keys(atoms))}
+            tracks = tracker.summary(residue_order)
+
+    elapsed = time.perf_counter() - start
+    result = {
+        'trajectory': trajectory_file,
+        'n_atoms': len(atoms),
+        'n_frames': len(frames),
+        'n_surface_reused': n_reused,
+        'seconds': round(elapsed, 3),
+        'frames_per_second': round(len(frames) / elapsed, 3) if elapsed > 0 else None,
+        'tracks': tracks,
+        'frames': frames,
+        'files': {},
+    }
+    print(f"Analyzed {len(frames)} frames ({n_reused} with a reused surface) in {elapsed:.2f} s "
+          f"({result['frames_per_second']} frames/s); {len(tracks)} pocket tracks.")
+
+    if profiler is not None:
+        result['profile'] = profiler.summary()
+    if output_dir is not None:
+        result['files'] = write_trajectory_outputs(result, output_dir)
+        if profiler is not None:
+            result['files']['profile'] = os.path.join(output_dir, "profile.json")
+            profiler.save_json(result['files']['profile'])
+            if pipeline.trace:
+                result['files']['trace'] = os.path.join(output_dir, "trace.json")
+                profiler.save_trace(result['files']['trace'])
+    return result
+
+
+def write_trajectory_outputs(result, output_dir):
+    """
+    Writes frames.tsv, tracks.tsv and tracks.json.
+
+    Args:
+    result (dict): Output of run_trajectory().
+    output_dir (str): Folder for the outputs.
+
+    Returns:
+    files (dict): Paths of the written files keyed by output name.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = {
+        'frames_tsv': os.path.join(output_dir, "frames.tsv"),
+        'tracks_tsv': os.path.join(output_dir, "tracks.tsv"),
+        'tracks_json': os.path.join(output_dir, "tracks.json"),
+    }
+
+    with open(files['frames_tsv'], 'w') as f:
+        f.write("frame\ttrack_id\trank\tpocket_id\tscore\tvolume\tdepth\t"
+                "center_x\tcenter_y\tcenter_z\tlining_residues\n")
+        for record in result['frames']:
+            for rank, pocket in enumerate(record['pockets'], 1):
+                x, y, z = pocket['center']
+                f.write(f"{record['frame']}\t{pocket['track_id']}\t{rank}\t{pocket['pocket_id']}\t{pocket['score']}\t"
+                        f"{pocket['volume']:.1f}\t{pocket['depth']:.3f}\t{x:.3f}\t{y:.3f}\t{z:.3f}\t"
+                        f"{pocket.get('lining_residues', '')}\n")
+
+    with open(files['tracks_tsv'], 'w') as f:
+        f.write("track_id\tn_frames\tpersistence\tfirst_frame\tlast_frame\tmean_rank\tscore_mean\tvolume_mean\t"
+                "volume_std\tcenter_rmsf\tcenter_x\tcenter_y\tcenter_z\tconsensus_residues\n")
+        for track in result['tracks']:
+            x, y, z = track['center']
+            f.write(f"{track['track_id']}\t{track['n_frames']}\t{track['persistence']}\t{track['first_frame']}\t"
+                    f"{track['last_frame']}\t{track['mean_rank']}\t{track['score_mean']}\t{track['volume_mean']}\t"
+                    f"{track['volume_std']}\t{track['center_rmsf']}\t{x}\t{y}\t{z}\t{track['consensus_residues']}\n")
+
+    with open(files['tracks_json'], 'w') as f:
+        json.dump({key: value for key, value in result.items() if key not in ('frames', 'files', 'profile')},
+                  f, indent=4)
+    print(f"Pocket tracks written to {files['tracks_json']}")
+    return files
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage: python Trajectory.py <TRAJECTORY> <OUTPUT_DIR> [TOPOLOGY]")
+        sys.exit(1)
+
+    from Pipeline import Pipeline
+    run_trajectory(Pipeline(), sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,199 @@
+"""
+Triage.py
+
+Residue-level triage pass run before full-resolution pocket detection.
+
+Every residue is reduced to one sphere at the centroid of its atoms, with a radius that
+covers its atoms (their RMS distance to the centroid plus an atom radius). A coarse
+LIGSITE scan (see PockGrid.py) over these spheres finds buried solvent voxels; their
+connected components are the candidate concave regions. A structure of N atoms becomes
+about N / 8 spheres on a grid with 8 times fewer voxels than the full-resolution grid,
+so the pass costs a few milliseconds.
+
+The full-resolution stages then only look at the atoms within margin Å of a candidate
+region (the core atoms): only they and their neighbors within two alpha radii are
+triangulated, only facets of core atoms become surface points (see
+SurfAnal.compute_surface's surface_atoms), and the grid engine maps
+only the atoms up to halo Å further out (the context atoms) and reports the pockets
+reaching within margin Å. The SASA of core atoms is computed against the context atoms,
+which covers their whole neighborhood. A structure without candidate regions skips the
+surface and pocket stages.
+
+This is a recall/speed trade-off: the coarse scan misses concave regions that residue
+spheres do not resolve, and the DBSCAN engine's deep-half cut (see
+PockDet.select_pocket_points) is taken over the triaged surface only. Larger margins
+recover more of the full-resolution pockets for less speedup (see benchmarks/benchmark.py
+--triage).
+
+Functions:
+- residue_spheres(atoms): Centroid and covering radius of every residue.
+- candidate_regions(atoms, ...): Buried voxels of the coarse scan, grouped into regions.
+- triage_atoms(atoms, ...): Core and context atoms around the candidate regions.
+- triaged_accessibility(atoms, core, context, ...): Accessibility of the core atoms only.
+- pockets_near(pockets, points, point_pockets, regions, margin): Pockets reaching within margin
+  of a candidate region.
+"""
+
+import numpy as np
+
+import Parallel
+import PDBparser
+import PockGrid
+import Profiler
+
+# Voxel edge length (Å) of the coarse scan
+TRIAGE_SPACING = 2.0
+
+# Minimum PSP events (out of 7) of a coarse buried voxel; below the full-resolution default,
+# since residue spheres leave gaps that atoms would close
+TRIAGE_MIN_PSP = 4
+
+# Minimum number of coarse voxels of a candidate region
+TRIAGE_MIN_VOXELS = 2
+
+# Distance (Å) from a candidate region within which atoms are analyzed at full resolution
+TRIAGE_MARGIN = 10.0
+
+# Extra distance (Å) of context atoms around the core atoms; covers the SASA probe reach
+# and keeps the grid engine's scans around core atoms intact
+TRIAGE_HALO = 8.0
+
+
+def residue_spheres(atoms):
+    """
+    Reduces every residue to a sphere covering its atoms.
+
+    Args:
+    atoms (np.array): Structured array with PDBparser.ATOM_DTYPE.
+
+    Returns:
+    centers (np.array): Centroid of every residue with shape (R, 3).
+    radii (np.array): RMS distance of the residue's atoms to the centroid plus PDBparser.DEFAULT_RADIUS.
+    """
+    _, _, residue_of_atom = PDBparser.residue_index(atoms)
+    coords = atoms['coord']
+    counts = np.bincount(residue_of_atom)
+    centers = np.stack([np.bincount(residue_of_atom, weights=coords[:, axis]) / counts for axis in range(3)], axis=1)
+    spread = np.bincount(residue_of_atom, weights=((coords - centers[residue_of_atom]) ** 2).sum(axis=1)) / counts
+    return centers, np.sqrt(spread) + PDBparser.DEFAULT_RADIUS
+
+
+def candidate_regions(atoms, spacing=TRIAGE_SPACING, min_psp=TRIAGE_MIN_PSP, min_voxels=TRIAGE_MIN_VOXELS):
+    """
+    Finds candidate concave regions with a coarse LIGSITE scan over the residue spheres.
+
+    Args:
+    atoms (np.array): Structured array with PDBparser.ATOM_DTYPE.
+    spacing (float): Voxel edge length in Å.
+    min_psp (int): Minimum PSP events (out of 7) of a buried voxel.
+    min_voxels (int): Minimum number of voxels of a region.
+
+    Returns:
+    points (np.array): Centers of the buried voxels of all regions with shape (V, 3).
+    regions (np.array): Region (1..n) of every point.
+    """
+    from scipy import ndimage
+
+    centers, radii = residue_spheres(atoms)
+    buried, _, origin = PockGrid.buried_voxels(centers, radii, spacing, min_psp)
+    labels, n_regions = ndimage.label(buried)
+    sizes = np.bincount(labels.ravel(), minlength=n_regions + 1)
+    sizes[0] = 0
+    kept = sizes[labels] >= max(min_voxels, 1)
+    return origin + np.argwhere(kept) * spacing, labels[kept]
+
+
+def triage_atoms(atoms, margin=TRIAGE_MARGIN, halo=TRIAGE_HALO, workers=1):
+    """
+    Selects the atoms to analyze at full resolution.
+
+    Args:
+    atoms (np.array): Structured array with PDBparser.ATOM_DTYPE.
+    margin (float): Distance in Å from a candidate region of the core atoms.
+    halo (float): Extra distance in Å of the context atoms.
+    workers (int): Threads for the KD-tree query.
+
+    Returns:
+    core (np.array): Boolean mask of the atoms within margin of a candidate region.
+    context (np.array): Boolean mask of the atoms within margin + halo (includes the core).
+    points (np.array): Points of the candidate regions (see candidate_regions).
+    """
+    from scipy.spatial import cKDTree
+
+    with Profiler.section('coarse_scan'):
+        points, regions = candidate_regions(atoms)
+    if len(points) == 0:
+        core = np.zeros(len(atoms), dtype=bool)
+        print(f"Triage: no candidate regions; 0 of {len(atoms)} atoms kept.")
+        return core, core.copy(), points
+
+    distances, _ = cKDTree(points).query(atoms['coord'], distance_upper_bound=margin + halo,
+                                         workers=Parallel.kdtree_workers(workers))
+    core, context = distances <= margin, np.isfinite(distances)
+    print(f"Triage: {len(np.unique(regions))} candidate regions; {int(core.sum())} of {len(atoms)} atoms kept "
+          f"({int(context.sum())} with context).")
+    Profiler.count(triage_regions=len(np.unique(regions)), triage_atoms=int(core.sum()))
+    return core, context, points
+
+
+def triaged_accessibility(atoms, core, context, method='neighbor', n_points=100, workers=1):
+    """
+    Computes the accessibility of the core atoms; all other atoms get 0 (they are kept off
+    the surface by the core mask, see SurfAnal.compute_surface).
+
+    The 'sasa' method only measures the core atoms over the context atoms, which covers the
+    probe reach, so their values are those of a full run. Neighbor counts are cheap and are
+    normalized over the whole structure, so they are taken over all atoms.
+
+    Args:
+    atoms (np.array): Structured array with PDBparser.ATOM_DTYPE.
+    core (np.array): Boolean mask of the core atoms (see triage_atoms).
+    context (np.array): Boolean mask of the context atoms.
+    method (str): 'neighbor' or 'sasa' (see PDBparser.compute_accessibility).
+    n_points (int): Sphere test points per atom for the 'sasa' method.
+    workers (int): Threads for the neighbor and SASA kernels.
+
+    Returns:
+    accessibility (np.array): Accessibility per atom.
+    residue_sasa (dict): For the 'sasa' method, the area of the core atoms of every residue; else None.
+    """
+    accessibility = np.zeros(len(atoms))
+    if not core.any():
+        return accessibility, None
+
+    if method == 'sasa':
+        subset, subset_core = atoms[context], core[context]
+        radii = PDBparser.atom_radii(subset)
+        sasa = PDBparser.compute_sasa(subset['coord'], radii, n_points=n_points, workers=workers)
+        relative = PDBparser.relative_sasa(sasa, radii)
+        accessibility[core] = np.fromiter(relative.values(), dtype=float, count=len(sasa))[subset_core]
+        residue_sasa = PDBparser.compute_residue_sasa(sasa[subset_core], PDBparser.residue_keys(subset)[subset_core])
+        print(f"Computed relative SASA for {int(core.sum())} triaged atoms.")
+        return accessibility, residue_sasa
+
+    values = PDBparser.compute_accessibility(atoms, method=method, workers=workers)
+    accessibility[core] = np.fromiter(values.values(), dtype=float, count=len(atoms))[core]
+    return accessibility, None
+
+
+def pockets_near(pockets, points, point_pockets, regions, margin=TRIAGE_MARGIN):
+    """
+    Keeps the pockets with a point within margin of a candidate region.
+
+    Args:
+    pockets (list): Pocket dicts with 'pocket_id'.
+    points (np.array): Points of all pockets with shape (P, 3).
+    point_pockets (np.array): pocket_id of every point.
+    regions (np.array): Points of the candidate regions (see candidate_regions).
+    margin (float): Largest distance in Å from a pocket point to a candidate point.
+
+    Returns:
+    pockets (list): The pockets near a candidate region, in their original order.
+    """
+    from scipy.spatial import cKDTree
+
+    if not pockets or len(regions) == 0:
+        return []
+    distances, _ = cKDTree(regions).query(np.asarray(points, dtype=float).reshape(-1, 3), distance_upper_bound=margin)
+    near = set(np.asarray(point_pockets)[np.isfinite(distances)].tolist())
+    return [pocket for pocket in pockets if pocket['pocket_id'] in near]
@@ -30,22 +30,30 @@ RANK_COLORS = [
     "gray50"     # rank 10+
 ]
 
+def build_pymol_script(pockets):
+    """Returns the PyMOL script showing the ranked pockets as a string."""
+    lines = [
+        "# PyMOL visualization script for predicted binding pockets",
+        "bg_color white",
+        "hide everything",
+        "show cartoon",
+        "color gray80",
+    ]
+
+    for i, pocket in enumerate(pockets):
+        x, y, z = pocket['center']
+        color = RANK_COLORS[i] if i < len(RANK_COLORS) else "gray50"
+        lines.append(f"pseudoatom pocket_{i}, pos=[{x:.3f}, {y:.3f}, {z:.3f}], color={color}")
+        lines.append(f"show spheres, pocket_{i}")
+        lines.append(f"set sphere_scale, 1.0, pocket_{i}")
+
+    lines.append("zoom")
+    return "\n".join(lines) + "\n"
+
+
 def generate_pymol_script(pockets, output_script):
     with open(output_script, 'w') as f:
-        f.write("# PyMOL visualization script for predicted binding pockets\n")
-        f.write("bg_color white\n")
-        f.write("hide everything\n")
-        f.write("show cartoon\n")
-        f.write("color gray80\n")
-
-        for i, pocket in enumerate(pockets):
-            x, y, z = pocket['center']
-            color = RANK_COLORS[i] if i < len(RANK_COLORS) else "gray50"
-            f.write(f"pseudoatom pocket_{i}, pos=[{x:.3f}, {y:.3f}, {z:.3f}], color={color}\n")
-            f.write(f"show spheres, pocket_{i}\n")
-            f.write(f"set sphere_scale, 1.0, pocket_{i}\n")
-
-        f.write("zoom\n")
+        f.write(build_pymol_script(pockets))
 
     print(f"[✔] PyMOL script saved to: {output_script}")
 